@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""Benchmarks of the actionHandler operations
+
+Generates a synthetic Source tree, backs it up to a local file://
+Target and times the public operations of the handler:
+
+    backup_full, backup_inc      make_backup before and after churn
+    get_chains                   collection-status of the Target
+    get_files_cold, get_files    listing from the signatures, then the index
+    get_diff, get_diff_deep      metadata and --compare-data comparison
+    recover_file, recover_snapshot
+    tree, tree_highlight         PathTable of the TreeWorker (needs PyQt6)
+
+The results are written as JSON. They are checked against absolute
+limits in seconds (thresholds.yaml) and, if given, against an earlier
+result file with a tolerance factor. The exit code is 1 if a limit is
+exceeded.
+
+    python benchmarks/bench.py --files 2000 --out results.json
+    python benchmarks/bench.py --baseline results.json
+
+Kyrian and duplicity have to be installed, everything else is created
+below a temporary work directory.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import yaml
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_parser():
+    """Create the argument parser
+
+    :return: The parser
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(
+                description="Time the actionHandler operations on a "
+                            "synthetic file:// Target")
+    parser.add_argument("--files", type=int, default=2000,
+                        help="Files in the Source (default: %(default)s)")
+    parser.add_argument("--depth", type=int, default=4,
+                        help="Maximum directory depth (default: %(default)s)")
+    parser.add_argument("--fanout", type=int, default=8,
+                        help="Subdirectories per directory "
+                             "(default: %(default)s)")
+    parser.add_argument("--size-median", type=int, default=4096,
+                        help="Median file size in bytes, sizes are log-normal "
+                             "distributed (default: %(default)s)")
+    parser.add_argument("--size-sigma", type=float, default=1.5,
+                        help="Sigma of the log-normal sizes "
+                             "(default: %(default)s)")
+    parser.add_argument("--size-max", type=int, default=16 * 1024 * 1024,
+                        help="Largest file in bytes (default: %(default)s)")
+    parser.add_argument("--churn", type=float, default=0.1,
+                        help="Fraction of files modified, deleted or added "
+                             "before the incremental backup "
+                             "(default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the generator (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs of the repeatable operations, the median "
+                             "is reported (default: %(default)s)")
+    parser.add_argument("--deep", action="store_true",
+                        help="Also time get_diff with --compare-data")
+    parser.add_argument("--work-dir",
+                        help="Keep Source, Target and config here instead "
+                             "of a temporary directory")
+    parser.add_argument("--out",
+                        help="Write the results to this JSON file")
+    parser.add_argument("--thresholds",
+                        default=os.path.join(BENCH_DIR, "thresholds.yaml"),
+                        help="Limits in seconds per operation "
+                             "(default: %(default)s)")
+    parser.add_argument("--baseline",
+                        help="Earlier results to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="Allowed slowdown against the baseline "
+                             "(default: %(default)s)")
+    return parser
+
+
+def write_file(name, rng, size, mtime) -> None:
+    """Write a file of half random, half compressible contents
+    """
+    data = rng.randbytes(size // 2) + bytes(size - size // 2)
+    with open(name, "wb") as f:
+        f.write(data)
+    os.utime(name, (mtime, mtime))
+
+
+def file_size(rng, args) -> int:
+    """Log-normal distributed file size
+    """
+    size = rng.lognormvariate(math.log(args.size_median), args.size_sigma)
+    return min(int(size), args.size_max)
+
+
+def random_dir(rng, args) -> str:
+    """Relative directory of a new file
+    """
+    depth = rng.randint(0, args.depth)
+    return os.path.join("", *("d%02d" % rng.randrange(args.fanout)
+                              for i in range(depth)))
+
+
+def make_tree(root, rng, args, mtime) -> list:
+    """Create the Source tree
+
+    :return: Relative paths of the files
+    :rtype: list
+    """
+    paths = []
+    for i in range(args.files):
+        rel_path = os.path.join(random_dir(rng, args), "f%06d.bin" % i)
+        os.makedirs(os.path.join(root, os.path.dirname(rel_path)),
+                    exist_ok=True)
+        write_file(os.path.join(root, rel_path),
+                   rng, file_size(rng, args), mtime)
+        paths.append(rel_path)
+    return paths
+
+
+def churn_tree(root, paths, rng, args, mtime) -> list:
+    """Modify, delete and add files between the backups
+
+    Of the churned files 60% are modified, 20% deleted and as many
+    as 20% are added.
+
+    :return: Relative paths of the files afterwards
+    :rtype: list
+    """
+    count = int(len(paths) * args.churn)
+    churned = rng.sample(paths, count)
+
+    modified = churned[:count * 3 // 5]
+    deleted = set(churned[count * 3 // 5:])
+
+    for rel_path in modified:
+        write_file(os.path.join(root, rel_path),
+                   rng, file_size(rng, args), mtime)
+    for rel_path in deleted:
+        os.unlink(os.path.join(root, rel_path))
+
+    paths = [i for i in paths if i not in deleted]
+    for i in range(len(deleted)):
+        rel_path = os.path.join(random_dir(rng, args),
+                                "n%06d.bin" % (args.files + i))
+        os.makedirs(os.path.join(root, os.path.dirname(rel_path)),
+                    exist_ok=True)
+        write_file(os.path.join(root, rel_path),
+                   rng, file_size(rng, args), mtime)
+        paths.append(rel_path)
+    return paths
+
+
+class Timer():
+    """Collects the timings of the operations
+    """
+
+    def __init__(self) -> None:
+        self.results = {}
+
+    def run(self, name, func, repeat=1):
+        """Time a function
+
+        :param name: Name of the operation
+        :type name: str
+        :param func: The operation
+        :type func: callable
+        :param repeat: Number of runs, defaults to 1
+        :type repeat: int, optional
+        :return: Return value of the last run
+        """
+        runs = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            runs.append(time.perf_counter() - start)
+
+        self.results[name] = {
+            "seconds": statistics.median(runs),
+            "runs": runs,
+            }
+        print("%-20s %8.3fs" % (name, self.results[name]["seconds"]),
+              file=sys.stderr, flush=True)
+        return result
+
+
+def bench_tree(timer, handler, time, diff_d, repeat) -> None:
+    """Time the path table construction of the TreeWorker
+
+    The listing is read from the index, the differences are passed in.
+    """
+    try:
+        from PyQt6 import QtCore
+        from kyrian.workers import TreeWorker
+    except ImportError:
+        print("PyQt6 not available, skipping tree", file=sys.stderr)
+        return
+
+    # The workers emit signals, keep an application alive meanwhile
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+    def build(highlight):
+        worker = TreeWorker(handler)
+        worker.time = time
+        worker.files_l = None
+        worker.diff_l = diff_d
+        worker.highlight_diffs = highlight
+        worker.run()
+        return worker.table
+
+    timer.run("tree", lambda: build(False), repeat)
+    timer.run("tree_highlight", lambda: build(True), repeat)
+
+
+def run(args, work_dir) -> dict:
+    """Create the Target and time all operations
+
+    :return: Timings by operation
+    :rtype: dict
+    """
+    source = os.path.join(work_dir, "source")
+    target_dir = os.path.join(work_dir, "target")
+    cfg_dir = os.path.join(work_dir, "config")
+    restore_dir = os.path.join(work_dir, "restore")
+    for i in [source, target_dir, cfg_dir, restore_dir]:
+        os.makedirs(i, exist_ok=True)
+
+    # Keep the archive dir of duplicity out of ~/.cache,
+    # the job processes inherit the environment
+    os.environ["XDG_CACHE_HOME"] = os.path.join(work_dir, "cache")
+
+    with open(os.path.join(cfg_dir, "config.yaml"), "w") as f:
+        yaml.dump({
+            "Profile": "Bench",
+            "Profiles": {
+                "Bench": {
+                    "Source": source,
+                    "Target": "file://" + target_dir,
+                    "encrypt": False,
+                    },
+                },
+            }, f, default_flow_style=False)
+
+    from duplicity import log
+    from kyrian.actionHandler import actionHandler
+
+    log.setup()
+    handler = actionHandler(cfg_dir)
+
+    rng = random.Random(args.seed)
+    now = int(time.time())
+    timer = Timer()
+
+    paths = make_tree(source, rng, args, now - 7200)
+    timer.run("backup_full", handler.make_backup)
+
+    paths = churn_tree(source, paths, rng, args, now - 3600)
+    timer.run("backup_inc", handler.make_backup)
+
+    chain_d = timer.run("get_chains",
+                        lambda: handler.get_chains(refresh=True),
+                        args.repeat)
+    last = max(chain_d)
+
+    timer.run("get_files_cold", lambda: handler.get_files(time=last))
+    timer.run("get_files", lambda: handler.get_files(time=last), args.repeat)
+
+    diff_d = timer.run("get_diff",
+                       lambda: handler.get_diff(time=min(chain_d)),
+                       args.repeat)
+    if args.deep:
+        timer.run("get_diff_deep",
+                  lambda: handler.get_diff(time=min(chain_d), deep=True))
+
+    rel_path = rng.choice(paths)
+    timer.run("recover_file",
+              lambda: handler.recover_files(
+                            os.path.join(restore_dir, "file"),
+                            file=rel_path,
+                            time=last,
+                            force=True),
+              args.repeat)
+    timer.run("recover_snapshot",
+              lambda: handler.recover_files(
+                            os.path.join(restore_dir, "snapshot"),
+                            time=last,
+                            force=True))
+
+    bench_tree(timer, handler, last, diff_d, args.repeat)
+
+    return timer.results
+
+
+def check(results, thresholds, baseline, tolerance) -> list:
+    """Compare the timings with the limits
+
+    :param results: Timings by operation
+    :type results: dict
+    :param thresholds: Limit in seconds by operation
+    :type thresholds: dict
+    :param baseline: Earlier timings by operation or None
+    :type baseline: dict
+    :param tolerance: Allowed factor against the baseline
+    :type tolerance: float
+    :return: Descriptions of the exceeded limits
+    :rtype: list
+    """
+    failures = []
+    for name, result in results.items():
+        seconds = result["seconds"]
+
+        limit = thresholds.get(name)
+        if limit is not None and seconds > limit:
+            failures.append("%s: %.3fs > %.3fs" % (name, seconds, limit))
+
+        if baseline and name in baseline:
+            before = baseline[name]["seconds"]
+            if seconds > before * tolerance:
+                failures.append("%s: %.3fs > %.3fs * %.2f of the baseline"
+                                % (name, seconds, before, tolerance))
+    return failures
+
+
+def main(argv=None) -> int:
+    args = make_parser().parse_args(argv)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="kyrian-bench-")
+    try:
+        results = run(args, work_dir)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    thresholds = {}
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds) as f:
+            thresholds = yaml.safe_load(f) or {}
+
+        # Limits are given for the default parameters, scale them
+        # with the number of files
+        scale = args.files / make_parser().get_default("files")
+        thresholds = {name: limit * max(1, scale)
+                      for name, limit in thresholds.items()}
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    failures = check(results, thresholds, baseline, args.tolerance)
+
+    import duplicity
+
+    report = {
+        "params": {k: v for k, v in vars(args).items()
+                   if k not in ("out", "baseline", "thresholds", "work_dir")},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "duplicity": duplicity.__version__,
+            },
+        "results": results,
+        "failures": failures,
+        }
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    for failure in failures:
+        print("REGRESSION " + failure, file=sys.stderr)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,39 +6,98 @@ from PyQt6 import QtCore, QtGui, QtWidgets
 from PyQt6.QtCore import Qt
 from PyQt6 import uic
 
-from duplicity import config
+from duplicity import dup_time
 
 from kyrian.settings_window import SettingsWindow
+from kyrian.diff_window import SnapshotDiffWindow
+from kyrian.search_window import SearchWindow
+from kyrian.versions_window import VersionsWindow
 from kyrian.actionHandler import actionHandler
+from kyrian.tree_model import SnapshotTreeModel
+from kyrian.snapshot_cache import SnapshotCache
+from kyrian.volume_cache import parse_size
+from kyrian.progress import format_record, format_plan
+from kyrian.scheduler import JobScheduler, INTERACTIVE
 from kyrian.workers import (BackupWorker,
+                           ChainsWorker,
                            TreeWorker,
-                           RecoveryWorker)
+                           RecoveryWorker,
+                           PlanWorker,
+                           SnapshotDiffWorker)
 
 
 class MainWindow(QtWidgets.QMainWindow):
     """MainWindow class
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, cfg_dir="~/.config/kyrian/", *args, **kwargs):
         super().__init__(*args, **kwargs)
         uic.loadUi(os.path.join(os.path.dirname(__file__), "ui/mw.ui"), self)
         self.setWindowTitle("Kyrian")
 
         # New actionHandler
-        self.a = actionHandler(os.path.expanduser("~/.config/kyrian/"))
+        self.a = actionHandler(os.path.expanduser(cfg_dir))
+
+        # All workers run through the scheduler
+        self.scheduler = JobScheduler(self)
+        self.scheduler.jobStarted.connect(self.show_jobs)
+        self.scheduler.jobFinished.connect(self.show_jobs)
+        self.scheduler.jobCancelled.connect(self.show_jobs)
 
         # Setup other windows
         self.settingsWindow = SettingsWindow(self.a)
+        self.diffWindow = SnapshotDiffWindow()
+        self.searchWindow = SearchWindow(self.a, self.scheduler)
+        self.versionsWindow = VersionsWindow(self.a, self.scheduler)
+        self.versionsWindow.restoreRequested.connect(self.recover_path)
 
         # Config for MainWindow
         self.config = {}
         self.config["highlight_diffs"] = False
+        self.config["deep_compare"] = False
         self.config["build_tree"] = False
 
+        # Trees of visited snapshots, the budget is set with the
+        # option snapshot-cache-size of config.yaml
+        self.snapshot_cache = SnapshotCache(
+                parse_size(self.a.config.get("snapshot-cache-size", "512M")))
+
         # Setup workers
         self.backup_worker = BackupWorker(self.a)
+        self.chains_worker = ChainsWorker(self.a)
         self.tree_worker = TreeWorker(self.a)
         self.recovery_worker = RecoveryWorker(self.a)
+        self.plan_worker = PlanWorker(self.a)
+        self.diff_worker = SnapshotDiffWorker(self.a)
+
+        self.backup_worker.backupReady.connect(self.post_backup)
+        self.chains_worker.chainsReady.connect(self.post_chains)
+        self.tree_worker.treeReady.connect(self.post_tree)
+        self.recovery_worker.recoveryReady.connect(self.post_file_recovery)
+        self.plan_worker.planReady.connect(self.post_plan)
+        self.diff_worker.diffReady.connect(self.post_snapshot_diff)
+
+        self.backup_worker.progress.connect(self.show_progress)
+        self.recovery_worker.progress.connect(self.show_progress)
+
+        for worker in (self.backup_worker, self.chains_worker,
+                       self.tree_worker, self.recovery_worker,
+                       self.plan_worker, self.diff_worker):
+            worker.failed.connect(self.show_failure)
+
+        # Set once the window waits for cancelled jobs to close
+        self.closing = False
+
+        # Setup tree
+        self.treeView.setProperty("class", "treeclass")
+        self.set_tree_table(None)
+
+        # Age of the snapshot list while the Target is scanned
+        self.chainsLabel = QtWidgets.QLabel(self)
+        self.statusbar.addPermanentWidget(self.chainsLabel)
+
+        # Select the newest snapshot once the scan is done
+        self.select_newest = False
 
         self.make_backup_list()
 
@@ -50,15 +109,21 @@ class MainWindow(QtWidgets.QMainWindow):
         self.recovAction = QtGui.QAction("Recover File")
         self.treeMenu.addAction(self.recovAction)
         self.recovAction.triggered.connect(self.recoverSelectedFiles)
+        self.versionsAction = QtGui.QAction("Show versions")
+        self.treeMenu.addAction(self.versionsAction)
+        self.versionsAction.triggered.connect(self.showVersions)
 
-        self.treeWidget.customContextMenuRequested.connect(
+        self.treeView.customContextMenuRequested.connect(
                             self.contextMenuTree)
 
-        # Setup tree
-        self.treeWidget.setProperty("class", "treeclass")
-        self.treeWidget.setColumnCount(2)
-        self.treeWidget.setHeaderLabels(["Name", "Date"])
-        self.treeWidget.setColumnWidth(0, 400)
+        # Setup listMenu
+        self.listMenu = QtWidgets.QMenu(self)
+        self.compareAction = QtGui.QAction("Compare with selected Snapshot")
+        self.listMenu.addAction(self.compareAction)
+        self.compareAction.triggered.connect(self.compare_snapshots)
+
+        self.listWidget.customContextMenuRequested.connect(
+                            self.contextMenuList)
 
         # Connect signals
         self.actionSettings.setIcon(QtGui.QIcon.fromTheme("preferences"))
@@ -66,23 +131,150 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.actionBackup.triggered.connect(self.start_backup)
         self.actionRestore.triggered.connect(self.restore_snap)
+        self.actionRefresh.triggered.connect(self.refresh_backup_list)
+        self.actionSearch.triggered.connect(self.searchWindow.show)
 
         self.settingsWindow.applied.connect(self.make_backup_list)
 
         self.actionHighlight_Differences.toggled.connect(self.set_hl)
+        self.actionCompare_Contents.toggled.connect(self.set_deep_compare)
         self.actionData_Tree.toggled.connect(self.set_tree)
 
         self.resize(self.screen().availableSize() * 0.7)
 
-    def make_backup_list(self) -> None:
-        """Add all available backup chains to list
+    def make_backup_list(self, refresh: bool = False) -> None:
+        """Update the list with all available backup chains
+
+        The chains of the last scan are shown right away. If they are
+        from an earlier session they are marked as stale and the Target
+        is scanned in the background.
+
+        :param refresh: Scan the Target again, defaults to False
+        :type refresh: bool, optional
         """
-        chain_d = self.a.get_chains()
+        known = self.a.get_known_chains()
+        if known is None:
+            self.show_backup_list({}, stale=True)
+        else:
+            self.show_backup_list(known["chains"],
+                                  stale=known["stale"],
+                                  scanned=known["scanned"])
+            if not known["stale"] and not refresh:
+                return
+
+        # A pending scan reads the current Target as well
+        if self.scheduler.is_pending(self.chains_worker):
+            return
+
+        self.scheduler.submit(self.chains_worker, "Scanning Target",
+                              priority=INTERACTIVE,
+                              target=self.a.get_target())
 
+    def post_chains(self) -> None:
+        """Show the chains of the finished scan
+        """
+        if self.chains_worker.profile != self.a.current_profile:
+            return
+
+        if self.chains_worker.result is None:
+            known = self.a.get_known_chains()
+            if known is None:
+                self.chainsLabel.setText("Target not reachable")
+            else:
+                self.chainsLabel.setText(
+                        "Target not reachable, snapshots of "
+                        + dup_time.timetopretty(known["scanned"]))
+            return
+
+        self.show_backup_list(self.chains_worker.result)
+
+        if self.select_newest or self.listWidget.currentRow() < 0:
+            self.select_newest = False
+            self.listWidget.setCurrentRow(0)
+
+    def show_backup_list(self, chain_d: dict, stale: bool = False,
+                         scanned: int = None) -> None:
+        """Update the list in place
+
+        Snapshots that are already listed keep their items,
+        the list stays sorted newest first.
+
+        :param chain_d: The chains
+        :type chain_d: dict
+        :param stale: The chains are from an earlier session,
+                      defaults to False
+        :type stale: bool, optional
+        :param scanned: Time of the scan, defaults to None
+        :type scanned: int, optional
+        """
+        if stale and scanned:
+            self.chainsLabel.setText("Snapshots of "
+                                     + dup_time.timetopretty(scanned)
+                                     + ", scanning Target...")
+        elif stale:
+            self.chainsLabel.setText("Scanning Target...")
+        else:
+            self.chainsLabel.setText("")
+
+        # Remove snapshots that no longer exist
+        listed = set()
+        for row in reversed(range(self.listWidget.count())):
+            time = self.listWidget.item(row).data(Qt.ItemDataRole.UserRole)
+            if time in chain_d:
+                listed.add(time)
+            else:
+                self.listWidget.takeItem(row)
+                self.snapshot_cache.discard(self.snapshot_key(time))
+
+        row = 0
         for i in reversed(sorted(chain_d)):
-            self.listWidget.addItem(" ".join([chain_d[i][1], chain_d[i][0]]))
-            last_item = self.listWidget.item(self.listWidget.count()-1)
-            last_item.setData(Qt.ItemDataRole.UserRole, i)
+            if i not in listed:
+                new_item = QtWidgets.QListWidgetItem(
+                                " ".join([chain_d[i][1], chain_d[i][0]])
+                                )
+                new_item.setData(Qt.ItemDataRole.UserRole, i)
+                self.listWidget.insertItem(row, new_item)
+
+            item = self.listWidget.item(row)
+            if stale:
+                item.setForeground(self.palette().brush(
+                                    QtGui.QPalette.ColorRole.PlaceholderText))
+                item.setToolTip("Known from an earlier scan")
+            else:
+                item.setData(Qt.ItemDataRole.ForegroundRole, None)
+                item.setToolTip("")
+            row += 1
+
+    def snapshot_key(self, time: int) -> tuple:
+        """Key of a snapshot in the snapshot cache
+
+        :param time: Timestamp of the backup
+        :type time: int
+        :rtype: tuple
+        """
+        return (self.a.current_profile, time)
+
+    def show_jobs(self, job=None) -> None:
+        """Show the running and queued jobs in the status bar
+        """
+        status = self.scheduler.status()
+        if status:
+            self.statusbar.showMessage(status)
+        else:
+            self.statusbar.clearMessage()
+
+    def show_failure(self, message: str) -> None:
+        """Show the error of a failed worker
+
+        :param message: The error message
+        :type message: str
+        """
+        QtWidgets.QMessageBox.warning(self, "Kyrian", message)
+
+    def refresh_backup_list(self) -> None:
+        """Scan the Target for backup chains again
+        """
+        self.make_backup_list(refresh=True)
 
     def open_settings(self) -> None:
         """Show the settings window
@@ -105,30 +297,33 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.disable_buttons(True)
 
-        if (self.backup_worker.isRunning()
-            or self.recovery_worker.isRunning()):
-
+        if self.scheduler.is_active(self.backup_worker):
             return
 
-        self.backup_worker.safe = False
+        self.scheduler.submit(self.backup_worker, "Backup",
+                              mode="write",
+                              target=self.a.get_target())
 
-        if not self.tree_worker.safe:
-            self.tree_worker.wait()
+    def show_progress(self, rec: dict) -> None:
+        """Show a progress record of a worker in the status bar
 
-        self.backup_worker.backupReady.connect(self.post_backup)
-        self.backup_worker.start()
+        :param rec: The record, see kyrian.progress
+        :type rec: dict
+        """
+        text = format_record(rec)
+        self.statusbar.showMessage(text.split("\n")[0])
+        self.statusbar.setToolTip(text)
 
     def post_backup(self) -> None:
         """Remake the chain list after backup and enable buttons
         """
-        self.backup_worker.backupReady.disconnect()
-        chain_d = self.a.get_chains()
-        key = sorted(chain_d.keys())[-1]
-            
-        self.listWidget.insertItem(0,
-                " ".join([chain_d[key][1], chain_d[key][0]])
-                )
-        self.listWidget.setCurrentRow(0)
+        # The list is updated once the Target is scanned if the chains
+        # are not known yet
+        self.select_newest = True
+        self.make_backup_list()
+        if not self.scheduler.is_active(self.chains_worker):
+            self.select_newest = False
+            self.listWidget.setCurrentRow(0)
         self.disable_buttons(False)
 
     def contextMenuTree(self, i) -> None:
@@ -137,39 +332,145 @@ class MainWindow(QtWidgets.QMainWindow):
         :param i: Coordinates in the reference frame of the tree
         :type i: QPoint
         """
-        self.treeMenu.exec(self.treeWidget.mapToGlobal(i))
+        self.treeMenu.exec(self.treeView.viewport().mapToGlobal(i))
 
-    def recoverSelectedFiles(self) -> None:
-        """Recover a selcted file or folder from the data-tree
+    def contextMenuList(self, i) -> None:
+        """Open context Menu on snapshot item
+
+        :param i: Coordinates in the reference frame of the list
+        :type i: QPoint
         """
+        item = self.listWidget.itemAt(i)
+        if item is None:
+            return
 
-        # Disable buttons to prevent two duplicity instances from running
-        self.disable_buttons(True)
+        self.compareAction.setData(item.data(Qt.ItemDataRole.UserRole))
+        self.compareAction.setEnabled(
+                            not item.isSelected()
+                            and not self.scheduler.is_active(self.diff_worker)
+                            )
+        self.listMenu.exec(self.listWidget.viewport().mapToGlobal(i))
+
+    def compare_snapshots(self) -> None:
+        """Compare the snapshot of the context menu with the selected one
+        """
+        if self.listWidget.selectedItems() == []:
+            return
 
-        # Abort if there is already a worker running
-        if (self.backup_worker.isRunning()
-            or self.recovery_worker.isRunning()):
+        time_a = self.compareAction.data()
+        time_b = self.listWidget.selectedItems()[0].data(
+                                                    Qt.ItemDataRole.UserRole)
 
+        def setup(worker):
+            worker.time_a = time_a
+            worker.time_b = time_b
+
+        self.scheduler.submit(self.diff_worker, "Compare snapshots",
+                              priority=INTERACTIVE,
+                              target=self.a.get_target(),
+                              setup=setup)
+
+    def post_snapshot_diff(self) -> None:
+        """Show the differences between the snapshots
+        """
+        if self.diff_worker.result is None:
             return
 
+        self.diffWindow.set_diff(min(self.diff_worker.time_a,
+                                     self.diff_worker.time_b),
+                                 max(self.diff_worker.time_a,
+                                     self.diff_worker.time_b),
+                                 self.diff_worker.result)
+        self.diffWindow.show()
+
+    def recoverSelectedFiles(self) -> None:
+        """Recover the selcted files and folders from the data-tree
+        """
+
         # Get the selected item from the tree
-        sel_list = self.treeWidget.selectedItems()
+        sel_list = self.treeView.selectionModel().selectedRows(0)
 
         if sel_list == []:
             return
 
-        # Signal that worker is working on the target dir
-        self.recovery_worker.safe = False
+        if len(sel_list) > 1:
+            self.recover_paths([i.data(Qt.ItemDataRole.UserRole)
+                                for i in sel_list])
+            return
 
         # Get data of the item
-        paths = sel_list[0].data(0, Qt.ItemDataRole.UserRole)
-        ftype = sel_list[0].data(1, Qt.ItemDataRole.UserRole)
-        name = sel_list[0].text(0)
+        paths = sel_list[0].data(Qt.ItemDataRole.UserRole)
+        ftype = sel_list[0].siblingAtColumn(1).data(Qt.ItemDataRole.UserRole)
 
         # Get the timestamp of the selected backup
         item = self.listWidget.selectedItems()[0]
         time = item.data(Qt.ItemDataRole.UserRole)
 
+        self.recover_path(paths, ftype, time)
+
+    def recover_paths(self, paths: list) -> None:
+        """Recover several files and folders of the selected snapshot
+        into a directory in one run
+
+        :param paths: Paths relative to backup root
+        :type paths: list
+        """
+        # Disable buttons to prevent two duplicity instances from running
+        self.disable_buttons(True)
+
+        # Abort if there is already a restore
+        if self.restore_active():
+            return
+
+        # Get the timestamp of the selected backup
+        item = self.listWidget.selectedItems()[0]
+        time = item.data(Qt.ItemDataRole.UserRole)
+
+        r_path = QtWidgets.QFileDialog.getExistingDirectory(
+                        self,
+                        "Select Destination",
+                        os.path.expanduser("~"),
+                        QtWidgets.QFileDialog.Option.ShowDirsOnly
+                        )
+
+        if not r_path:
+            self.disable_buttons(False)
+            return
+
+        self.plan_recovery(time, r_path, files=paths)
+
+    def showVersions(self) -> None:
+        """Show all versions of the selected file or folder
+        """
+        sel_list = self.treeView.selectionModel().selectedRows(0)
+
+        if sel_list == []:
+            return
+
+        self.versionsWindow.show_path(
+                sel_list[0].data(Qt.ItemDataRole.UserRole),
+                sel_list[0].siblingAtColumn(1).data(Qt.ItemDataRole.UserRole)
+                )
+
+    def recover_path(self, paths: str, ftype: str, time: int) -> None:
+        """Recover a file or folder of a snapshot
+
+        :param paths: Path relative to backup root
+        :type paths: str
+        :param ftype: File type
+        :type ftype: str
+        :param time: Timestamp of the backup
+        :type time: int
+        """
+        # Disable buttons to prevent two duplicity instances from running
+        self.disable_buttons(True)
+
+        # Abort if there is already a restore
+        if self.restore_active():
+            return
+
+        name = paths.split("/")[-1]
+
         # FileDialog to select local path
         fd = QtWidgets.QFileDialog()
 
@@ -191,24 +492,13 @@ class MainWindow(QtWidgets.QMainWindow):
                                 "")
 
             if r_path and QtCore.QFile(r_path).exists():
-                config.force = True
+                self.recovery_worker.force = True
 
         if r_path:
-            # Wait for other workers to finnish
-            # TODO: Wait only until safe not finnished
-            if not self.tree_worker.safe:
-                self.tree_worker.wait()
-
-            if not self.backup_worker.safe:
-                self.backup_worker.wait()
-
-            # Set params of the recovery worker
-            self.recovery_worker.time = time
-            self.recovery_worker.dest = r_path
-            self.recovery_worker.file = paths
-
-            self.recovery_worker.recoveryReady.connect(self.post_file_recovery)
-            self.recovery_worker.start()
+            self.plan_recovery(time, r_path, file=paths)
+        else:
+            self.recovery_worker.force = False
+            self.disable_buttons(False)
 
     def restore_snap(self) -> None:
         """Restores whole snapshot
@@ -216,15 +506,10 @@ class MainWindow(QtWidgets.QMainWindow):
         # Disable buttons to prevent two duplicity instances from running
         self.disable_buttons(True)
 
-        # Abort if there is already a worker running
-        if (self.backup_worker.isRunning()
-            or self.recovery_worker.isRunning()):
-
+        # Abort if there is already a restore
+        if self.restore_active():
             return
 
-        # Signal that worker is working on the target dir
-        self.recovery_worker.safe = False
-
         # Get the timestamp of the selected backup
         item = self.listWidget.selectedItems()[0]
         time = item.data(Qt.ItemDataRole.UserRole)
@@ -257,112 +542,191 @@ class MainWindow(QtWidgets.QMainWindow):
 
                 if msgbox_r != QtWidgets.QMessageBox.StandardButton.Yes:
                     self.disable_buttons(False)
-                    self.recovery_worker.safe = True
+                    return
                 else:
-                    config.force = True
+                    self.recovery_worker.force = True
 
-            # Wait for other workers to finnish
-            # TODO: Wait only until safe not finnished            
-            if not self.tree_worker.safe:
-                self.tree_worker.wait()
-
-            if not self.backup_worker.safe:
-                self.backup_worker.wait()
+            self.plan_recovery(time, r_path)
+        else:
+            self.disable_buttons(False)
 
-            # Set params of the recovery worker
-            self.recovery_worker.time = time
-            self.recovery_worker.dest = r_path
-            self.recovery_worker.file = None
+    def restore_active(self) -> bool:
+        """Is a restore being planned or running
 
-            self.recovery_worker.recoveryReady.connect(self.post_file_recovery)
-            self.recovery_worker.start()
+        :rtype: bool
+        """
+        return (self.scheduler.is_active(self.plan_worker)
+                or self.scheduler.is_active(self.recovery_worker))
+
+    def plan_recovery(self, time: int, dest: str,
+                      file: str = None, files: list = None) -> None:
+        """Estimate the download of a recovery before starting it
+
+        :param time: Timestamp of the backup
+        :type time: int
+        :param dest: Destination path
+        :type dest: str
+        :param file: Path relative to backup root, the whole snapshot
+                     if neither file nor files is given
+        :type file: str, optional
+        :param files: Paths relative to backup root, restored into dest
+        :type files: list, optional
+        """
+        def setup(worker):
+            worker.time = time
+            worker.dest = dest
+            worker.file = file
+            worker.files = files
+
+        self.scheduler.submit(self.plan_worker, "Planning restore",
+                              priority=INTERACTIVE,
+                              target=self.a.get_target(),
+                              setup=setup)
+
+    def post_plan(self) -> None:
+        """Show the estimate and start the recovery if confirmed
+        """
+        plan = self.plan_worker.result
+
+        # Restore without an estimate if planning failed
+        if plan is not None:
+            answer = QtWidgets.QMessageBox.question(
+                            self,
+                            "Restore",
+                            "The restore reads " + format_plan(plan) + ".\n"
+                            "Do you want to start it?"
+                            )
+
+            if answer != QtWidgets.QMessageBox.StandardButton.Yes:
+                self.recovery_worker.force = False
+                self.disable_buttons(False)
+                return
+
+        # Params of the recovery worker
+        params = (self.plan_worker.time,
+                  self.plan_worker.dest,
+                  self.plan_worker.file,
+                  self.plan_worker.files)
+
+        def setup(worker):
+            worker.time, worker.dest, worker.file, worker.files = params
+
+        self.scheduler.submit(self.recovery_worker, "Restore",
+                              target=self.a.get_target(),
+                              setup=setup)
 
     def post_file_recovery(self) -> None:
         """After recovery is finnished clean up and enable buttons
         """
-        self.recovery_worker.recoveryReady.disconnect()
-        config.force = False
+        self.recovery_worker.force = False
         self.disable_buttons(False)
 
+    def set_tree_table(self, table) -> None:
+        """Show a path table in the tree view
+
+        :param table: The path table, an empty tree if None
+        :type table: PathTable
+        """
+        self.treeView.setModel(SnapshotTreeModel(table, self.treeView))
+        self.treeView.setColumnWidth(0, 400)
+
     def build_tree(self,
-                   item: QtWidgets.QTreeWidgetItem,
-                   prev: QtWidgets.QTreeWidgetItem) -> None:
+                   item: QtWidgets.QListWidgetItem,
+                   prev: QtWidgets.QListWidgetItem) -> None:
         """Build the data tree of the backup contents
         """
-        if not self.backup_worker.safe:
-            return
-
-        if not self.recovery_worker.safe:
-            return
-
         # Make sure there is a selection
         if self.listWidget.selectedItems() == []:
-            self.treeWidget.clear()
+            self.set_tree_table(None)
             return
 
-        if self.tree_worker.isRunning():
-            # self.tree_worker.treeReady.disconnect()
-            
-            self.tree_worker.requestInterruption()
-            self.tree_worker.wait(5000)
-            if self.tree_worker.isRunning():
-                print("terminating")
-                self.tree_worker.terminate()
-                self.tree_worker.wait()
-
-        if prev:
-            if not prev.data(Qt.ItemDataRole.UserRole+1):
-                prev.setData(
-                    Qt.ItemDataRole.UserRole+1,
-                    QtWidgets.QTreeWidgetItem()
-                    )
-
-            if not prev.data(Qt.ItemDataRole.UserRole+2):
-                prev.setData(
-                    Qt.ItemDataRole.UserRole+2,
-                    self.tree_worker.files_l
-                    )
-            
-            if prev.data(Qt.ItemDataRole.UserRole+3) == None:
-                prev.setData(
-                    Qt.ItemDataRole.UserRole+3,
-                    self.tree_worker.diff_l
-                    )
-                
-            prev.data(Qt.ItemDataRole.UserRole+1).addChildren(
-                    self.treeWidget.invisibleRootItem().takeChildren()
-                )
-
-            if item.data(Qt.ItemDataRole.UserRole+1):
-                self.treeWidget.invisibleRootItem().addChildren(
-                        item.data(Qt.ItemDataRole.UserRole+1).takeChildren()
-                    )
-        else:
-            item.setData(Qt.ItemDataRole.UserRole+2, self.tree_worker.files_l)
-            item.setData(Qt.ItemDataRole.UserRole+3, self.tree_worker.diff_l)
-
-        self.tree_worker.files_l = item.data(Qt.ItemDataRole.UserRole+2)
-        self.tree_worker.diff_l = item.data(Qt.ItemDataRole.UserRole+3)
+        # Only the tree of the selected snapshot is wanted
+        self.scheduler.cancel_worker(self.tree_worker)
 
         if not self.config["build_tree"]:
             return
 
+        # Highlights wanted in the tree
+        diff_mode = False
+        if self.config["highlight_diffs"]:
+            diff_mode = "deep" if self.config["deep_compare"] else "quick"
+
         time = item.data(Qt.ItemDataRole.UserRole)
 
-        self.tree_worker.time = time
-        self.tree_worker.highlight_diffs = self.config["highlight_diffs"]
+        # Reuse the path table of an already visited snapshot
+        entry = self.snapshot_cache.get(self.snapshot_key(time))
+        self.show_cache_stats()
+        files_l = None
+        diff_l = None
+        if entry is not None:
+            table = entry.table
+            if table.diffs_applied != diff_mode and table.diffs_applied:
+                table.clear_highlights()
 
-        self.tree_worker.root = self.treeWidget.invisibleRootItem()
+            if table.diffs_applied == diff_mode:
+                self.set_tree_table(table)
+                return
 
-        self.tree_worker.treeReady.connect(self.post_tree)
+            files_l = entry.files_l
+
+            # Differences of the same mode can be reused
+            if entry.diff_mode == diff_mode:
+                diff_l = entry.diff_l
+
+        self.set_tree_table(None)
+
+        highlight_diffs = self.config["highlight_diffs"]
+        deep = self.config["deep_compare"]
+
+        def setup(worker):
+            worker.files_l = files_l
+            worker.diff_l = diff_l
+
+            worker.time = time
+            worker.highlight_diffs = highlight_diffs
+            worker.deep = deep
+
+        self.scheduler.submit(self.tree_worker, "Building tree",
+                              priority=INTERACTIVE,
+                              target=self.a.get_target(),
+                              setup=setup)
 
-        self.tree_worker.safe = False
-        self.tree_worker.start()
+    def show_cache_stats(self) -> None:
+        """Show the counters of the snapshot cache in the tooltip of the
+        snapshot list
+        """
+        stats = self.snapshot_cache.stats()
+        stats["mib"] = stats["bytes"] / 2**20
+        stats["max_mib"] = stats["max_bytes"] / 2**20
+        self.listWidget.setToolTip(
+            "Snapshot cache: %(entries)d snapshots, %(mib).1f of "
+            "%(max_mib).0f MiB\n%(hits)d hits, %(misses)d misses, "
+            "%(evictions)d evictions" % stats)
 
     def post_tree(self) -> None:
-        """After building the tree cleanup
+        """Show the tree once it is built
         """
-        self.tree_worker.treeReady.disconnect()
+        # Results of interrupted and superseded runs are dropped
+        if (self.tree_worker.isInterruptionRequested()
+            or self.scheduler.is_pending(self.tree_worker)
+            or self.tree_worker.table is None):
+            return
+
+        if self.listWidget.selectedItems() == []:
+            return
+
+        item = self.listWidget.selectedItems()[0]
+        if item.data(Qt.ItemDataRole.UserRole) != self.tree_worker.time:
+            return
+
+        self.snapshot_cache.put(self.snapshot_key(self.tree_worker.time),
+                                self.tree_worker.table,
+                                self.tree_worker.files_l,
+                                self.tree_worker.diff_l,
+                                self.tree_worker.table.diffs_applied)
+        self.show_cache_stats()
+
+        self.set_tree_table(self.tree_worker.table)
 
     def set_hl(self, b: bool) -> None:
         """Toggle the highlight config option
@@ -373,6 +737,16 @@ class MainWindow(QtWidgets.QMainWindow):
         self.config["highlight_diffs"] = b
         self.build_tree(self.listWidget.selectedItems()[0], None)
 
+    def set_deep_compare(self, b: bool) -> None:
+        """Toggle comparing file contents for the highlights
+
+        :param b: check state of action
+        :type b: bool
+        """
+        self.config["deep_compare"] = b
+        if self.config["highlight_diffs"]:
+            self.build_tree(self.listWidget.selectedItems()[0], None)
+
     def set_tree(self, b: bool) -> None:
         """Toggle the tree creation config option
 
@@ -385,15 +759,19 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def closeEvent(self, a0: QtGui.QCloseEvent) -> None:
 
-        if self.tree_worker.isRunning():
-            # self.tree_worker.treeReady.disconnect()
-            
-            self.tree_worker.requestInterruption()
-            self.tree_worker.wait(5000)
-            if self.tree_worker.isRunning():
-                print("terminating")
-                self.tree_worker.terminate()
-                self.tree_worker.wait()
+        # Close once the cancelled jobs are finished
+        self.scheduler.cancel_all()
+        if self.scheduler.busy():
+            if not self.closing:
+                self.closing = True
+                self.scheduler.idle.connect(self.close)
+            self.statusbar.showMessage("Stopping jobs...")
+            a0.ignore()
+            return
+
+        self.diffWindow.close()
+        self.searchWindow.close()
+        self.versionsWindow.close()
 
         a0.accept()
 
@@ -1,7 +1,17 @@
 """The actionHandler class provides an interface to the
    duplicity backend
 """
+import collections
+import contextlib
+import hashlib
+import itertools
 import os
+import sqlite3
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
 import fasteners
 
 from duplicity.dup_main import *
@@ -16,8 +26,24 @@ from duplicity import util
 from duplicity import commandline
 from duplicity import config
 from duplicity import dup_time
+from duplicity import file_naming
+from duplicity import manifest
+from duplicity import patchdir
+from duplicity import statistics
 
 from kyrian.config_helper import write_config, read_config
+from kyrian.snapshot_index import SnapshotIndex
+from kyrian.journal import ChangeJournal
+from kyrian.listing import CompactListing
+from kyrian.engine import Job, SessionPool, SESSION_MARGIN, produced
+from kyrian.progress import ProgressMonitor
+from kyrian.profiling import PhaseProfiler, get_mode
+from kyrian.prefetch import VolumePrefetcher
+from kyrian.volume_cache import VolumeCache, parse_size
+from kyrian.remote_listing import RemoteListing, local_fingerprint
+from kyrian.quick_diff import quick_diff, compare_listings
+from kyrian.narrowing import narrowed_paths
+from kyrian.sessions import IDLE_TIMEOUT
 
 
 def with_tempdir_opts(fn, opts):
@@ -38,18 +64,75 @@ def with_tempdir_opts(fn, opts):
         tempdir.default().cleanup()
 
 
+def hash_fileobj(fileobj, blocksize=1024 * 1024):
+    """Hash the contents of a file object and close it
+
+    :param fileobj: File object opened in binary mode
+    :param blocksize: Bytes read at once, defaults to 1 MiB
+    :type blocksize: int, optional
+    :return: Digest
+    :rtype: bytes
+    """
+    digest = hashlib.blake2b()
+    try:
+        buf = fileobj.read(blocksize)
+        while buf:
+            digest.update(buf)
+            buf = fileobj.read(blocksize)
+    finally:
+        fileobj.close()
+    return digest.digest()
+
+
+def hash_path(filename):
+    """Hash the contents of a local file
+
+    :param filename: Path of the file
+    :type filename: bytes
+    :return: Digest
+    :rtype: bytes
+    """
+    return hash_fileobj(open(filename, "rb"))
+
+
 class actionHandler():
     """Calls duplicity and returns relevant information
     """
     config_dir = "."
 
-    def __init__(self, cfg_dir=None) -> None:
+    def __init__(self, cfg_dir=None, isolate=True) -> None:
         """
         Start/end here
+
+        :param cfg_dir: Config directory, defaults to None
+        :type cfg_dir: str, optional
+        :param isolate: Run duplicity in child processes, defaults to True
+        :type isolate: bool, optional
         """
         if cfg_dir:
             self.config_dir = cfg_dir
 
+        self.isolate = isolate
+
+        # Running jobs by thread identifier
+        self.jobs = {}
+        self.jobs_lock = threading.Lock()
+
+        # Idle session processes of the jobs
+        self.session_pool = SessionPool() if isolate else None
+
+        # Open backends of a session process, set by kyrian.engine
+        self.backend_sessions = None
+
+        # Progress callbacks by thread identifier
+        self.progress_callbacks = {}
+
+        # Monitor of the running action
+        self.monitor = None
+
+        # Profiler of the running action, records nothing if disabled
+        self.profiler = PhaseProfiler()
+
         # per bug https://bugs.launchpad.net/duplicity/+bug/931175
         # duplicity crashes when PYTHONOPTIMIZE is set, so check
         # and refuse to run if it is set.
@@ -93,6 +176,37 @@ class actionHandler():
         else:
             self.current_profile = self.config["Profiles"].keys()[0]
 
+        # Listings of snapshots that were already read
+        self.index = SnapshotIndex(self.config_dir + "/index.sqlite")
+
+        # Changes journaled by kyrian watch
+        self.journal = ChangeJournal(self.config_dir + "/journal.sqlite")
+
+        # Chains scanned in this session per profile, the last scan of
+        # every Target is also kept in the index
+        self.chain_cache = {}
+
+        # Snapshot written by the last backup
+        self.new_set = None
+
+        # Journaled changes and the snapshot they are based on,
+        # None to scan the whole Source
+        self.backup_changes = None
+
+        # Last indexed signature time per chain while reading signatures
+        self.indexed_sigs = None
+
+        # Paths restored by the running restore_many and
+        # whether existing ones are overwritten
+        self.restore_paths = None
+        self.restore_force = False
+
+        # Plan a restore instead of listing files
+        self.planning = False
+
+        # Takes the records of list_current and read_signatures
+        self.emit_record = None
+
     def save_config(self):
         """Save the config to file
         """
@@ -111,6 +225,16 @@ class actionHandler():
                 return False
         return True
 
+    def get_target(self):
+        """Target of the current profile
+
+        :return: The Target or None if the profile has none
+        :rtype: str
+        """
+        profile_cfg = self.config.get("Profiles", {}).get(
+                                    self.current_profile) or {}
+        return profile_cfg.get("Target")
+
     def take_action(self, opts):
         """Given a list of duplicity config options run duplicity
         Adapted from https://gitlab.com/duplicity/duplicity
@@ -123,25 +247,49 @@ class actionHandler():
         # (make it available for command line processing)
         dup_time.setcurtime()
 
+        self.profiler = PhaseProfiler(
+                get_mode(self.config["Profiles"][self.current_profile]),
+                profile=self.current_profile)
+
         # determine what action we're performing and process command line
-        action = commandline.ProcessCommandLine(opts)
+        with self.profiler.phase(u"commandline"), self.reusing_backend():
+            action = commandline.ProcessCommandLine(opts)
+        self.profiler.action = action
 
         config.lockpath = os.path.join(config.archive_dir_path.name, b"lockfile")
         config.lockfile = fasteners.process_lock.InterProcessLock(config.lockpath)
         log.Debug(_(u"Acquiring lockfile %s") % config.lockpath)
-        if not config.lockfile.acquire(blocking=False):
+
+        # Jobs that only read the Target wait for each other
+        blocking = action in [u"collection-status",
+                              u"list-current",
+                              u"verify",
+                              u"restore"]
+        with self.profiler.phase(u"lock"):
+            locked = config.lockfile.acquire(blocking=blocking)
+        if not locked:
             log.FatalError(
                 u"Another duplicity instance is already running with this archive directory\n",
                 log.ErrorCode.user_error)
             log.shutdown()
             sys.exit(2)
 
+        self.monitor = ProgressMonitor(self.get_progress_callback(), action)
+        if config.backend:
+            self.monitor.wrap_backend(config.backend)
+
         try:
-            self.do_backup(action)
+            with self.monitor.installed(), self.profiler.profiled():
+                self.do_backup(action)
 
         finally:
             util.release_lockfile()
 
+            filename = self.profiler.write(
+                            os.path.join(self.config_dir, "profiling"))
+            if filename:
+                log.Info(_(u"Profile written to %s") % filename)
+
     def add_args_from_cfg(self, args):
         """Add general flags to the list of arguments
            depending on configuration
@@ -170,9 +318,166 @@ class actionHandler():
 
         return args
 
-    def get_chains(self):
+    def set_progress_callback(self, callback) -> None:
+        """Receive the progress records of actions started by the
+        calling thread
+
+        See kyrian.progress for the records.
+
+        :param callback: Called with every record, None to remove it
+        :type callback: callable
+        """
+        owner = threading.get_ident()
+        if callback is None:
+            self.progress_callbacks.pop(owner, None)
+        else:
+            self.progress_callbacks[owner] = callback
+
+    def get_progress_callback(self):
+        """Progress callback of the calling thread
+
+        :return: The callback or None
+        :rtype: callable
+        """
+        return self.progress_callbacks.get(threading.get_ident())
+
+    @contextlib.contextmanager
+    def start_job(self, method, args, kwargs):
+        """Start a job in a child process, registered for the calling
+        thread while the context is active
+
+        :param method: Name of the method
+        :type method: str
+        :param args: Positional arguments of the method
+        :type args: tuple
+        :param kwargs: Keyword arguments of the method
+        :type kwargs: dict
+        :return: The running job
+        :rtype: Job
+        """
+        session = None
+        target = self.get_target()
+        if target and self.get_session_timeout() > SESSION_MARGIN:
+            session = self.session_pool.lease(self.config_dir, target,
+                                              self.get_session_timeout())
+
+        job = Job(self.config_dir,
+                  self.config,
+                  self.current_profile,
+                  method,
+                  args,
+                  kwargs,
+                  progress=self.get_progress_callback(),
+                  session=session)
+
+        owner = threading.get_ident()
+        with self.jobs_lock:
+            self.jobs.setdefault(owner, []).append(job)
+
+        try:
+            job.start()
+            yield job
+        finally:
+            job.cancel()
+            with self.jobs_lock:
+                self.jobs[owner].remove(job)
+
+            if session is not None and job.finished:
+                self.session_pool.give_back(session)
+
+    def run_job(self, method, *args, **kwargs):
+        """Call a method that runs duplicity, in a child process
+        if the handler is isolated
+
+        Jobs are registered for the calling thread and can be
+        cancelled with cancel_jobs.
+
+        :param method: Name of the method
+        :type method: str
+        :return: Return value of the method
+        """
+        if not self.isolate:
+            result = getattr(self, method)(*args, **kwargs)
+            if isinstance(result, types.GeneratorType):
+                return list(result)
+            return result
+
+        with self.start_job(method, args, kwargs) as job:
+            return job.result()
+
+    def stream_job(self, method, *args, **kwargs):
+        """Like run_job for methods that return lists, but iterate the
+        records while they arrive
+
+        :param method: Name of the method
+        :type method: str
+        :return: Records
+        :rtype: generator
+        """
+        if not self.isolate:
+            yield from getattr(self, method)(*args, **kwargs)
+            return
+
+        with self.start_job(method, args, kwargs) as job:
+            yield from job.records()
+
+    def cancel_jobs(self, owner=None):
+        """Kill running jobs
+
+        :param owner: Only cancel jobs started by the thread with this
+                      identifier, defaults to None for all jobs
+        :type owner: int, optional
+        """
+        with self.jobs_lock:
+            for thread_ident, jobs in self.jobs.items():
+                if owner is None or owner == thread_ident:
+                    for job in jobs:
+                        job.cancel()
+
+    def close_sessions(self) -> None:
+        """Stop the idle session processes and close their connections
+        """
+        if self.session_pool is not None:
+            self.session_pool.close()
+
+    @contextlib.contextmanager
+    def reusing_backend(self):
+        """Let duplicity reuse an open backend of the session process
+        while the context is active
+        """
+        if self.backend_sessions is None:
+            yield
+            return
+
+        with self.backend_sessions.installed():
+            yield
+
+    def release_backend(self) -> None:
+        """Close the backend of the action or keep it open in the
+        session process
+        """
+        if self.backend_sessions is None:
+            config.backend.close()
+        else:
+            self.backend_sessions.checkin(config.backend)
+
+    def discard_backend(self) -> None:
+        """Close the backend of a failed action in the session process,
+        it may be broken
+        """
+        if self.backend_sessions is not None:
+            self.backend_sessions.discard(config.backend)
+
+    def get_chains(self, refresh=False):
         """Get all available backup chains
 
+        The chains of the last scan are reused as long as the Target of
+        the profile did not change, backups made through the handler
+        are added to them.
+
+        :param refresh: Scan the Target even if the chains are known,
+                        defaults to False
+        :type refresh: bool, optional
         :return: The chains
         :rtype: dict
         """
@@ -181,55 +486,512 @@ class actionHandler():
             print("No Target specified")
             return {}
 
-        with_tempdir_opts(
-            self.take_action,
-            [
-                "collection-status",
-                self.config["Profiles"][self.current_profile]["Target"]
-            ]
-            )
-        commandline.collection_status = None
+        target = self.config["Profiles"][self.current_profile]["Target"]
 
-        return self.chain_dict
+        cached = self.chain_cache.get(self.current_profile)
+        if not refresh and cached and cached["Target"] == target:
+            return dict(cached["chains"])
+
+        chain_dict = self.run_job("run_collection_status")
+        scanned = int(time.time())
+
+        # Forget listings of snapshots that were removed
+        self.index.prune(target, chain_dict.keys())
+        self.index.set_chains(target, chain_dict, scanned)
+
+        self.chain_cache[self.current_profile] = {
+            "Target": target,
+            "chains": dict(chain_dict),
+            "scanned": scanned
+            }
+
+        return chain_dict
+
+    def get_known_chains(self):
+        """Get the chains of the last scan without accessing the Target
+
+        :return: None if the Target was never scanned, else a dict with
+                 "chains", "scanned" (time of the scan) and "stale",
+                 True if the scan is from an earlier session
+        :rtype: dict
+        """
+        if not self.check_config(["Target"]):
+            return None
+
+        target = self.config["Profiles"][self.current_profile]["Target"]
+
+        cached = self.chain_cache.get(self.current_profile)
+        if cached and cached["Target"] == target:
+            return {
+                "chains": dict(cached["chains"]),
+                "scanned": cached["scanned"],
+                "stale": False
+                }
+
+        stored = self.index.get_chains(target)
+        if stored is None:
+            return None
+
+        return {
+            "chains": stored[0],
+            "scanned": stored[1],
+            "stale": True
+            }
 
     def get_files(self, time=None):
         """Get a list of all files and directories in the backup
 
+        Listings of known backup times are served from the local index,
+        only unknown snapshots are read from the signature chain.
+
         :param time: The timestamp of the backup, defaults to None
         :type time: int, optional
-        :return: List of files with type
+        :return: List of (path, type, mtime, size, mode)
         :rtype: list
         """
-        if self.check_config("Target"):
+        if not self.check_config(["Target"]):
             print("No Target specified")
             return []
 
-        config.restore_time = time
-        with_tempdir_opts(
-            self.take_action,
-            [
-                "list-current-files",
-                self.config["Profiles"][self.current_profile]["Target"]
-            ])
+        target = self.config["Profiles"][self.current_profile]["Target"]
+
+        # The latest state (time=None) may change with the next backup
+        if time:
+            files = self.index.get_listing(target, time)
+            if files is not None:
+                return files
+
+        files = self.run_job("run_list_current", time)
 
-        commandline.list_current = None
+        if time:
+            self.index.add_listing(target, time, files)
 
-        return self.current_paths
+        return files
 
-    def get_diff(self, time=None):
+    def get_listing(self, time=None):
+        """Get the files and directories in the backup as a compact
+        listing
+
+        Indexed listings are read into the listing directly, without a
+        list of tuples.
+
+        :param time: The timestamp of the backup, defaults to None
+        :type time: int, optional
+        :return: The listing
+        :rtype: CompactListing
+        """
+        if time and self.check_config(["Target"]):
+            target = self.config["Profiles"][self.current_profile]["Target"]
+            listing = self.index.get_listing(target, time,
+                                             into=CompactListing())
+            if listing is not None:
+                return listing
+
+        return CompactListing.from_records(self.get_files(time=time))
+
+    def get_diff(self, time=None, deep=False, listing=None):
         """Get a list of files and directories that differ from 
            the current state
 
+        By default only the metadata in the signatures is compared
+        with the Source, see kyrian.quick_diff. The deep mode runs
+        verify --compare-data, which reads all files of the snapshot
+        and the Source.
+
         :param time: Timesamp of the backup, defaults to None
         :type time: int, optional
-        :return: List of differing files
-        :rtype: list
+        :param deep: Compare file contents, defaults to False
+        :type deep: bool, optional
+        :param listing: Listing of the snapshot if it is already known,
+                        defaults to None
+        :type listing: CompactListing, optional
+        :return: Differing paths and their types
+        :rtype: dict
         """
 
         if not self.check_config(["Target", "Source"]):
             print("Source and Target unspecified")
             return {}
 
+        if deep:
+            return self.run_job("run_verify", time)
+
+        if listing is None:
+            listing = self.get_listing(time=time)
+
+        source = self.config["Profiles"][self.current_profile]["Source"]
+        return quick_diff(listing, os.path.expanduser(source))
+
+    def get_snapshot_diff(self, time_a, time_b):
+        """Compare two snapshots
+
+        Only the listings are compared, they come from the index or
+        the signature chain. Neither the Source nor data volumes
+        are read.
+
+        :param time_a: Timestamp of the first backup
+        :type time_a: int
+        :param time_b: Timestamp of the second backup
+        :type time_b: int
+        :return: Lists of added, removed and changed paths from the
+                 older to the newer backup
+        :rtype: tuple
+        """
+        old, new = sorted([time_a, time_b])
+        return compare_listings(self.get_files(time=old),
+                                self.get_files(time=new))
+
+    def recover_files(self, dest, file=None, time=None, force=False):
+        """Recover a file from the backup
+
+        :param file: Filepath relative in backup
+        :type file: str
+        :param dest: Destination path
+        :type dest: str
+        :param time: Timestamp of the backup, defaults to None
+        :type time: int, optional
+        :param force: Overwrite existing files, defaults to False
+        :type force: bool, optional
+        """
+        self.run_job("run_restore", dest, file, time, force)
+
+    def recover_many(self, dest, files, time=None, force=False):
+        """Recover several files from the backup in one pass
+
+        Every path is written to dest joined with the path relative
+        to the backup root.
+
+        :param dest: Destination directory
+        :type dest: str
+        :param files: Filepaths relative in backup
+        :type files: list
+        :param time: Timestamp of the backup, defaults to None
+        :type time: int, optional
+        :param force: Overwrite existing files, defaults to False
+        :type force: bool, optional
+        """
+        self.run_job("run_restore_many", dest, files, time, force)
+
+    def plan_recovery(self, file=None, time=None, files=None):
+        """Find the volumes a restore downloads and their size
+
+        :param file: Filepath relative in backup, the whole snapshot
+                     if neither file nor files is given
+        :type file: str, optional
+        :param time: Timestamp of the backup, defaults to None
+        :type time: int, optional
+        :param files: Filepaths relative in backup, defaults to None
+        :type files: list, optional
+        :return: The plan as in plan_restore
+        :rtype: dict
+        """
+        return self.run_job("run_plan_restore", file, time, files)
+
+    def make_backup(self, skip_unchanged=False):
+        """Make a Snapshot of Source to Target
+
+        If kyrian watch is running for the profile only the journaled
+        changes are scanned.
+
+        :param skip_unchanged: Make no snapshot if the journal is
+                               empty, defaults to False
+        :type skip_unchanged: bool, optional
+        :return: False if the backup was skipped
+        :rtype: bool
+        """
+        target = self.config["Profiles"][self.current_profile]["Target"]
+        source = self.config["Profiles"][self.current_profile]["Source"]
+
+        started = time.time()
+        changes = self.journal.get_changes(self.current_profile,
+                                           source,
+                                           started)
+
+        if skip_unchanged and changes is not None and not changes[0]:
+            log.Notice(_(u"No changes since the last backup, skipping"))
+            return False
+
+        new_set = self.run_job("run_backup", changes)
+
+        # The journal continues from the start of this backup
+        self.journal.backup_done(self.current_profile,
+                                 source,
+                                 started,
+                                 max(new_set) if new_set else None)
+
+        # Add the new snapshot to the known chains,
+        # scan the Target next time if it is unknown
+        cached = self.chain_cache.get(self.current_profile)
+        if new_set and cached and cached["Target"] == target:
+            cached["chains"].update(new_set)
+            self.index.set_chains(target, cached["chains"], cached["scanned"])
+        else:
+            self.chain_cache.pop(self.current_profile, None)
+
+        # Keep an existing search index up to date
+        if new_set and self.index.get_indexed_sigs(target):
+            self.update_search_index()
+
+        return True
+
+    def update_search_index(self):
+        """Add the signature files that are not indexed yet to the
+        search index
+
+        The first call reads all signature chains of the Target, later
+        calls only the new signature files.
+        """
+        if not self.check_config(["Target"]):
+            print("No Target specified")
+            return
+
+        target = self.config["Profiles"][self.current_profile]["Target"]
+
+        chain_d = self.get_chains()
+        self.index.prune_chains(target,
+                                [i for i in chain_d
+                                 if chain_d[i][0] == _(u"Full")])
+
+        self.index.add_events(
+                    target,
+                    self.stream_job("run_read_signatures",
+                                    self.index.get_indexed_sigs(target))
+                    )
+
+    def get_versions(self, path_s):
+        """Get the versions of a path in all snapshots of the search index
+
+        :param path_s: Path relative to backup root
+        :type path_s: str
+        :return: List of (time, type, mtime, size, mode, changed),
+                 see SnapshotIndex.history
+        :rtype: list
+        """
+        if not self.check_config(["Target"]):
+            print("No Target specified")
+            return []
+
+        target = self.config["Profiles"][self.current_profile]["Target"]
+        return self.index.history(target, path_s)
+
+    def search(self, pattern, limit=500):
+        """Find paths in all snapshots of the search index
+
+        :param pattern: Part of the path, case insensitive
+        :type pattern: str
+        :param limit: Maximal number of paths, defaults to 500
+        :type limit: int, optional
+        :return: List of (path, times of the snapshots containing it)
+        :rtype: list
+        """
+        if not self.check_config(["Target"]):
+            print("No Target specified")
+            return []
+
+        target = self.config["Profiles"][self.current_profile]["Target"]
+        return self.index.search(target, pattern, limit)
+
+    def run_collection_status(self):
+        """Run collection-status in this process
+
+        :return: The chains
+        :rtype: dict
+        """
+        with_tempdir_opts(
+            self.take_action,
+            [
+                "collection-status",
+                self.config["Profiles"][self.current_profile]["Target"]
+            ]
+            )
+        commandline.collection_status = None
+
+        return self.chain_dict
+
+    def run_list_current(self, time=None):
+        """Run list-current-files in this process
+
+        :param time: The timestamp of the backup, defaults to None
+        :type time: int, optional
+        :return: Records (path, type, mtime, size, mode)
+        :rtype: generator
+        """
+        config.restore_time = time
+
+        def list_files(emit):
+            self.emit_record = emit
+            try:
+                with_tempdir_opts(
+                    self.take_action,
+                    [
+                        "list-current-files",
+                        self.config["Profiles"][self.current_profile]["Target"]
+                    ])
+            finally:
+                self.emit_record = None
+                commandline.list_current = None
+
+        return produced(list_files)
+
+    def get_verify_workers(self) -> int:
+        """Number of threads reading the Source during verify
+
+        Set with the profile option verify-workers, defaults to the
+        number of CPUs. 1 compares the files one after another.
+
+        :rtype: int
+        """
+        profile_cfg = self.config["Profiles"][self.current_profile]
+        if "verify-workers" in profile_cfg.keys():
+            return max(1, int(profile_cfg["verify-workers"]))
+        return os.cpu_count() or 1
+
+    def get_restore_concurrency(self) -> int:
+        """Number of volumes downloaded at once during restore and verify
+
+        Set with the profile option restore-concurrency, defaults to 4.
+        1 downloads the volumes one after another like duplicity.
+
+        :rtype: int
+        """
+        profile_cfg = self.config["Profiles"][self.current_profile]
+        if "restore-concurrency" in profile_cfg.keys():
+            return max(1, int(profile_cfg["restore-concurrency"]))
+        return 4
+
+    def get_sync_ttl(self) -> float:
+        """Seconds a listing of the Target is reused by read only actions
+
+        Set with the profile option sync-ttl, defaults to 60. With 0 the
+        Target is listed by every action, the local archive is still
+        only synced if the listing changed.
+
+        :rtype: float
+        """
+        profile_cfg = self.config["Profiles"][self.current_profile]
+        return float(profile_cfg.get("sync-ttl", 60))
+
+    def sync_state(self, func, *args):
+        """Call get_sync, set_sync or clear_sync of the index
+
+        The sync state only saves listings of the Target, an error of
+        the database is logged and the Target is listed and synced as
+        without it. A state that could not be cleared is at most reused
+        for the sync TTL.
+
+        :param func: Method of the index
+        :type func: callable
+        :return: Result of func, None if the database failed
+        """
+        try:
+            return func(*args)
+        except sqlite3.Error as e:
+            log.Warn(_(u"Error accessing the sync state: %s") % e)
+            return None
+
+    def get_session_timeout(self) -> float:
+        """Seconds a session process keeps the connection to the Target
+        open while it waits for the next job
+
+        Set with the profile option session-timeout, defaults to 300.
+        With 0 every job opens a new connection in a fresh process.
+
+        :rtype: float
+        """
+        profile_cfg = self.config["Profiles"][self.current_profile]
+        return float(profile_cfg.get("session-timeout", IDLE_TIMEOUT))
+
+    def get_volume_cache(self):
+        """Cache of the downloaded volumes of the profile
+
+        Set with the profile options volume-cache-dir, defaults to
+        volume-cache in the config directory, and volume-cache-size,
+        defaults to 1G. A size of 0 disables the cache.
+
+        :return: The cache or None if it is disabled
+        :rtype: VolumeCache
+        """
+        profile_cfg = self.config["Profiles"][self.current_profile]
+
+        max_bytes = parse_size(profile_cfg.get("volume-cache-size", "1G"))
+        if max_bytes <= 0:
+            return None
+
+        directory = os.path.expanduser(
+                        profile_cfg.get("volume-cache-dir",
+                                        os.path.join(self.config_dir,
+                                                     "volume-cache")))
+        return VolumeCache(directory, profile_cfg["Target"], max_bytes)
+
+    def run_read_signatures(self, indexed_sigs):
+        """Read the entries of signature files in this process
+
+        :param indexed_sigs: Time of the last signature file to skip
+                             by start time of the chain
+        :type indexed_sigs: dict
+        :return: Events as in SnapshotIndex.add_events
+        :rtype: generator
+        """
+        def read(emit):
+            self.indexed_sigs = indexed_sigs
+            self.emit_record = emit
+            try:
+                with_tempdir_opts(
+                    self.take_action,
+                    [
+                        "list-current-files",
+                        self.config["Profiles"][self.current_profile]["Target"]
+                    ])
+            finally:
+                self.indexed_sigs = None
+                self.emit_record = None
+                commandline.list_current = None
+
+        return produced(read)
+
+    def run_plan_restore(self, file=None, time=None, files=None):
+        """Plan a restore in this process
+
+        :param file: Filepath relative in backup, defaults to None
+        :type file: str, optional
+        :param time: Timestamp of the backup, defaults to None
+        :type time: int, optional
+        :param files: Filepaths relative in backup, defaults to None
+        :type files: list, optional
+        :return: The plan as in plan_restore
+        :rtype: dict
+        """
+        config.restore_time = time
+        config.restore_dir = None
+
+        if files:
+            self.restore_paths = files
+        elif file:
+            self.restore_paths = [file]
+
+        self.planning = True
+        try:
+            with_tempdir_opts(
+                self.take_action,
+                [
+                    "list-current-files",
+                    self.config["Profiles"][self.current_profile]["Target"]
+                ])
+        finally:
+            self.planning = False
+            self.restore_paths = None
+            commandline.list_current = None
+
+        return self.plan
+
+    def run_verify(self, time=None):
+        """Run verify in this process
+
+        :param time: Timesamp of the backup, defaults to None
+        :type time: int, optional
+        :return: List of differing files
+        :rtype: dict
+        """
         config.restore_time = time
 
         args = ["verify", "--compare-data"]
@@ -243,17 +1005,21 @@ class actionHandler():
 
         return self.diff_f_list
 
-    def recover_files(self, dest, file=None, time=None):
-        """Recover a file from the backup
+    def run_restore(self, dest, file=None, time=None, force=False):
+        """Run restore in this process
 
-        :param file: Filepath relative in backup
-        :type file: str
         :param dest: Destination path
         :type dest: str
+        :param file: Filepath relative in backup
+        :type file: str
         :param time: Timestamp of the backup, defaults to None
         :type time: int, optional
+        :param force: Overwrite existing files, defaults to False
+        :type force: bool, optional
         """
         config.restore_time = time
+        config.restore_dir = None
+        config.force = force
         args = ["restore"]
         args = self.add_args_from_cfg(args)
 
@@ -265,8 +1031,46 @@ class actionHandler():
         args = args + [dest]
         with_tempdir_opts(self.take_action, args)
 
-    def make_backup(self):
-        """Make a Snapshot of Source to Target
+    def run_restore_many(self, dest, files, time=None, force=False):
+        """Run restore_many in this process
+
+        :param dest: Destination directory
+        :type dest: str
+        :param files: Filepaths relative in backup
+        :type files: list
+        :param time: Timestamp of the backup, defaults to None
+        :type time: int, optional
+        :param force: Overwrite existing files, defaults to False
+        :type force: bool, optional
+        """
+        config.restore_time = time
+        config.restore_dir = None
+
+        # dest may contain other files, existing paths are
+        # checked one by one in restore_many
+        config.force = True
+        args = ["restore"]
+        args = self.add_args_from_cfg(args)
+
+        args = args + [self.config["Profiles"][self.current_profile]["Target"]]
+
+        args = args + [dest]
+
+        self.restore_paths = files
+        self.restore_force = force
+        try:
+            with_tempdir_opts(self.take_action, args)
+        finally:
+            self.restore_paths = None
+
+    def run_backup(self, changes=None):
+        """Run a backup in this process
+
+        :param changes: Journaled changes and the snapshot they are
+                        based on, defaults to None to scan the Source
+        :type changes: tuple, optional
+        :return: The new snapshot as in get_chain_dict or None
+        :rtype: dict
         """
         args = []
         args = self.add_args_from_cfg(args)
@@ -274,7 +1078,14 @@ class actionHandler():
         args = args + [self.config["Profiles"][self.current_profile]["Source"]]
         args = args + [self.config["Profiles"][self.current_profile]["Target"]]
 
-        with_tempdir_opts(self.take_action, args)
+        self.new_set = None
+        self.backup_changes = changes
+        try:
+            with_tempdir_opts(self.take_action, args)
+        finally:
+            self.backup_changes = None
+
+        return self.new_set
 
     def do_backup(self, action):
         """Adapted from https://gitlab.com/duplicity/duplicity
@@ -290,22 +1101,51 @@ class actionHandler():
         log_startup_parms(log.INFO)
 
         # check for disk space and available file handles
-        check_resources(action)
-
-        # get current collection status
-        col_stats = dup_collections.CollectionsStatus(config.backend,
-                                                      config.archive_dir_path,
-                                                      action).set_values()
-
-        # check archive synch with remote, fix if needed
-        if action not in [u"collection-status",
-                          u"remove-all-but-n-full",
-                          u"remove-all-inc-of-but-n-full",
-                          u"remove-old",
-                          u"replicate",
-                              ]:
-
-            sync_archive(col_stats)
+        with self.profiler.phase(u"check_resources"):
+            check_resources(action)
+
+        # Read only actions may reuse the listing of the last sync
+        target = self.get_target()
+        read_only = action in [u"list-current", u"verify", u"restore"]
+        synced = (self.sync_state(self.index.get_sync, target)
+                  if read_only else None)
+
+        listing = RemoteListing()
+        if synced and time.time() - synced["time"] < self.get_sync_ttl():
+            listing = RemoteListing(synced["remote"])
+
+        with listing.installed(config.backend):
+            # get current collection status
+            with self.profiler.phase(u"collection-status"), \
+                    self.monitor.phase(u"collection-status"):
+                col_stats = dup_collections.CollectionsStatus(config.backend,
+                                                              config.archive_dir_path,
+                                                              action).set_values()
+
+            # check archive synch with remote, fix if needed
+            if action not in [u"collection-status",
+                              u"remove-all-but-n-full",
+                              u"remove-all-inc-of-but-n-full",
+                              u"remove-old",
+                              u"replicate",
+                                  ]:
+
+                if (synced and listing.matches(synced["remote"])
+                        and synced["local"] == local_fingerprint(
+                                                config.archive_dir_path.name)):
+                    log.Info(_(u"Local archive is in sync with the Target"))
+                else:
+                    with self.profiler.phase(u"sync_archive"), \
+                            self.monitor.phase(u"sync_archive"):
+                        sync_archive(col_stats)
+
+                    if read_only and listing.listed:
+                        self.sync_state(self.index.set_sync,
+                                        target,
+                                        listing.listed,
+                                        listing.names,
+                                        local_fingerprint(
+                                            config.archive_dir_path.name))
 
         while True:
             # if we have to clean up the last partial, then col_stats are invalidated
@@ -353,14 +1193,51 @@ class actionHandler():
             action = u"full"
 
         # get the passphrase if we need to based on action/options
-        config.gpg_profile.passphrase = get_passphrase(1, action)
+        with self.profiler.phase(u"passphrase"):
+            config.gpg_profile.passphrase = get_passphrase(1, action)
+
+        # The Target may change, a failed clear is tried again after
+        # the action
+        writes = not read_only and action != u"collection-status"
+        if writes:
+            self.sync_state(self.index.clear_sync, target)
 
+        try:
+            with self.profiler.phase(action):
+                self.run_action(action, col_stats)
+        finally:
+            if writes:
+                self.sync_state(self.index.clear_sync, target)
+
+        self.release_backend()
+        if exit_val is not None:
+            print("exit_val: ", exit_val)
+
+    def run_action(self, action, col_stats):
+        """Run the action on a stable collection
+        Adapted from https://gitlab.com/duplicity/duplicity
+
+        :param action: The action of duplicity
+        :type action: str
+        :type col_stats: CollectionStatus object
+        :param col_stats: collection status
+        """
         if action == u"restore":
-            restore(col_stats)
+            with self.reading_volumes(col_stats):
+                if self.restore_paths is not None:
+                    self.restore_many(col_stats)
+                else:
+                    restore(col_stats)
         elif action == u"verify":
-            self.verify(col_stats)
+            with self.reading_volumes(col_stats):
+                self.verify(col_stats)
         elif action == u"list-current":
-            self.list_current(col_stats)
+            if self.planning:
+                self.plan_restore(col_stats)
+            elif self.indexed_sigs is not None:
+                self.read_signatures(col_stats)
+            else:
+                self.list_current(col_stats)
         elif action == u"collection-status":
             if config.show_changes_in_set is not None:
                 log.PrintCollectionChangesInSet(col_stats, config.show_changes_in_set, True)
@@ -404,21 +1281,86 @@ class actionHandler():
 
             if action == u"full":
                 full_backup(col_stats)
+                self.new_set = self.get_new_set(u"full")
             else:  # attempt incremental
-                sig_chain = check_sig_chain(col_stats)
+                with self.profiler.phase(u"signatures"):
+                    sig_chain = check_sig_chain(col_stats)
                 # action == "inc" was requested, but no full backup is available
                 if not sig_chain:
                     full_backup(col_stats)
+                    self.new_set = self.get_new_set(u"full")
                 else:
                     if not config.restart:
                         # only ask for a passphrase if there was a previous backup
                         if col_stats.all_backup_chains:
                             config.gpg_profile.passphrase = get_passphrase(1, action)
                             check_last_manifest(col_stats)  # not needed for full backups
-                    incremental_backup(sig_chain)
-        config.backend.close()
-        if exit_val is not None:
-            print("exit_val: ", exit_val)
+                    if self.use_journal(sig_chain):
+                        self.narrowed_incremental_backup(sig_chain)
+                    else:
+                        incremental_backup(sig_chain)
+                    self.new_set = self.get_new_set(u"inc")
+
+    def use_journal(self, sig_chain) -> bool:
+        """Can the journaled changes replace the scan of the Source
+
+        The journal only holds the changes since the snapshot it is
+        based on, which has to be the last one of the chain.
+
+        :param sig_chain: Signature chain of the incremental backup
+        :type sig_chain: dup_collections.SignatureChain
+        :rtype: bool
+        """
+        if self.backup_changes is None:
+            return False
+        if config.restart or config.dry_run or config.progress:
+            return False
+        return sig_chain.end_time == self.backup_changes[1]
+
+    def narrowed_incremental_backup(self, sig_chain):
+        """Incremental backup that only reads the journaled paths
+        from the Source, see kyrian.narrowing
+        Adapted from https://gitlab.com/duplicity/duplicity
+
+        :param sig_chain: Signature chain of the last backup
+        :type sig_chain: dup_collections.SignatureChain
+        """
+        changes = self.backup_changes[0]
+        log.Notice(_(u"Scanning %d journaled paths") % len(changes))
+
+        dup_time.setprevtime(sig_chain.end_time)
+        if dup_time.curtime == dup_time.prevtime:
+            time.sleep(2)
+            dup_time.setcurtime()
+            assert dup_time.curtime != dup_time.prevtime, \
+                u"time not moving forward at appropriate pace - system clock issues?"
+
+        # The signature chain is read once for both iterators
+        sig_a, sig_b = itertools.tee(
+                diffdir.get_combined_path_iter(sig_chain.get_fileobjs()))
+        path_iter = narrowed_paths(config.select, sig_a, changes)
+
+        new_sig_outfp = get_sig_fileobj(u"new-sig")
+        new_man_outfp = get_man_fileobj(u"inc")
+
+        diffdir.stats = statistics.StatsDeltaProcess()
+        tarblock_iter = diffdir.DeltaTarBlockIter(
+                diffdir.get_delta_iter(path_iter, sig_b, new_sig_outfp))
+        bytes_written = write_multivol(u"inc", tarblock_iter,
+                                       new_man_outfp, new_sig_outfp,
+                                       config.backend)
+
+        # close sig file and rename to final
+        new_sig_outfp.close()
+        new_sig_outfp.to_remote()
+        new_sig_outfp.to_final()
+
+        # close manifest and rename to final
+        new_man_outfp.close()
+        new_man_outfp.to_remote()
+        new_man_outfp.to_final()
+
+        print_statistics(diffdir.stats, bytes_written)
 
     def get_chain_dict(self, col_stats):
         """Adapted from https://gitlab.com/duplicity/duplicity
@@ -453,6 +1395,36 @@ class actionHandler():
 
         return d
 
+    def get_new_set(self, backup_type):
+        """Describe the set that was just written like get_chain_dict
+        using the local copy of its manifest
+
+        :param backup_type: "full" or "inc"
+        :type backup_type: str
+        :return: Snapshot or None if the manifest can not be read
+        :rtype: dict
+        """
+        if config.dry_run:
+            return None
+
+        man_path = config.archive_dir_path.append(
+                        file_naming.get(backup_type, manifest=True)
+                        )
+        if not man_path.exists():
+            return None
+
+        mf = manifest.Manifest().from_string(man_path.get_data())
+
+        if backup_type == u"full":
+            btype = _(u"Full")
+        else:
+            btype = _(u"Incremental")
+        time = dup_time.curtime
+
+        return {time: (btype,
+                       dup_time.timetopretty(time),
+                       len(mf.volume_info_dict))}
+
     def list_current(self, col_stats, time=None):
         """Adapted from https://gitlab.com/duplicity/duplicity/
         List the files current in the archive (examining signature only)
@@ -466,14 +1438,270 @@ class actionHandler():
         if not time:
             time = config.restore_time or dup_time.curtime
         sig_chain = col_stats.get_signature_chain_at_time(time)
-        self.current_paths = diffdir.get_combined_path_iter(
+        path_iter = diffdir.get_combined_path_iter(
                                 sig_chain.get_fileobjs(time)
                                 )
 
+        for ropath in path_iter:
+            # Skip deleted files and the root "."
+            if ropath.difftype == u"deleted" or not ropath.index:
+                continue
+
+            # For regular files the signature only records the
+            # length of the rsync signature as size
+            self.emit_record((
+                ropath.get_relative_path().decode("utf-8"),
+                ropath.type,
+                ropath.getmtime(),
+                ropath.getsize(),
+                ropath.mode
+                ))
+
+    def read_signatures(self, col_stats):
+        """Read all signature files that are newer than indexed_sigs
+
+        Every signature file is read once, the entries of a chain are
+        not combined.
+
+        :type col_stats: CollectionStatus object
+        :param col_stats: collection status
+        """
+        for sig_chain in col_stats.all_sig_chains or []:
+            start = sig_chain.start_time
+            last = self.indexed_sigs.get(start)
+
+            for filename in sig_chain.get_filenames():
+                pr = file_naming.parse(filename)
+                time = pr.time if pr.type == u"full-sig" else pr.end_time
+                if last is not None and time <= last:
+                    continue
+
+                if sig_chain.archive_dir_path:
+                    fileobj = path.DupPath(sig_chain.archive_dir_path.name,
+                                           (filename,)).filtered_open(u"rb")
+                else:
+                    fileobj = sig_chain.backend.get_fileobj_read(filename)
+
+                self.emit_record((start, time, None,
+                                  None, None, None, None))
+                for ropath in diffdir.sigtar2path_iter(fileobj):
+                    # Skip the root "."
+                    if not ropath.index:
+                        continue
+
+                    path_s = ropath.get_relative_path().decode("utf-8")
+                    if ropath.difftype == u"deleted":
+                        self.emit_record((start, time, path_s,
+                                          None, None, None, None))
+                    else:
+                        self.emit_record((start, time, path_s,
+                                          ropath.type,
+                                          ropath.getmtime(),
+                                          ropath.getsize(),
+                                          ropath.mode))
+
+    def get_restore_indexes(self):
+        """Indexes of the paths read by restore or verify
+
+        :return: Indexes, paths inside of other ones are dropped
+        :rtype: list
+        """
+        if self.restore_paths is None:
+            if config.restore_dir:
+                return [tuple(config.restore_dir.split(b"/"))]
+            return [()]
+
+        indexes = []
+        for index in sorted(tuple(util.fsencode(i).split(b"/"))
+                            for i in self.restore_paths):
+            if not indexes or index[:len(indexes[-1])] != indexes[-1]:
+                indexes.append(index)
+        return indexes
+
+    def plan_volumes(self, col_stats, indexes):
+        """Find the volumes containing the indexes at config.restore_time
+
+        :type col_stats: CollectionStatus object
+        :param col_stats: collection status
+        :param indexes: Indexes of the paths
+        :type indexes: list
+        :return: (backup set, manifest, volume numbers) per backup set
+                 in the order the sets are patched
+        :rtype: list
+        """
+        time = config.restore_time or dup_time.curtime
+        backup_chain = col_stats.get_backup_chain_at_time(time)
+        assert backup_chain, col_stats.all_backup_chains
+
+        plan = []
+        for backup_set in backup_chain.get_sets_at_time(time):
+            mf = backup_set.get_manifest()
+            volumes = set()
+            for index in indexes:
+                volumes.update(mf.get_containing_volumes(index))
+            plan.append((backup_set, mf, sorted(volumes)))
+        return plan
+
+    @contextlib.contextmanager
+    def reading_volumes(self, col_stats):
+        """Serve the volumes of a restore or verify from the volume
+        cache and download the missing ones ahead of time while the
+        context is active
+
+        :type col_stats: CollectionStatus object
+        :param col_stats: collection status
+        """
+        cache = self.get_volume_cache()
+        if cache is None:
+            with self.prefetching(col_stats):
+                yield
+            return
+
+        # The cache is checked before the prefetcher
+        with self.prefetching(col_stats, cache), cache.installed(config.backend):
+            yield
+
+        log.Info(_(u"Volume cache: %d hit(s), %d miss(es)")
+                 % (cache.hits, cache.misses))
+
+    @contextlib.contextmanager
+    def prefetching(self, col_stats, cache=None):
+        """Download the volumes of a restore or verify ahead of time
+        while the context is active
+
+        :type col_stats: CollectionStatus object
+        :param col_stats: collection status
+        :param cache: Volumes in the cache are not downloaded,
+                      defaults to None
+        :type cache: VolumeCache, optional
+        """
+        concurrency = self.get_restore_concurrency()
+        if (concurrency <= 1 or config.dry_run
+                or hasattr(config.backend, u"pre_process_download_batch")):
+            yield None
+            return
+
+        plan = self.plan_volumes(col_stats, self.get_restore_indexes())
+        prefetcher = VolumePrefetcher(
+                        self.config["Profiles"][self.current_profile]["Target"],
+                        [[backup_set.volume_name_dict[i] for i in volumes
+                          if not (cache and cache.contains(
+                                    backup_set.volume_name_dict[i]))]
+                         for backup_set, mf, volumes in plan],
+                        concurrency,
+                        monitor=self.monitor,
+                        sessions=self.backend_sessions)
+        try:
+            with prefetcher.installed(config.backend):
+                yield prefetcher
+        finally:
+            prefetcher.close()
+
+    def plan_restore(self, col_stats):
+        """Find the volumes a restore of restore_paths reads and the
+        bytes it downloads
+
+        Volumes in the volume cache are not downloaded. The sizes are
+        asked from the backend, backends that can not tell them count
+        as unknown.
+
+        :type col_stats: CollectionStatus object
+        :param col_stats: collection status
+        """
+        plan = self.plan_volumes(col_stats, self.get_restore_indexes())
+        names = [backup_set.volume_name_dict[i]
+                 for backup_set, mf, volumes in plan
+                 for i in volumes]
+
+        cache = self.get_volume_cache()
+        cached = set(i for i in names if cache and cache.contains(i))
+
+        missing = [i for i in names if i not in cached]
+        info = config.backend.query_info(missing) if missing else {}
+        sizes = [info[i][u"size"] for i in missing]
+        known = [i for i in sizes if i is not None and i >= 0]
+
+        self.plan = {
+            "volumes": len(names),
+            "cached": len(cached),
+            "bytes": sum(known),
+            "unknown": len(sizes) - len(known),
+            }
+
+    def restore_many(self, col_stats):
+        """Restore the paths in restore_paths below config.local_path
+
+        Only the volumes containing one of the paths are downloaded,
+        each of them once.
+
+        :type col_stats: CollectionStatus object
+        :param col_stats: collection status
+        """
+        indexes = self.get_restore_indexes()
+        selected = set(indexes)
+
+        def get_fileobj_iter(backup_set, mf, volumes):
+            for vol_num in volumes:
+                yield restore_get_enc_fileobj(backup_set.backend,
+                                              backup_set.volume_name_dict[vol_num],
+                                              mf.volume_info_dict[vol_num])
+
+        def get_root(index):
+            # Selected path containing index
+            for i in range(len(index), 0, -1):
+                if index[:i] in selected:
+                    return index[:i]
+            return None
+
+        def filter_selected(path_iter):
+            for ropath in path_iter:
+                if get_root(ropath.index):
+                    yield ropath
+
+        tarfiles = [patchdir.TarFile_FromFileobjs(get_fileobj_iter(*i))
+                    for i in self.plan_volumes(col_stats, indexes)]
+        rop_iter = patchdir.integrate_patch_iters(
+                        [filter_selected(patchdir.difftar2path_iter(t))
+                         for t in tarfiles])
+
+        def strip_root(root, ropaths):
+            for ropath in ropaths:
+                path_s = util.uindex(ropath.index)
+                ropath.index = ropath.index[len(root):]
+                yield ropath
+                if ropath.isreg():
+                    self.monitor.file_done(path_s)
+
+        # The paths of every selected root follow each other
+        found = set()
+        for root, ropaths in itertools.groupby(
+                                rop_iter, lambda rop: get_root(rop.index)):
+            found.add(root)
+            base_path = path.Path(os.path.join(config.local_path.name,
+                                               *root))
+
+            if base_path.exists() and not self.restore_force:
+                log.Warn(_(u"Restore destination %s already exists, "
+                           u"skipping %s") % (base_path.uc_name,
+                                              util.uindex(root)))
+                continue
+
+            os.makedirs(base_path.get_parent_dir().name, exist_ok=True)
+            patchdir.Write_ROPaths(base_path, strip_root(root, ropaths))
+
+        for index in indexes:
+            if index not in found:
+                log.Warn(_(u"%s not found in archive - not restored.")
+                         % util.uindex(index))
+
     def verify(self, col_stats):
         """Adapted from https://gitlab.com/duplicity/duplicity/
         Verify files, logging differences
 
+        Paths differ if their metadata differs, with --compare-data
+        also if the contents of regular files differ. The serial and
+        the parallel comparison find the same paths.
+
         @type col_stats: CollectionStatus object
         @param col_stats: collection status
 
@@ -486,13 +1714,64 @@ class actionHandler():
         diff_count = 0
         total_count = 0
         self.diff_f_list = {}
-        for backup_ropath, current_path in collated:
-            
-            if not backup_ropath:
-                backup_ropath = path.ROPath(current_path.index)
-            if not current_path:
-                current_path = path.ROPath(backup_ropath.index)
-            if not backup_ropath == current_path:
-                diff_count += 1
-                self.diff_f_list[util.uindex(backup_ropath.index)] = backup_ropath.type
-            total_count += 1
+
+        # The archive is a single stream and is read here, the Source
+        # files are read and hashed by the pool in the meantime
+        workers = self.get_verify_workers()
+        pool = None
+        if config.compare_data and workers > 1:
+            pool = ThreadPoolExecutor(max_workers=workers)
+
+        # (index, type, digest of the backup, future of the Source digest)
+        pending = collections.deque()
+
+        def add_diff(index, ftype):
+            nonlocal diff_count
+            diff_count += 1
+            self.diff_f_list[util.uindex(index)] = ftype
+
+        def resolve(index, ftype, digest, future):
+            try:
+                if future.result() != digest:
+                    add_diff(index, ftype)
+            except (IOError, OSError):
+                add_diff(index, ftype)
+
+        try:
+            for backup_ropath, current_path in collated:
+
+                if not backup_ropath:
+                    backup_ropath = path.ROPath(current_path.index)
+                if not current_path:
+                    current_path = path.ROPath(backup_ropath.index)
+                if not backup_ropath == current_path:
+                    add_diff(backup_ropath.index, backup_ropath.type)
+
+                elif config.compare_data and backup_ropath.isreg():
+                    if pool:
+                        future = pool.submit(hash_path, current_path.name)
+                        pending.append((backup_ropath.index,
+                                        backup_ropath.type,
+                                        hash_fileobj(backup_ropath.open(u"rb")),
+                                        future))
+
+                        # Don't run too far ahead of the Source reads
+                        while pending and (pending[0][3].done()
+                                           or len(pending) > 4 * workers):
+                            resolve(*pending.popleft())
+
+                    elif not backup_ropath.compare_data(current_path):
+                        add_diff(backup_ropath.index, backup_ropath.type)
+
+                total_count += 1
+
+            while pending:
+                resolve(*pending.popleft())
+
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+
+        log.Notice(_(u"Verify complete: %s, %s.") %
+                   (_(u"%d file(s) compared") % total_count,
+                    _(u"%d difference(s) found") % diff_count))
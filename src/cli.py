@@ -0,0 +1,519 @@
+"""Command line interface of Kyrian
+
+Without a command the GUI is started. The commands run a profile
+headless, e.g. from cron, and never import Qt. Duplicity is only
+imported once a command needs it.
+"""
+import argparse
+import os
+import signal
+import sys
+
+from kyrian.engine import JobError
+
+
+CONFIG_DIR = os.path.expanduser("~/.config/kyrian/")
+
+
+def make_parser():
+    """Create the argument parser
+
+    :return: The parser
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(
+                prog="kyrian",
+                description="Frontend for duplicity. "
+                            "Starts the GUI if no command is given."
+                )
+    parser.add_argument("--config-dir",
+                        default=CONFIG_DIR,
+                        help="Directory of config.yaml (default: %(default)s)")
+    parser.add_argument("--profiling",
+                        nargs="?",
+                        const="phases",
+                        choices=["phases", "cprofile"],
+                        help="Record time and memory per phase of every "
+                             "duplicity action, cprofile adds a cProfile "
+                             "dump. Written to the profiling directory next "
+                             "to config.yaml")
+
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    def add_command(name, func, help_text):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--profile",
+                             help="Profile to use (default: active profile)")
+        command.set_defaults(func=func)
+        return command
+
+    add_command("gui", run_gui, "start the GUI")
+
+    command = add_command("backup", run_backup,
+                          "make a snapshot of Source to Target")
+    command.add_argument("--progress",
+                         action="store_true",
+                         help="Print throughput and phase timings to stderr")
+    command.add_argument("--skip-unchanged",
+                         action="store_true",
+                         help="Make no snapshot if kyrian watch saw no "
+                              "change since the last backup")
+
+    add_command("watch", run_watch,
+                "journal the changes in Source for the next backup "
+                "(Linux, runs until interrupted)")
+
+    command = add_command("list", run_list,
+                          "list snapshots or the files of a snapshot")
+    command.add_argument("--time",
+                         help="List the files of the snapshot at this time "
+                              "(duplicity time string, e.g. now, 3D, "
+                              "2022-01-31T12:00:00)")
+
+    add_command("status", run_status, "show the state of the profile")
+
+    command = add_command("diff", run_diff,
+                          "list the paths that changed between two snapshots")
+    command.add_argument("time_a", help="Time of the first snapshot")
+    command.add_argument("time_b",
+                         nargs="?",
+                         help="Time of the second snapshot (default: latest)")
+
+    command = add_command("search", run_search,
+                          "find paths in all snapshots")
+    command.add_argument("pattern", help="Part of the path")
+
+    command = add_command("restore", run_restore,
+                          "restore a snapshot or a single path")
+    command.add_argument("--time",
+                         help="Restore the snapshot at this time "
+                              "(default: latest)")
+    command.add_argument("--file",
+                         action="append",
+                         help="Path relative to the backup root to restore, "
+                              "can be given several times to restore the "
+                              "paths below dest in one run")
+    command.add_argument("--force",
+                         action="store_true",
+                         help="Overwrite existing files at the destination")
+    command.add_argument("--progress",
+                         action="store_true",
+                         help="Print throughput and phase timings to stderr")
+    command.add_argument("--plan",
+                         action="store_true",
+                         help="Only print the volumes and bytes the restore "
+                              "would download")
+    command.add_argument("dest", help="Destination path")
+
+    return parser
+
+
+def get_handler(args):
+    """Create an actionHandler for the chosen profile
+
+    :param args: Parsed arguments
+    :type args: argparse.Namespace
+    :return: The handler
+    :rtype: actionHandler
+    """
+    from duplicity import log
+    from kyrian.actionHandler import actionHandler
+
+    log.setup()
+
+    handler = actionHandler(args.config_dir)
+
+    if args.profile:
+        if args.profile not in handler.config["Profiles"].keys():
+            print("Profile " + args.profile + " does not exist",
+                  file=sys.stderr)
+            sys.exit(2)
+        handler.current_profile = args.profile
+
+    return handler
+
+
+def print_progress(rec):
+    """Print progress records to stderr
+
+    :param rec: The record, see kyrian.progress
+    :type rec: dict
+    """
+    from kyrian.progress import format_record
+
+    if rec["kind"] != "phase":
+        print(format_record(rec), file=sys.stderr, flush=True)
+
+
+def resolve_time(handler, timestr):
+    """Get the time of the latest snapshot at or before a time string
+
+    :param handler: The handler
+    :type handler: actionHandler
+    :param timestr: Duplicity time string, None for the latest snapshot
+    :type timestr: str
+    :return: Timestamp of the snapshot or None if there is none
+    :rtype: int
+    """
+    from duplicity import dup_time
+
+    dup_time.setcurtime()
+    chain_d = handler.get_chains()
+
+    if timestr:
+        time = dup_time.genstrtotime(timestr)
+        times = [i for i in chain_d if i <= time]
+    else:
+        times = list(chain_d)
+
+    if not times:
+        return None
+    return max(times)
+
+
+def run_gui(args):
+    """Start the GUI
+
+    :param args: Parsed arguments
+    :type args: argparse.Namespace
+    :return: Exit code
+    :rtype: int
+    """
+    from duplicity import log
+    from duplicity import util
+
+    from PyQt6 import QtWidgets
+    from qt_material import apply_stylesheet
+
+    from kyrian.MainWindow import MainWindow
+
+    log.setup()
+    util.start_debugger()
+
+    app = QtWidgets.QApplication(sys.argv)
+    apply_stylesheet(app, theme='dark_lightgreen.xml')
+
+    stylesheet = app.styleSheet()
+
+    add_style = """
+                QDateEdit,
+                QDateTimeEdit,
+                QSpinBox,
+                QDoubleSpinBox,
+                QTreeView,
+                QListView,
+                QLineEdit,
+                QComboBox {
+                color: #8bc34a;
+                }
+    """
+
+    app.setStyleSheet(stylesheet + add_style + ".treeclass::item {color: None;}")
+    window = MainWindow(args.config_dir)
+    window.show()
+    app.aboutToQuit.connect(window.a.close_sessions)
+    app.aboutToQuit.connect(log.shutdown)
+
+    return app.exec()
+
+
+def run_backup(args):
+    """Make a snapshot of the profile
+
+    :param args: Parsed arguments
+    :type args: argparse.Namespace
+    :return: Exit code
+    :rtype: int
+    """
+    handler = get_handler(args)
+
+    if not handler.check_config(["Source", "Target"]):
+        print("Source and Target unspecified", file=sys.stderr)
+        return 2
+
+    if args.progress:
+        handler.set_progress_callback(print_progress)
+
+    if not handler.make_backup(skip_unchanged=args.skip_unchanged):
+        print("No changes since the last backup", file=sys.stderr)
+    return 0
+
+
+def run_watch(args):
+    """Journal the changes in the Source of the profile
+
+    :param args: Parsed arguments
+    :type args: argparse.Namespace
+    :return: Exit code
+    :rtype: int
+    """
+    from kyrian.config_helper import read_config
+    from kyrian.journal import ChangeJournal
+    from kyrian.watcher import Watcher, WatchError
+
+    cfg = read_config(os.path.join(args.config_dir, "config.yaml"))
+    profile = args.profile or cfg.get("Profile", "Default")
+
+    source = cfg.get("Profiles", {}).get(profile, {}).get("Source")
+    if not source:
+        print("Source of profile " + profile + " unspecified",
+              file=sys.stderr)
+        return 2
+
+    journal = ChangeJournal(os.path.join(args.config_dir, "journal.sqlite"))
+
+    if journal.get_watcher(profile) is not None:
+        print("Profile " + profile + " is already watched", file=sys.stderr)
+        return 1
+
+    # Unregister the watcher when stopped by the service manager
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        Watcher(source, journal, profile).run()
+    except WatchError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        journal.close()
+    return 0
+
+
+def run_list(args):
+    """Print the snapshots or the files of a snapshot
+
+    :param args: Parsed arguments
+    :type args: argparse.Namespace
+    :return: Exit code
+    :rtype: int
+    """
+    handler = get_handler(args)
+
+    if not args.time:
+        chain_d = handler.get_chains()
+        for i in sorted(chain_d):
+            btype, pretty, volumes = chain_d[i]
+            print("%s\t%s\t%d\t%d" % (pretty, btype, volumes, i))
+        return 0
+
+    time = resolve_time(handler, args.time)
+    if time is None:
+        print("No snapshot found", file=sys.stderr)
+        return 1
+
+    for path_s, ftype, mtime, size, mode in handler.get_files(time=time):
+        print("%s\t%s" % (ftype, path_s))
+    return 0
+
+
+def run_status(args):
+    """Print the configuration and the snapshots of the profile
+
+    :param args: Parsed arguments
+    :type args: argparse.Namespace
+    :return: Exit code
+    :rtype: int
+    """
+    handler = get_handler(args)
+    profile_cfg = handler.config["Profiles"][handler.current_profile]
+
+    print("Profile: " + handler.current_profile)
+    print("Source:  " + str(profile_cfg.get("Source")))
+    print("Target:  " + str(profile_cfg.get("Target")))
+
+    chain_d = handler.get_chains()
+    if not chain_d:
+        print("Snapshots: none")
+        return 0
+
+    full_times = [i for i in chain_d if chain_d[i][0] == _(u"Full")]
+    last = max(chain_d)
+
+    print("Snapshots: %d" % len(chain_d))
+    if full_times:
+        print("Last full backup: " + chain_d[max(full_times)][1])
+    print("Last backup: " + chain_d[last][1] + " (" + chain_d[last][0] + ")")
+    return 0
+
+
+def run_diff(args):
+    """Print added (+), removed (-) and changed (M) paths between two
+    snapshots
+
+    :param args: Parsed arguments
+    :type args: argparse.Namespace
+    :return: Exit code
+    :rtype: int
+    """
+    handler = get_handler(args)
+
+    time_a = resolve_time(handler, args.time_a)
+    time_b = resolve_time(handler, args.time_b)
+    if time_a is None or time_b is None:
+        print("No snapshot found", file=sys.stderr)
+        return 1
+
+    added, removed, changed = handler.get_snapshot_diff(time_a, time_b)
+    for mark, paths in [("+", added), ("-", removed), ("M", changed)]:
+        for path_s in paths:
+            print("%s\t%s" % (mark, path_s))
+    return 0
+
+
+def run_search(args):
+    """Print the paths containing a pattern and the snapshots they are in
+
+    :param args: Parsed arguments
+    :type args: argparse.Namespace
+    :return: Exit code
+    :rtype: int
+    """
+    from duplicity import dup_time
+
+    handler = get_handler(args)
+    handler.update_search_index()
+
+    results = handler.search(args.pattern)
+    for path_s, times in results:
+        print(path_s)
+        for i in reversed(times):
+            print("\t" + dup_time.timetopretty(i))
+    return 0 if results else 1
+
+
+def run_restore(args):
+    """Restore a snapshot or a path of it
+
+    :param args: Parsed arguments
+    :type args: argparse.Namespace
+    :return: Exit code
+    :rtype: int
+    """
+    handler = get_handler(args)
+
+    time = resolve_time(handler, args.time)
+    if time is None:
+        print("No snapshot found", file=sys.stderr)
+        return 1
+
+    if args.plan:
+        from kyrian.progress import format_plan
+
+        plan = handler.plan_recovery(time=time, files=args.file)
+        print(format_plan(plan))
+        return 0
+
+    if args.progress:
+        handler.set_progress_callback(print_progress)
+
+    if args.file and len(args.file) > 1:
+        handler.recover_many(args.dest,
+                             args.file,
+                             time=time,
+                             force=args.force)
+        return 0
+
+    handler.recover_files(args.dest,
+                          file=args.file[0] if args.file else None,
+                          time=time,
+                          force=args.force)
+    return 0
+
+
+def report_error(e):
+    """Log an exception like duplicity does and release the lockfile
+
+    :param e: The exception
+    :type e: Exception
+    """
+    import duplicity.errors
+
+    from duplicity import gpg
+    from duplicity import log
+    from duplicity import util
+
+    util.release_lockfile()
+
+    if isinstance(e, gpg.GPGError):
+        # For gpg errors, don't show an ugly stack trace by
+        # default. But do with sufficient verbosity.
+        log.Info((u"GPG error detail: %s")
+                 % util.exception_traceback())
+        log.FatalError(u"%s: %s" % (e.__class__.__name__, e.args[0]),
+                       log.ErrorCode.gpg_failed,
+                       e.__class__.__name__)
+
+    elif isinstance(e, duplicity.errors.UserError):
+        # For user errors, don't show an ugly stack trace by
+        # default. But do with sufficient verbosity.
+        log.Info(_(u"User error detail: %s")
+                 % util.exception_traceback())
+        log.FatalError(u"%s: %s" % (e.__class__.__name__, util.uexc(e)),
+                       log.ErrorCode.user_error,
+                       e.__class__.__name__)
+
+    elif isinstance(e, duplicity.errors.BackendException):
+        # For backend errors, don't show an ugly stack trace by
+        # default. But do with sufficient verbosity.
+        log.Info(_(u"Backend error detail: %s")
+                 % util.exception_traceback())
+        log.FatalError(u"%s: %s" % (e.__class__.__name__, util.uexc(e)),
+                       log.ErrorCode.user_error,
+                       e.__class__.__name__)
+
+    elif u"Forced assertion for testing" in util.uexc(e):
+        log.FatalError(u"%s: %s" % (e.__class__.__name__, util.uexc(e)),
+                       log.ErrorCode.exception,
+                       e.__class__.__name__)
+    else:
+        # Traceback and that mess
+        log.FatalError(util.exception_traceback(),
+                       log.ErrorCode.exception,
+                       e.__class__.__name__)
+
+
+def main(argv=None):
+    """Parse the command line and run the command
+
+    :param argv: Arguments, defaults to sys.argv[1:]
+    :type argv: list, optional
+    :return: Exit code
+    :rtype: int
+    """
+    args = make_parser().parse_args(argv)
+
+    if not args.command:
+        args.func = run_gui
+
+    # Job processes inherit the environment
+    if args.profiling:
+        os.environ["KYRIAN_PROFILE"] = args.profiling
+
+    try:
+        return args.func(args)
+
+    # Don't move this lower.  In order to get an exit
+    # status out of the system, you have to call the
+    # sys.exit() function.  Python handles this by
+    # raising the SystemExit exception.  Cleanup code
+    # goes here, if needed.
+    except SystemExit as e:
+        # No traceback, just get out
+        if "duplicity.util" in sys.modules:
+            sys.modules["duplicity.util"].release_lockfile()
+        return e.code
+
+    except KeyboardInterrupt:
+        # No traceback, just get out
+        if "duplicity.util" in sys.modules:
+            from duplicity import log
+            log.Info((u"INT intercepted...exiting."))
+            sys.modules["duplicity.util"].release_lockfile()
+        return 4
+
+    except Exception as e:
+        # Jobs already logged their errors in the child process
+        if isinstance(e, JobError):
+            print(e, file=sys.stderr)
+            return 1
+        report_error(e)
@@ -0,0 +1,49 @@
+"""Window showing the differences between two snapshots
+"""
+from PyQt6 import QtWidgets
+
+from duplicity import dup_time
+
+
+class SnapshotDiffWindow(QtWidgets.QWidget):
+    """Lists the added, removed and changed paths between two snapshots
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setWindowTitle("Compare Snapshots")
+
+        layout = QtWidgets.QVBoxLayout(self)
+
+        self.label = QtWidgets.QLabel(self)
+        layout.addWidget(self.label)
+
+        self.treeWidget = QtWidgets.QTreeWidget(self)
+        self.treeWidget.setHeaderLabels(["Path"])
+        self.treeWidget.setUniformRowHeights(True)
+        layout.addWidget(self.treeWidget)
+
+        self.resize(self.screen().availableSize() * 0.5)
+
+    def set_diff(self, time_a, time_b, result) -> None:
+        """Show the result of a comparison
+
+        :param time_a: Timestamp of the older backup
+        :type time_a: int
+        :param time_b: Timestamp of the newer backup
+        :type time_b: int
+        :param result: Lists of added, removed and changed paths
+        :type result: tuple
+        """
+        self.label.setText(dup_time.timetopretty(time_a)
+                           + "  →  "
+                           + dup_time.timetopretty(time_b))
+
+        self.treeWidget.clear()
+        for name, paths in zip(["Added", "Removed", "Changed"], result):
+            group = QtWidgets.QTreeWidgetItem(
+                                self.treeWidget,
+                                ["%s (%d)" % (name, len(paths))]
+                                )
+            group.addChildren([QtWidgets.QTreeWidgetItem([path_s])
+                               for path_s in paths])
@@ -0,0 +1,517 @@
+"""Run duplicity actions in child processes
+
+Duplicity keeps its configuration in module globals. Every job gets a
+process of its own, so jobs can not corrupt each other's configuration,
+independent jobs can run in parallel and a job is cancelled by killing
+its process.
+
+A job either starts a fresh process or runs in a session process of its
+Target. Session processes are reused by the next jobs of the Target and
+keep the connections of their backends open, see kyrian.sessions. An idle
+session process exits after its idle timeout.
+"""
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+import types
+
+
+# Number of records sent per message
+BATCH_SIZE = 5000
+
+# Records handed over at once by produced
+CHUNK_SIZE = 1000
+
+# Session processes are not reused in the last seconds of their idle
+# timeout, they may exit before they get the job
+SESSION_MARGIN = 5
+
+
+class JobError(Exception):
+    """A job failed in its child process
+    """
+
+
+class JobCancelled(Exception):
+    """A job was cancelled
+    """
+
+
+class StreamClosed(Exception):
+    """The consumer of produced records stopped reading
+    """
+
+
+def produced(func, *args, **kwargs):
+    """Iterate the records of a function while it runs in a thread
+
+    The function gets a callable that takes one record as its first
+    argument. Only a few chunks of records are buffered, the function
+    waits while the consumer is behind. If the consumer stops reading,
+    the next record raises StreamClosed in the function.
+
+    :param func: The function
+    :type func: callable
+    :return: Records
+    :rtype: generator
+    """
+    chunks = queue.Queue(maxsize=max(1, BATCH_SIZE // CHUNK_SIZE))
+    closed = threading.Event()
+    errors = []
+    done = object()
+
+    def put(item):
+        while not closed.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise StreamClosed()
+
+    def run():
+        chunk = []
+
+        def emit(record):
+            chunk.append(record)
+            if len(chunk) >= CHUNK_SIZE:
+                put(list(chunk))
+                chunk.clear()
+
+        try:
+            func(emit, *args, **kwargs)
+            if chunk:
+                put(chunk)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            try:
+                put(done)
+            except StreamClosed:
+                pass
+
+    thread = threading.Thread(target=run, name="records", daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            yield from chunk
+    finally:
+        closed.set()
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+def reopen_stdin() -> None:
+    """Give the child process a standard input again
+
+    multiprocessing closes sys.__stdin__ in the child, gpginterface of
+    duplicity duplicates the pipes of gpg onto its file descriptor.
+    """
+    sys.stdin = sys.__stdin__ = open(os.devnull)
+
+
+def call_handler(handler, out_queue, cfg, profile, method, args, kwargs,
+                 progress=False) -> bool:
+    """Call a method of an in-process actionHandler and send the result
+    back. Lists are streamed as batches of records.
+
+    :param handler: The handler
+    :type handler: kyrian.actionHandler.actionHandler
+    :param out_queue: Queue to the parent
+    :type out_queue: multiprocessing.Queue
+    :param cfg: Configuration of the parent handler
+    :type cfg: dict
+    :param profile: Name of the profile
+    :type profile: str
+    :param method: Name of the handler method to call
+    :type method: str
+    :param args: Positional arguments of the method
+    :type args: tuple
+    :param kwargs: Keyword arguments of the method
+    :type kwargs: dict
+    :param progress: Send progress records, defaults to False
+    :type progress: bool, optional
+    :return: Did the method succeed
+    :rtype: bool
+    """
+    try:
+        handler.config = cfg
+        handler.current_profile = profile
+
+        handler.set_progress_callback(
+            (lambda rec: out_queue.put(("progress", rec))) if progress
+            else None)
+
+        result = getattr(handler, method)(*args, **kwargs)
+
+        if isinstance(result, list):
+            for i in range(0, len(result), BATCH_SIZE):
+                out_queue.put(("records", result[i:i + BATCH_SIZE]))
+            out_queue.put(("end", None))
+
+        elif isinstance(result, types.GeneratorType):
+            # Send the records while the method produces them
+            batch = []
+            for record in result:
+                batch.append(record)
+                if len(batch) >= BATCH_SIZE:
+                    out_queue.put(("records", batch))
+                    batch = []
+            if batch:
+                out_queue.put(("records", batch))
+            out_queue.put(("end", None))
+        else:
+            out_queue.put(("result", result))
+        return True
+
+    except SystemExit as e:
+        # log.FatalError exits, the message is already logged
+        out_queue.put(("error", "duplicity exited with code %s" % (e.code,)))
+
+    except BaseException:
+        out_queue.put(("error", traceback.format_exc()))
+
+    return False
+
+
+def job_main(cfg_dir, cfg, profile, method, args, kwargs, out_queue,
+             progress=False):
+    """Entry point of the child process
+
+    Calls a method of a fresh in-process actionHandler and sends the
+    result back.
+
+    :param cfg_dir: Config directory of the handler
+    :type cfg_dir: str
+    :param cfg: Configuration of the parent handler
+    :type cfg: dict
+    :param profile: Name of the profile
+    :type profile: str
+    :param method: Name of the handler method to call
+    :type method: str
+    :param args: Positional arguments of the method
+    :type args: tuple
+    :param kwargs: Keyword arguments of the method
+    :type kwargs: dict
+    :param out_queue: Queue to the parent
+    :type out_queue: multiprocessing.Queue
+    :param progress: Send progress records, defaults to False
+    :type progress: bool, optional
+    """
+    try:
+        reopen_stdin()
+
+        from duplicity import log
+        from kyrian.actionHandler import actionHandler
+
+        log.setup()
+
+        handler = actionHandler(cfg_dir, isolate=False)
+    except BaseException:
+        out_queue.put(("error", traceback.format_exc()))
+        return
+
+    call_handler(handler, out_queue, cfg, profile, method, args, kwargs,
+                 progress)
+
+
+def session_main(cfg_dir, idle_timeout, requests, out_queue):
+    """Entry point of a session process
+
+    Runs the jobs sent by the parent one after the other with the same
+    in-process actionHandler, its backends stay open between the jobs.
+    Exits when it was idle for idle_timeout seconds, when the parent
+    stops it and after a failed job, its state is unknown.
+
+    :param cfg_dir: Config directory of the handler
+    :type cfg_dir: str
+    :param idle_timeout: Seconds to wait for the next job
+    :type idle_timeout: float
+    :param requests: Queue of the jobs, None to stop
+    :type requests: multiprocessing.Queue
+    :param out_queue: Queue to the parent
+    :type out_queue: multiprocessing.Queue
+    """
+    try:
+        reopen_stdin()
+
+        from duplicity import log
+        from kyrian.actionHandler import actionHandler
+        from kyrian.sessions import (BackendSessions, snapshot_config,
+                                     restore_config)
+
+        log.setup()
+
+        state = snapshot_config()
+        handler = actionHandler(cfg_dir, isolate=False)
+        handler.backend_sessions = BackendSessions(idle_timeout)
+    except BaseException:
+        out_queue.put(("error", traceback.format_exc()))
+        return
+
+    try:
+        while True:
+            try:
+                request = requests.get(timeout=idle_timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                break
+
+            # Every job starts with the configuration of a fresh process
+            restore_config(state)
+            if not call_handler(handler, out_queue, *request):
+                handler.discard_backend()
+                break
+
+            handler.backend_sessions.expire()
+    finally:
+        handler.backend_sessions.close()
+
+
+class Session():
+    """A session process that runs the jobs of a Target
+    """
+
+    def __init__(self, key, cfg_dir, idle_timeout) -> None:
+        """
+        :param key: Key of the session in the SessionPool
+        :type key: tuple
+        :param cfg_dir: Config directory of the handler
+        :type cfg_dir: str
+        :param idle_timeout: Seconds the process waits for the next job
+        :type idle_timeout: float
+        """
+        self.key = key
+        self.idle_timeout = idle_timeout
+
+        # Qt threads are running in the parent, don't fork it
+        ctx = multiprocessing.get_context("spawn")
+
+        self.requests = ctx.Queue()
+        self.queue = ctx.Queue()
+        self.process = ctx.Process(
+                            target=session_main,
+                            args=(cfg_dir, idle_timeout,
+                                  self.requests, self.queue),
+                            daemon=True
+                            )
+        self.process.start()
+
+        self.last_used = time.time()
+
+    def usable(self) -> bool:
+        """Can the session run another job
+
+        :rtype: bool
+        """
+        return (self.process.is_alive()
+                and time.time() - self.last_used
+                < self.idle_timeout - SESSION_MARGIN)
+
+    def submit(self, request) -> None:
+        """Send a job to the process
+
+        :param request: Arguments of call_handler after the queue
+        :type request: tuple
+        """
+        self.requests.put(request)
+
+    def stop(self) -> None:
+        """Let the process exit
+        """
+        if self.process.is_alive():
+            self.requests.put(None)
+
+
+class SessionPool():
+    """Idle session processes by config directory and Target
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+
+        # Idle sessions by key
+        self.idle = {}
+
+    def lease(self, cfg_dir, target, idle_timeout) -> Session:
+        """Get an idle session of a Target or start a new one
+
+        :param cfg_dir: Config directory of the handler
+        :type cfg_dir: str
+        :param target: Target url
+        :type target: str
+        :param idle_timeout: Seconds a session waits for the next job
+        :type idle_timeout: float
+        :rtype: Session
+        """
+        key = (cfg_dir, target, idle_timeout)
+        with self.lock:
+            sessions = self.idle.get(key, [])
+            while sessions:
+                session = sessions.pop()
+                if session.usable():
+                    return session
+                session.stop()
+
+        return Session(key, cfg_dir, idle_timeout)
+
+    def give_back(self, session) -> None:
+        """Keep the session of a finished job for the next jobs
+
+        :param session: The session
+        :type session: Session
+        """
+        session.last_used = time.time()
+        with self.lock:
+            self.idle.setdefault(session.key, []).append(session)
+
+    def close(self) -> None:
+        """Stop all idle sessions
+        """
+        with self.lock:
+            for sessions in self.idle.values():
+                for session in sessions:
+                    session.stop()
+            self.idle = {}
+
+
+class Job():
+    """A call of an actionHandler method in a child process
+    """
+
+    def __init__(self, cfg_dir, cfg, profile, method,
+                 args=(), kwargs=None, progress=None, session=None) -> None:
+        """
+        :param cfg_dir: Config directory of the handler
+        :type cfg_dir: str
+        :param cfg: Configuration of the handler
+        :type cfg: dict
+        :param profile: Name of the profile
+        :type profile: str
+        :param method: Name of the handler method to call
+        :type method: str
+        :param args: Positional arguments of the method
+        :type args: tuple, optional
+        :param kwargs: Keyword arguments of the method
+        :type kwargs: dict, optional
+        :param progress: Called with the progress records of the job,
+                         defaults to None
+        :type progress: callable, optional
+        :param session: Run in this session process instead of a fresh
+                        process, defaults to None
+        :type session: Session, optional
+        """
+        self.method = method
+        self.progress = progress
+        self.session = session
+
+        if session is None:
+            # Qt threads are running in the parent, don't fork it
+            ctx = multiprocessing.get_context("spawn")
+
+            self.queue = ctx.Queue()
+            self.process = ctx.Process(
+                                target=job_main,
+                                args=(cfg_dir, cfg, profile, method,
+                                      args, kwargs or {}, self.queue,
+                                      progress is not None),
+                                daemon=True
+                                )
+        else:
+            self.queue = session.queue
+            self.process = session.process
+            self.request = (cfg, profile, method, args, kwargs or {},
+                            progress is not None)
+
+        self.cancelled = False
+
+        # The job returned its result, a session can be reused
+        self.finished = False
+
+    def start(self) -> None:
+        """Start the child process or send the job to the session
+        """
+        if self.session is None:
+            self.process.start()
+        else:
+            self.session.submit(self.request)
+
+    def messages(self):
+        """Iterate the messages of the child until it finished
+
+        :raises JobCancelled: The job was cancelled
+        :raises JobError: The job failed
+        :return: (kind, data) tuples
+        :rtype: generator
+        """
+        while True:
+            if self.cancelled:
+                raise JobCancelled(self.method)
+
+            try:
+                kind, data = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                if not self.process.is_alive() and self.queue.empty():
+                    raise JobError("%s: process died with exit code %s"
+                                   % (self.method, self.process.exitcode))
+                continue
+
+            if kind == "error":
+                self.process.join()
+                raise JobError("%s: %s" % (self.method, data))
+
+            if kind == "progress":
+                if self.progress:
+                    self.progress(data)
+                continue
+
+            if kind in ("result", "end"):
+                self.finished = True
+                if self.session is None:
+                    self.process.join()
+
+            yield kind, data
+
+            if self.finished:
+                return
+
+    def records(self):
+        """Iterate the records of a list result as they arrive
+
+        :return: Records
+        :rtype: generator
+        """
+        for kind, data in self.messages():
+            if kind == "records":
+                yield from data
+
+    def result(self):
+        """Wait for the result of the job
+
+        :return: Return value of the method
+        """
+        records = []
+        for kind, data in self.messages():
+            if kind == "records":
+                records.extend(data)
+            elif kind == "end":
+                return records
+            elif kind == "result":
+                return data
+
+    def cancel(self) -> None:
+        """Kill the child process, unless the job already finished
+        """
+        self.cancelled = True
+        if not self.finished and self.process.is_alive():
+            self.process.kill()
@@ -0,0 +1,246 @@
+"""Persistent journal of the paths that changed in the Source
+
+`kyrian watch` watches the Source of a profile with inotify and writes
+every changed path to the journal. A backup that starts while the
+watcher is running only has to look at the journaled paths:
+
+    - the journal is empty, nothing changed since the last backup
+    - else only these paths are scanned, see kyrian.narrowing
+
+The journal can only be trusted if the watcher was running during the
+whole time since the last backup started and has read all events up to
+the start of the new backup. Otherwise get_changes returns None and the
+backup scans the whole Source as usual.
+
+Paths are bytes relative to the Source, b"" is the Source itself. A
+path is journaled as a single entry or, for directories that were
+created, moved or deleted, as a whole subtree.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+
+# Seconds between two flushes of the watcher
+HEARTBEAT = 2
+
+
+def pid_alive(pid) -> bool:
+    """Is a process running
+
+    :param pid: Process id
+    :type pid: int
+    :rtype: bool
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ChangeJournal():
+    """Keeps the changed paths of every profile in a local SQLite database
+    """
+
+    def __init__(self, db_path) -> None:
+        """
+        :param db_path: Path of the database file
+        :type db_path: str
+        """
+        self.db_path = db_path
+
+        # The handler is shared between worker threads
+        self.lock = threading.Lock()
+
+        # The watcher and backups write from different processes
+        self.con = sqlite3.connect(db_path, check_same_thread=False,
+                                   timeout=30)
+        self.con.execute("PRAGMA journal_mode = WAL")
+
+        with self.con:
+            # Running watcher per profile, since is the time from
+            # which on no event was lost
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS watchers (
+                    profile TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    pid INTEGER NOT NULL,
+                    since REAL NOT NULL,
+                    heartbeat REAL NOT NULL
+                )""")
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS changes (
+                    profile TEXT NOT NULL,
+                    path BLOB NOT NULL,
+                    subtree INTEGER NOT NULL,
+                    time REAL NOT NULL,
+                    PRIMARY KEY (profile, path)
+                )""")
+            # Start and snapshot time of the last backup per profile
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS backups (
+                    profile TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    started REAL NOT NULL,
+                    snapshot INTEGER
+                )""")
+
+    def start_watch(self, profile, source, since) -> None:
+        """Register the watcher of a profile
+
+        :param profile: Name of the profile
+        :type profile: str
+        :param source: Watched Source
+        :type source: str
+        :param since: Time from which on all changes are journaled
+        :type since: float
+        """
+        with self.lock, self.con:
+            self.con.execute(
+                """INSERT OR REPLACE INTO watchers
+                   (profile, source, pid, since, heartbeat)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (profile, source, os.getpid(), since, since))
+
+    def restart_watch(self, profile, since) -> None:
+        """Note that events were lost, e.g. by a queue overflow
+
+        :param profile: Name of the profile
+        :type profile: str
+        :param since: Time from which on all changes are journaled again
+        :type since: float
+        """
+        with self.lock, self.con:
+            self.con.execute(
+                "UPDATE watchers SET since = ? WHERE profile = ?",
+                (since, profile))
+
+    def stop_watch(self, profile) -> None:
+        """Unregister the watcher of a profile
+
+        :param profile: Name of the profile
+        :type profile: str
+        """
+        with self.lock, self.con:
+            self.con.execute(
+                "DELETE FROM watchers WHERE profile = ? AND pid = ?",
+                (profile, os.getpid()))
+
+    def get_watcher(self, profile):
+        """Get the running watcher of a profile
+
+        :param profile: Name of the profile
+        :type profile: str
+        :return: Source, pid, since and heartbeat or None
+        :rtype: tuple
+        """
+        with self.lock:
+            row = self.con.execute(
+                """SELECT source, pid, since, heartbeat FROM watchers
+                   WHERE profile = ?""",
+                (profile,)).fetchone()
+        if row is None or not pid_alive(row[1]):
+            return None
+        return row
+
+    def add_changes(self, profile, changes, heartbeat) -> None:
+        """Journal changed paths, called by the watcher after it read
+        all queued events
+
+        :param profile: Name of the profile
+        :type profile: str
+        :param changes: Subtree flag by changed path
+        :type changes: dict
+        :param heartbeat: Time before the events were read
+        :type heartbeat: float
+        """
+        with self.lock, self.con:
+            self.con.executemany(
+                """INSERT INTO changes (profile, path, subtree, time)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT (profile, path) DO UPDATE SET
+                       subtree = MAX(subtree, excluded.subtree),
+                       time = excluded.time""",
+                ((profile, path_b, int(subtree), heartbeat)
+                 for path_b, subtree in changes.items()))
+            self.con.execute(
+                "UPDATE watchers SET heartbeat = ? WHERE profile = ?",
+                (heartbeat, profile))
+
+    def get_changes(self, profile, source, started):
+        """Get the paths that changed since the last backup
+
+        Waits up to a few heartbeats for the watcher to read the events
+        that happened before the backup started.
+
+        :param profile: Name of the profile
+        :type profile: str
+        :param source: Source of the profile
+        :type source: str
+        :param started: Start time of the new backup
+        :type started: float
+        :return: Subtree flag by changed path and the snapshot time of
+                 the last backup, None if the journal is incomplete
+        :rtype: tuple
+        """
+        with self.lock:
+            last = self.con.execute(
+                "SELECT source, started, snapshot FROM backups "
+                "WHERE profile = ?",
+                (profile,)).fetchone()
+        if last is None or last[0] != source or last[2] is None:
+            return None
+
+        deadline = time.time() + 3 * HEARTBEAT
+        while True:
+            watcher = self.get_watcher(profile)
+            if watcher is None or watcher[0] != source:
+                return None
+
+            w_source, pid, since, heartbeat = watcher
+            if since > last[1]:
+                return None
+            if heartbeat >= started:
+                break
+            if time.time() > deadline:
+                return None
+            time.sleep(0.2)
+
+        with self.lock:
+            changes = {path_b: bool(subtree)
+                       for path_b, subtree in self.con.execute(
+                            """SELECT path, subtree FROM changes
+                               WHERE profile = ?""",
+                            (profile,))}
+        return changes, last[2]
+
+    def backup_done(self, profile, source, started, snapshot) -> None:
+        """Drop the changes a finished backup has seen
+
+        :param profile: Name of the profile
+        :type profile: str
+        :param source: Source of the profile
+        :type source: str
+        :param started: Start time of the backup
+        :type started: float
+        :param snapshot: Time of the new snapshot, None if unknown
+        :type snapshot: int
+        """
+        with self.lock, self.con:
+            self.con.execute(
+                "DELETE FROM changes WHERE profile = ? AND time < ?",
+                (profile, started))
+            self.con.execute(
+                """INSERT OR REPLACE INTO backups
+                   (profile, source, started, snapshot)
+                   VALUES (?, ?, ?, ?)""",
+                (profile, source, started, snapshot))
+
+    def close(self):
+        """Close the database
+        """
+        self.con.close()
@@ -0,0 +1,244 @@
+"""Compact in-memory listing of a snapshot
+
+A listing of millions of paths as tuples of Python objects needs
+several hundred bytes per path. CompactListing keeps one row per path
+in typed arrays instead:
+
+    name ids    index into the interned path elements
+    parents     row of the parent, -1 for top level paths
+    ends        row after the last path of the subtree
+    types       index into the type names
+    mtimes, sizes, modes
+    hashes      hash of the full path, for find
+
+Rows are in archive order, every directory is followed by its subtree.
+Full paths are only built when they are asked for. A path whose parent
+directory is not in the listing is attached to its nearest listed
+ancestor, its name then holds the missing path elements.
+"""
+from array import array
+
+
+class CompactListing():
+    """Array backed listing of (path, type, mtime, size, mode)
+    """
+
+    def __init__(self) -> None:
+        # Interned path elements and their ids
+        self.names = []
+        self.name_ids = {}
+
+        # Type names and their codes
+        self.type_names = []
+        self.type_codes = {}
+
+        self.name_col = array("I")
+        self.parents = array("i")
+        self.ends = array("i")
+        self.types = array("B")
+        self.mtimes = array("q")
+        self.sizes = array("q")
+        self.modes = array("i")
+        self.hashes = array("q")
+
+        # Open addressing table of row + 1 by path hash, built by find
+        self._slots = None
+
+        # Rows and paths of the directories that are still open while
+        # adding
+        self._stack = []
+        self._stack_paths = []
+
+    @classmethod
+    def from_records(cls, records):
+        """Create a listing
+
+        :param records: (path, type, mtime, size, mode) in archive order
+        :type records: iterable
+        :rtype: CompactListing
+        """
+        listing = cls()
+        listing.extend(records)
+        return listing
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def __iter__(self):
+        """Iterate the rows as (path, type, mtime, size, mode)
+        """
+        # Paths of the ancestors of the current row
+        stack = []
+        for row in range(len(self)):
+            parent = self.parents[row]
+            while stack and stack[-1][0] != parent:
+                stack.pop()
+
+            name = self.names[self.name_col[row]]
+            path_s = stack[-1][1] + "/" + name if stack else name
+            stack.append((row, path_s))
+
+            yield (path_s,
+                   self.type(row),
+                   self.mtimes[row],
+                   self.size(row),
+                   self.mode(row))
+
+    def _intern(self, name) -> int:
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.names.append(name)
+            self.name_ids[name] = name_id
+        return name_id
+
+    def add(self, path_s, ftype, mtime, size=None, mode=None) -> None:
+        """Append a path
+
+        :param path_s: Path relative to backup root
+        :type path_s: str
+        :param ftype: File type
+        :type ftype: str
+        :param mtime: Modification time
+        :type mtime: int
+        :param size: Size, defaults to None
+        :type size: int, optional
+        :param mode: Permissions, defaults to None
+        :type mode: int, optional
+        """
+        row = len(self)
+
+        # Close directories that are not ancestors of the new path
+        while (self._stack
+               and not path_s.startswith(self._stack_paths[-1] + "/")):
+            self.ends[self._stack.pop()] = row
+            self._stack_paths.pop()
+
+        if self._stack:
+            name = path_s[len(self._stack_paths[-1]) + 1:]
+        else:
+            name = path_s
+
+        type_code = self.type_codes.get(ftype)
+        if type_code is None:
+            type_code = len(self.type_names)
+            self.type_names.append(ftype)
+            self.type_codes[ftype] = type_code
+
+        self.name_col.append(self._intern(name))
+        self.parents.append(self._stack[-1] if self._stack else -1)
+        self.ends.append(row + 1)
+        self.types.append(type_code)
+        self.mtimes.append(mtime or 0)
+        self.sizes.append(-1 if size is None else size)
+        self.modes.append(-1 if mode is None else mode)
+        self.hashes.append(hash(path_s))
+
+        self._stack.append(row)
+        self._stack_paths.append(path_s)
+        self._slots = None
+
+    def extend(self, records) -> None:
+        """Append rows and close all directories afterwards
+
+        :param records: (path, type, mtime, size, mode) in archive order
+        :type records: iterable
+        """
+        for path_s, ftype, mtime, size, mode in records:
+            self.add(path_s, ftype, mtime, size, mode)
+        self.finish()
+
+    def finish(self) -> None:
+        """Close all open directories after the last path was added
+        """
+        while self._stack:
+            self.ends[self._stack.pop()] = len(self)
+        self._stack_paths = []
+
+    def name(self, row) -> str:
+        """Name of a row below its parent, the last path element unless
+        parent directories are missing from the listing
+        """
+        return self.names[self.name_col[row]]
+
+    def type(self, row) -> str:
+        return self.type_names[self.types[row]]
+
+    def mtime(self, row) -> int:
+        return self.mtimes[row]
+
+    def size(self, row):
+        size = self.sizes[row]
+        return None if size < 0 else size
+
+    def mode(self, row):
+        mode = self.modes[row]
+        return None if mode < 0 else mode
+
+    def path(self, row) -> str:
+        """Path of a row relative to the backup root
+
+        :param row: The row
+        :type row: int
+        :rtype: str
+        """
+        path_elements = []
+        while row >= 0:
+            path_elements.append(self.names[self.name_col[row]])
+            row = self.parents[row]
+        return "/".join(reversed(path_elements))
+
+    def _build_slots(self) -> None:
+        size = 1
+        while size < 2 * len(self):
+            size *= 2
+        mask = size - 1
+
+        slots = array("i", bytes(4 * size))
+        for row, path_hash in enumerate(self.hashes):
+            i = path_hash & mask
+            while slots[i]:
+                i = (i + 1) & mask
+            slots[i] = row + 1
+        self._slots = slots
+
+    def find(self, path_s):
+        """Find the row of a path
+
+        :param path_s: Path relative to backup root
+        :type path_s: str
+        :return: Row or None if the path is not in the listing
+        :rtype: int
+        """
+        if not len(self):
+            return None
+        if self._slots is None:
+            self._build_slots()
+
+        slots = self._slots
+        mask = len(slots) - 1
+        path_hash = hash(path_s)
+
+        i = path_hash & mask
+        while slots[i]:
+            row = slots[i] - 1
+            if self.hashes[row] == path_hash and self.path(row) == path_s:
+                return row
+            i = (i + 1) & mask
+        return None
+
+    def nbytes(self) -> int:
+        """Approximate memory of the listing in bytes
+
+        :rtype: int
+        """
+        columns = [self.name_col, self.parents, self.ends, self.types,
+                   self.mtimes, self.sizes, self.modes, self.hashes]
+        if self._slots is not None:
+            columns.append(self._slots)
+
+        size = sum(col.itemsize * len(col) for col in columns)
+
+        # Interned elements, their list and dict entries
+        size += sum(len(i) + 49 + 8 + 100 for i in self.names)
+        return size
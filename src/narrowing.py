@@ -0,0 +1,104 @@
+"""Incremental backups that only scan the journaled paths
+
+Duplicity compares the paths of the Source with the combined signature
+chain, unchanged paths produce nothing. narrowed_paths builds the path
+iterator of the Source from the signature chain instead of the disk:
+
+    - journaled entries and subtrees are read from the Source
+    - everything else is the entry of the signature chain itself and
+      therefore unchanged
+
+A narrowed include list would not work, duplicity would record all
+other paths as deleted.
+"""
+import heapq
+import io
+
+from duplicity import log
+from duplicity import util
+
+
+def to_index(path_b) -> tuple:
+    """Duplicity index of a path relative to the Source
+
+    :param path_b: The path, b"" for the Source itself
+    :type path_b: bytes
+    :rtype: tuple
+    """
+    return tuple(path_b.split(b"/")) if path_b else ()
+
+
+def scan_changes(select, changes) -> list:
+    """Read the journaled paths from the Source
+
+    :param select: Selection of the backup
+    :type select: duplicity.selection.Select
+    :param changes: Subtree flag by changed path
+    :type changes: dict
+    :return: Existing selected paths, sorted by index
+    :rtype: list
+    """
+    root = select.rootpath
+    found = {}
+
+    for path_b, subtree in changes.items():
+        stack = [root.new_index(to_index(path_b))]
+        while stack:
+            p = stack.pop()
+            if not p.type or p.index in found or not select.Select(p):
+                continue
+            found[p.index] = p
+
+            if subtree and p.isdir():
+                try:
+                    stack.extend(p.append(name) for name in p.listdir())
+                except OSError as e:
+                    log.Warn(_(u"Error listing directory %s: %s")
+                             % (p.uc_name, util.uexc(e)))
+    return [found[i] for i in sorted(found)]
+
+
+def narrowed_paths(select, sig_iter, changes):
+    """Iterate the Source like select, reading only the changed paths
+
+    Signature entries of changed paths are dropped, if they do not
+    exist anymore duplicity records them as deleted. Their signatures
+    are read right away, the signature chain is read ahead of the
+    comparison.
+
+    :param select: Selection of the backup
+    :type select: duplicity.selection.Select
+    :param sig_iter: Combined signature chain, its entries are also
+                     passed to duplicity as the signature iterator
+    :type sig_iter: iterator
+    :param changes: Subtree flag by changed path
+    :type changes: dict
+    :return: Paths in index order
+    :rtype: iterator
+    """
+    entries = set()
+    subtrees = set()
+    for path_b, subtree in changes.items():
+        (subtrees if subtree else entries).add(to_index(path_b))
+    subtree_lengths = sorted({len(i) for i in subtrees})
+
+    def changed(index):
+        if index in entries:
+            return True
+        return any(index[:n] in subtrees
+                   for n in subtree_lengths if n <= len(index))
+
+    def unchanged_sigs():
+        for sig_path in sig_iter:
+            if not sig_path.type:
+                continue
+
+            if changed(sig_path.index):
+                if sig_path.isreg() and sig_path.fileobj:
+                    # setfileobj refuses paths that already have one
+                    sig_path.fileobj = io.BytesIO(sig_path.fileobj.read())
+                continue
+            yield sig_path
+
+    return heapq.merge(unchanged_sigs(), scan_changes(select, changes),
+                       key=lambda p: p.index)
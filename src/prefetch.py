@@ -0,0 +1,198 @@
+"""Download the volumes of a restore ahead of the patch stage
+
+Duplicity downloads a volume only when the patch stage asks for it, so
+downloading and decrypting the volumes take turns. The prefetcher
+downloads the next volumes of every backup set with a pool of threads
+while the current volume is decrypted and patched. Every thread opens
+its own connection to the Target, the backends of duplicity are not
+thread safe.
+
+The volumes of the backup sets are read at the same time by the patch
+stage, every set gets its own window of volumes downloaded ahead.
+Volumes that were not planned are downloaded by the backend of
+duplicity as before.
+"""
+import collections
+import contextlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from duplicity import backend
+from duplicity import path
+from duplicity import tempdir
+
+
+class VolumePrefetcher():
+    """Downloads planned volumes with a pool of threads
+    """
+
+    def __init__(self, url, volumes, concurrency=4, ahead=None,
+                 monitor=None, sessions=None) -> None:
+        """
+        :param url: URL of the Target
+        :type url: str
+        :param volumes: Remote file names of the volumes per backup set
+                        in the order they are read
+        :type volumes: list
+        :param concurrency: Number of downloads at once, defaults to 4
+        :type concurrency: int, optional
+        :param ahead: Volumes downloaded ahead per backup set,
+                      defaults to concurrency
+        :type ahead: int, optional
+        :param monitor: Books the time waiting for downloads,
+                        defaults to None
+        :type monitor: kyrian.progress.ProgressMonitor, optional
+        :param sessions: Take the backends of the threads from this
+                         pool and return them afterwards,
+                         defaults to None
+        :type sessions: kyrian.sessions.BackendSessions, optional
+        """
+        self.url = url
+        self.ahead = ahead or concurrency
+        self.monitor = monitor
+        self.sessions = sessions
+
+        self.pool = ThreadPoolExecutor(max_workers=concurrency,
+                                       thread_name_prefix="prefetch")
+
+        # Backend of every download thread
+        self.local = threading.local()
+        self.backends = []
+        self.lock = threading.Lock()
+
+        # Volumes not yet submitted per backup set
+        self.queues = [collections.deque(names) for names in volumes]
+
+        # Submitted volumes: (future, temporary file, queue of the set)
+        self.futures = {}
+
+        # Volumes the backend of duplicity fetched itself
+        self.skipped = set()
+
+        for queue in self.queues:
+            for i in range(self.ahead):
+                self.submit_next(queue)
+
+    def get_backend(self):
+        """Backend of the calling thread
+
+        :rtype: duplicity.backend.BackendWrapper
+        """
+        be = getattr(self.local, "backend", None)
+        if be is None:
+            if self.sessions is None:
+                be = backend.get_backend(self.url)
+            else:
+                be = self.sessions.checkout(self.url)
+            self.local.backend = be
+            with self.lock:
+                self.backends.append(be)
+        return be
+
+    def download(self, filename, tmp) -> None:
+        self.get_backend().get(filename, path.Path(tmp))
+
+    def submit_next(self, queue) -> None:
+        """Start the download of the next volume of a backup set
+
+        :param queue: Volumes not yet submitted of the set
+        :type queue: collections.deque
+        """
+        while queue:
+            filename = queue.popleft()
+            if filename in self.skipped or filename in self.futures:
+                continue
+
+            tmp = tempdir.default().mktemp()
+            self.futures[filename] = (
+                    self.pool.submit(self.download, filename, tmp),
+                    tmp,
+                    queue)
+            return
+
+    def discard(self, tmp) -> None:
+        """Delete a temporary file of a download
+
+        :param tmp: Name of the file
+        :type tmp: bytes
+        """
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        tempdir.default().forget(tmp)
+
+    def get(self, filename, local_path) -> bool:
+        """Move a prefetched volume to local_path
+
+        Waits for the download if it did not finish yet and starts the
+        download of the next volume of the same backup set.
+
+        :param filename: Remote file name of the volume
+        :type filename: bytes
+        :param local_path: Destination of the volume
+        :type local_path: duplicity.path.Path
+        :return: False if the volume was not planned
+        :rtype: bool
+        """
+        entry = self.futures.pop(filename, None)
+        if entry is None:
+            self.skipped.add(filename)
+            return False
+
+        future, tmp, queue = entry
+        self.submit_next(queue)
+
+        wait = (self.monitor.phase(u"download") if self.monitor
+                else contextlib.nullcontext())
+        try:
+            with wait:
+                future.result()
+        except BaseException:
+            self.discard(tmp)
+            raise
+
+        os.rename(tmp, local_path.name)
+        tempdir.default().forget(tmp)
+        local_path.setdata()
+
+        if self.monitor:
+            self.monitor.add("bytes_downloaded", local_path.getsize())
+            self.monitor.report()
+        return True
+
+    @contextlib.contextmanager
+    def installed(self, be):
+        """Serve the downloads of a backend while the context is active
+
+        :param be: The backend wrapper of duplicity
+        :type be: duplicity.backend.BackendWrapper
+        """
+        get = be.get
+
+        def prefetched_get(remote_filename, local_path):
+            if not self.get(remote_filename, local_path):
+                return get(remote_filename, local_path)
+
+        be.get = prefetched_get
+        try:
+            yield self
+        finally:
+            be.get = get
+
+    def close(self) -> None:
+        """Stop the downloads and delete the volumes that were not used
+        """
+        for future, tmp, queue in self.futures.values():
+            future.cancel()
+        self.pool.shutdown(wait=True)
+
+        for future, tmp, queue in self.futures.values():
+            self.discard(tmp)
+        self.futures = {}
+
+        for be in self.backends:
+            if self.sessions is None:
+                be.close()
+            else:
+                self.sessions.checkin(be)
+        self.backends = []
@@ -0,0 +1,191 @@
+"""Opt-in profiling of the phases of a duplicity action
+
+Enabled with the environment variable KYRIAN_PROFILE, the profile
+option profiling or kyrian --profiling. The value "phases" (or any true
+value) records wall time, CPU time and peak memory per phase, "cprofile"
+also profiles the action with cProfile. Every action writes one JSON
+file to the profiling directory next to config.yaml:
+
+    {"action": ..., "profile": ..., "started": ..., "wall": ...,
+     "cpu": ..., "peak_rss_kb": ...,
+     "phases": [{"name", "depth", "wall", "cpu",
+                 "peak_rss_kb", "rss_growth_kb"}, ...],
+     "cprofile": [{"function", "calls", "primitive_calls",
+                   "tottime", "cumtime"}, ...]}
+
+The CPU time includes all threads of the process, cProfile only sees
+the thread running the action.
+"""
+import contextlib
+import cProfile
+import datetime
+import json
+import os
+import pstats
+import resource
+import sys
+import time
+
+
+# Functions of the cProfile dump, by cumulative time
+CPROFILE_TOP = 100
+
+
+def get_mode(profile_cfg):
+    """Profiling mode of a profile, the environment takes precedence
+
+    :param profile_cfg: Configuration of the profile
+    :type profile_cfg: dict
+    :return: "phases", "cprofile" or None if disabled
+    :rtype: str
+    """
+    value = os.environ.get("KYRIAN_PROFILE") or profile_cfg.get("profiling")
+    if not value or str(value).lower() in ("0", "false", "no", "off"):
+        return None
+    if str(value).lower() == "cprofile":
+        return "cprofile"
+    return "phases"
+
+
+def peak_rss_kb() -> int:
+    """Peak resident memory of the process in KiB
+
+    :rtype: int
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS
+    if sys.platform == "darwin":
+        peak //= 1024
+    return peak
+
+
+class PhaseProfiler():
+    """Records the phases of one action
+    """
+
+    def __init__(self, mode=None, action=None, profile=None) -> None:
+        """
+        :param mode: "phases", "cprofile" or None to record nothing,
+                     defaults to None
+        :type mode: str, optional
+        :param action: Name of the action, defaults to None
+        :type action: str, optional
+        :param profile: Name of the profile, defaults to None
+        :type profile: str, optional
+        """
+        self.mode = mode
+        self.action = action
+        self.profile = profile
+
+        self.phases = []
+        self.depth = 0
+
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+        self.cprofile = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Record a phase, phases may be nested
+
+        :param name: Name of the phase
+        :type name: str
+        """
+        if not self.mode:
+            yield
+            return
+
+        rec = {"name": name, "depth": self.depth}
+        self.phases.append(rec)
+
+        rss = peak_rss_kb()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            rec["wall"] = time.perf_counter() - wall
+            rec["cpu"] = time.process_time() - cpu
+            rec["peak_rss_kb"] = peak_rss_kb()
+            rec["rss_growth_kb"] = rec["peak_rss_kb"] - rss
+
+    @contextlib.contextmanager
+    def profiled(self):
+        """Run cProfile while the context is active in cprofile mode
+        """
+        if self.mode != "cprofile":
+            yield
+            return
+
+        self.cprofile = cProfile.Profile()
+        self.cprofile.enable()
+        try:
+            yield
+        finally:
+            self.cprofile.disable()
+
+    def cprofile_records(self) -> list:
+        """Functions of the cProfile dump with the highest cumulative time
+
+        :rtype: list
+        """
+        if self.cprofile is None:
+            return []
+
+        stats = pstats.Stats(self.cprofile)
+        records = []
+        for (filename, line, func), (primitive, calls, tottime, cumtime,
+                                     callers) in stats.stats.items():
+            records.append({
+                "function": "%s:%d(%s)" % (filename, line, func),
+                "calls": calls,
+                "primitive_calls": primitive,
+                "tottime": tottime,
+                "cumtime": cumtime,
+                })
+        records.sort(key=lambda rec: rec["cumtime"], reverse=True)
+        return records[:CPROFILE_TOP]
+
+    def report(self) -> dict:
+        """The recorded profile
+
+        :rtype: dict
+        """
+        return {
+            "action": self.action,
+            "profile": self.profile,
+            "started": self.started,
+            "wall": time.perf_counter() - self.start_wall,
+            "cpu": time.process_time() - self.start_cpu,
+            "peak_rss_kb": peak_rss_kb(),
+            "phases": self.phases,
+            "cprofile": self.cprofile_records(),
+            }
+
+    def write(self, directory):
+        """Write the profile to a new JSON file
+
+        :param directory: Directory of the profiles
+        :type directory: str
+        :return: Name of the file or None if profiling is disabled
+        :rtype: str
+        """
+        if not self.mode:
+            return None
+
+        os.makedirs(directory, exist_ok=True)
+        filename = os.path.join(
+                        directory,
+                        "%s-%s-%s-%d.json" % (
+                            self.started.replace(":", ""),
+                            self.profile,
+                            self.action,
+                            os.getpid()))
+        with open(filename, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        return filename
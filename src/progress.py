@@ -0,0 +1,359 @@
+"""Progress and throughput instrumentation of duplicity runs
+
+The monitor hooks into the volume writer, the backend and the log
+stream of duplicity and reports structured records to a callback:
+
+    {"kind": "phase", "phase": name, "state": "start" | "end", ...}
+    {"kind": "progress", ...}   at most once per interval
+    {"kind": "file", "path": path, ...}   a file was restored
+    {"kind": "summary", ...}    when the action finished
+
+Every record carries the counters and the accumulated seconds per phase.
+The phases tell what bounds a run:
+
+    collection-status   listing the Target and reading the local archive
+    sync_archive        syncing the local archive with the Target
+    scan                reading and diffing the Source (disk)
+    volume write        compressing/encrypting volumes (CPU/GPG)
+    upload, download    backend transfers (network)
+"""
+import contextlib
+import logging
+import threading
+import time
+
+from duplicity import diffdir
+from duplicity import gpg
+from duplicity import log
+
+
+def format_bytes(n) -> str:
+    """Human readable size
+
+    :param n: Number of bytes
+    :type n: int
+    :rtype: str
+    """
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if abs(n) < 1024 or unit == "TB":
+            break
+        n /= 1024
+    return "%.1f %s" % (n, unit)
+
+
+def format_record(rec) -> str:
+    """One line description of a progress record
+
+    :param rec: The record
+    :type rec: dict
+    :rtype: str
+    """
+    if rec["kind"] == "phase":
+        return "%s: %s %s" % (rec["action"], rec["phase"], rec["state"])
+
+    if rec["kind"] == "file":
+        return "%s: %s (%d files)" % (rec["action"],
+                                      rec["path"],
+                                      rec["files_restored"])
+
+    line = "%s: %s, %d files, %s read (%s/s), %d volumes, %s up (%s/s)" % (
+                rec["action"],
+                rec["phase"] or "-",
+                rec["files"],
+                format_bytes(rec["bytes_read"]),
+                format_bytes(rec["read_rate"]),
+                rec["volumes"],
+                format_bytes(rec["bytes_uploaded"]),
+                format_bytes(rec["upload_rate"]))
+
+    if rec["bytes_downloaded"]:
+        line += ", %s down (%s/s)" % (format_bytes(rec["bytes_downloaded"]),
+                                      format_bytes(rec["download_rate"]))
+    if rec["eta"] is not None:
+        line += ", ETA %ds" % rec["eta"]
+
+    if rec["kind"] == "summary":
+        line += "\n" + ", ".join("%s %.1fs" % (phase, seconds)
+                                 for phase, seconds in rec["phases"].items())
+    return line
+
+
+def format_plan(plan) -> str:
+    """One line description of a restore plan
+
+    :param plan: The plan, see actionHandler.plan_restore
+    :type plan: dict
+    :rtype: str
+    """
+    line = "%d volumes, %s to download" % (plan["volumes"],
+                                           format_bytes(plan["bytes"]))
+    if plan["cached"]:
+        line += ", %d cached" % plan["cached"]
+    if plan["unknown"]:
+        line += ", size of %d volumes unknown" % plan["unknown"]
+    return line
+
+
+class _TimedBlockIter():
+    """Proxy of a tarblock iterator that times the reads of the Source
+    """
+
+    def __init__(self, block_iter, monitor) -> None:
+        self._block_iter = block_iter
+        self._monitor = monitor
+
+    def __getattr__(self, name):
+        return getattr(self._block_iter, name)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.monotonic()
+        try:
+            block = next(self._block_iter)
+        finally:
+            self._monitor.add_time("scan", time.monotonic() - start)
+        self._monitor.add("bytes_read", len(block.data))
+        self._monitor.report()
+        return block
+
+
+class _LogHandler(logging.Handler):
+    """Pick up progress messages of duplicity
+    """
+
+    def __init__(self, monitor) -> None:
+        super().__init__()
+        self.monitor = monitor
+
+    def emit(self, record) -> None:
+        try:
+            fields = [int(i) for i in record.controlLine.split()]
+        except (AttributeError, ValueError):
+            return
+
+        if fields[0] == log.InfoCode.upload_progress and len(fields) >= 5:
+            # changed_bytes elapsed progress eta speed stalled
+            self.monitor.eta = fields[4]
+        elif fields[0] == log.InfoCode.progress and len(fields) >= 3:
+            # current total
+            self.monitor.total = (fields[1], fields[2])
+
+
+class ProgressMonitor():
+    """Collect timings and counters of one duplicity action
+    """
+
+    # Seconds between progress records
+    interval = 1.0
+
+    # Wrapped volume writers of the gpg module
+    writers = ["GPGWriteFile", "GzipWriteFile", "PlainWriteFile"]
+
+    def __init__(self, callback=None, action=None) -> None:
+        """
+        :param callback: Called with every record, defaults to None
+        :type callback: callable, optional
+        :param action: Name of the action, defaults to None
+        :type action: str, optional
+        """
+        self.callback = callback
+        self.action = action
+
+        self.lock = threading.Lock()
+
+        self.start = time.monotonic()
+        self.last_report = 0
+
+        # Innermost running phase
+        self.current = None
+
+        # Accumulated seconds per phase
+        self.phases = {}
+
+        self.counters = {
+            "bytes_read": 0,
+            "volumes": 0,
+            "bytes_uploaded": 0,
+            "bytes_downloaded": 0,
+            "files_restored": 0,
+            }
+
+        # Remaining seconds and (current, total) reported by duplicity
+        self.eta = None
+        self.total = None
+
+        self._saved = {}
+
+    def add(self, counter, n=1) -> None:
+        with self.lock:
+            self.counters[counter] += n
+
+    def add_time(self, phase, seconds) -> None:
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time a phase of the action
+
+        :param name: Name of the phase
+        :type name: str
+        """
+        outer = self.current
+        self.current = name
+        self.emit("phase", phase=name, state="start")
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.monotonic() - start)
+            self.current = outer
+            self.emit("phase", phase=name, state="end")
+
+    def record(self, kind, **kwargs) -> dict:
+        """Make a record of the current state
+
+        :param kind: Kind of the record
+        :type kind: str
+        :rtype: dict
+        """
+        elapsed = time.monotonic() - self.start
+
+        with self.lock:
+            rec = dict(self.counters)
+            rec["phases"] = dict(self.phases)
+
+        stats = diffdir.stats
+        rec["files"] = stats.SourceFiles if stats else 0
+
+        def rate(counter, phase):
+            seconds = rec["phases"].get(phase, 0)
+            if not seconds:
+                return 0
+            return rec[counter] / seconds
+
+        rec.update({
+            "kind": kind,
+            "action": self.action,
+            "phase": self.current,
+            "elapsed": elapsed,
+            "read_rate": rate("bytes_read", "scan"),
+            "upload_rate": rate("bytes_uploaded", "upload"),
+            "download_rate": rate("bytes_downloaded", "download"),
+            "files_rate": rec["files"] / elapsed if elapsed else 0,
+            "eta": self.eta,
+            "total": self.total,
+            })
+        rec.update(kwargs)
+        return rec
+
+    def emit(self, kind, **kwargs) -> None:
+        """Send a record to the callback
+
+        :param kind: Kind of the record
+        :type kind: str
+        """
+        if self.callback:
+            self.callback(self.record(kind, **kwargs))
+
+    def file_done(self, path_s) -> None:
+        """Report a restored file
+
+        :param path_s: Path relative to backup root
+        :type path_s: str
+        """
+        self.add("files_restored")
+        self.emit("file", path=path_s)
+
+    def report(self, force=False) -> None:
+        """Send a progress record if the last one is older than interval
+
+        :param force: Send it anyway, defaults to False
+        :type force: bool, optional
+        """
+        now = time.monotonic()
+        if force or now - self.last_report >= self.interval:
+            self.last_report = now
+            self.emit("progress")
+
+    def wrap_writer(self, writer):
+        """Time a volume writer of the gpg module
+
+        Time spent reading the Source is booked as scan, the rest
+        as volume write.
+        """
+        def timed_writer(block_iter, *args, **kwargs):
+            scanned = self.phases.get("scan", 0)
+            start = time.monotonic()
+            try:
+                return writer(_TimedBlockIter(block_iter, self),
+                              *args, **kwargs)
+            finally:
+                seconds = time.monotonic() - start
+                self.add_time("volume write",
+                              seconds - (self.phases.get("scan", 0) - scanned))
+                self.add("volumes")
+                self.report(force=True)
+        return timed_writer
+
+    def wrap_backend(self, backend) -> None:
+        """Time the transfers of a backend
+
+        :param backend: The backend wrapper of duplicity
+        :type backend: duplicity.backend.BackendWrapper
+        """
+        put, get = backend.put, backend.get
+
+        def timed_put(source_path, remote_filename=None):
+            size = source_path.getsize()
+            with self.phase("upload"):
+                result = put(source_path, remote_filename)
+            self.add("bytes_uploaded", size)
+            self.report()
+            return result
+
+        def timed_get(remote_filename, local_path):
+            with self.phase("download"):
+                result = get(remote_filename, local_path)
+            local_path.setdata()
+            if local_path.exists():
+                self.add("bytes_downloaded", local_path.getsize())
+            self.report()
+            return result
+
+        backend.put = timed_put
+        backend.get = timed_get
+
+    def install(self) -> None:
+        """Hook into duplicity
+        """
+        for name in self.writers:
+            self._saved[name] = getattr(gpg, name)
+            setattr(gpg, name, self.wrap_writer(self._saved[name]))
+
+        self._log_handler = _LogHandler(self)
+        logging.getLogger("duplicity").addHandler(self._log_handler)
+
+    def uninstall(self) -> None:
+        """Remove the hooks and send the summary
+        """
+        for name, writer in self._saved.items():
+            setattr(gpg, name, writer)
+        self._saved = {}
+
+        logging.getLogger("duplicity").removeHandler(self._log_handler)
+
+        self.emit("summary")
+
+    @contextlib.contextmanager
+    def installed(self):
+        """Hook into duplicity while the context is active
+        """
+        self.install()
+        try:
+            yield self
+        finally:
+            self.uninstall()
@@ -0,0 +1,174 @@
+"""Compare snapshot listings with the Source or with each other by
+metadata only
+
+The comparison follows the rules of duplicity's ROPath.__eq__ without
+reading any file contents: regular files, directories and fifos differ
+if their permissions or modification times differ, devices if their
+permissions differ. The listings do not contain the target of a link,
+links differ if their own modification time (lstat) differs, which
+changes when a link is retargeted. Sizes are not compared with the
+Source, the signatures only record the length of the rsync signature
+of a regular file.
+"""
+import os
+import stat
+
+from kyrian.listing import CompactListing
+
+
+def file_type(st_mode):
+    """Duplicity type name of a file
+
+    :param st_mode: Mode of os.stat
+    :type st_mode: int
+    :return: Type or None if duplicity does not back it up
+    :rtype: str
+    """
+    if stat.S_ISREG(st_mode):
+        return "reg"
+    if stat.S_ISDIR(st_mode):
+        return "dir"
+    if stat.S_ISLNK(st_mode):
+        return "sym"
+    if stat.S_ISFIFO(st_mode):
+        return "fifo"
+    if stat.S_ISCHR(st_mode):
+        return "chr"
+    if stat.S_ISBLK(st_mode):
+        return "blk"
+    return None
+
+
+def walk_source(root):
+    """Iterate all paths below root without following links
+
+    :param root: Root directory
+    :type root: str
+    :return: (path relative to root, type, mtime, mode)
+    :rtype: generator
+    """
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(root, rel_dir))
+        except OSError:
+            continue
+
+        with entries:
+            for entry in entries:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+
+                ftype = file_type(st.st_mode)
+                if ftype is None:
+                    continue
+
+                rel_path = (rel_dir + "/" + entry.name if rel_dir
+                            else entry.name)
+                if ftype == "dir":
+                    stack.append(rel_path)
+
+                yield (rel_path,
+                       ftype,
+                       int(st.st_mtime),
+                       stat.S_IMODE(st.st_mode))
+
+
+def differs(ftype, mtime, mode, other_mtime, other_mode) -> bool:
+    """Do two paths of the same type differ
+
+    :rtype: bool
+    """
+    if ftype in ("reg", "dir", "fifo"):
+        if mode != other_mode:
+            return True
+        if mtime == other_mtime:
+            return False
+        # Treat negative mtimes as equal to 0
+        return not (mtime <= 0 and other_mtime <= 0)
+
+    if ftype in ("chr", "blk"):
+        return mode != other_mode
+
+    if ftype == "sym":
+        return mtime != other_mtime and not (mtime <= 0 and other_mtime <= 0)
+
+    return False
+
+
+def quick_diff(listing, root):
+    """Find the paths that differ between a snapshot and the Source
+
+    :param listing: Snapshot listing, a CompactListing or an iterable of
+                    (path, type, mtime, size, mode)
+    :type listing: CompactListing
+    :param root: Source directory
+    :type root: str
+    :return: Differing paths and their type in the snapshot,
+             or in the Source for new paths
+    :rtype: dict
+    """
+    if not isinstance(listing, CompactListing):
+        listing = CompactListing.from_records(listing)
+
+    # Rows found in the Source
+    seen = bytearray(len(listing))
+
+    diff_d = {}
+    for path_s, ftype, mtime, mode in walk_source(root):
+        row = listing.find(path_s)
+        if row is None:
+            diff_d[path_s] = ftype
+            continue
+
+        seen[row] = 1
+        old_type = listing.type(row)
+        if old_type != ftype or differs(ftype,
+                                        listing.mtime(row),
+                                        listing.mode(row),
+                                        mtime,
+                                        mode):
+            diff_d[path_s] = old_type
+
+    # Rows not found were deleted in the Source
+    for row in range(len(listing)):
+        if not seen[row]:
+            diff_d[listing.path(row)] = listing.type(row)
+
+    return diff_d
+
+
+def compare_listings(old, new):
+    """Find the paths that differ between two snapshots
+
+    Regular files also differ if the length of their signature changed.
+
+    :param old: Listing of (path, type, mtime, size, mode) of the
+                older snapshot
+    :type old: iterable
+    :param new: Listing of the newer snapshot
+    :type new: iterable
+    :return: Lists of added, removed and changed paths
+    :rtype: tuple
+    """
+    old_d = {}
+    for path_s, ftype, mtime, size, mode in old:
+        old_d[path_s] = (ftype, mtime, size, mode)
+
+    added = []
+    changed = []
+    for path_s, ftype, mtime, size, mode in new:
+        prev = old_d.pop(path_s, None)
+        if prev is None:
+            added.append(path_s)
+        elif (prev[0] != ftype
+              or differs(ftype, prev[1], prev[3], mtime, mode)
+              or (ftype == "reg" and prev[2] != size)):
+            changed.append(path_s)
+
+    removed = list(old_d)
+
+    return added, removed, changed
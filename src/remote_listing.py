@@ -0,0 +1,72 @@
+"""Listing of the Target shared by the phases of an action
+
+collection-status and sync_archive both list the Target. While a
+RemoteListing is installed on the backend the Target is listed at most
+once per action, and a listing of an earlier action can be reused
+within the sync-ttl of the profile. If the listing and the local
+archive are unchanged since the last sync_archive, the sync is skipped.
+"""
+import contextlib
+import hashlib
+import os
+import time
+
+
+def local_fingerprint(directory) -> str:
+    """Hash of the file names of the local archive
+
+    :param directory: The archive dir of duplicity
+    :type directory: bytes
+    :rtype: str
+    """
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        names = []
+    return hashlib.sha1(b"\0".join(os.fsencode(i) for i in names)).hexdigest()
+
+
+class RemoteListing():
+    """Remembers the file names of the Target
+    """
+
+    def __init__(self, names=None) -> None:
+        """
+        :param names: Listing to use instead of listing the Target,
+                      defaults to None
+        :type names: list, optional
+        """
+        self.names = names
+
+        # Time the Target was listed, None if the listing was reused
+        self.listed = None
+
+    @contextlib.contextmanager
+    def installed(self, be):
+        """Serve the listings of a backend while the context is active
+
+        :param be: The backend wrapper of duplicity
+        :type be: duplicity.backend.BackendWrapper
+        """
+        list_files = be.list
+
+        def remembered_list():
+            if self.names is None:
+                self.listed = time.time()
+                self.names = list_files()
+            return list(self.names)
+
+        be.list = remembered_list
+        try:
+            yield self
+        finally:
+            be.list = list_files
+
+    def matches(self, names) -> bool:
+        """Are the same files on the Target as in an earlier listing
+
+        :param names: The earlier listing
+        :type names: list
+        :rtype: bool
+        """
+        return self.names is not None and sorted(self.names) == sorted(names)
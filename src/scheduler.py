@@ -0,0 +1,238 @@
+"""Scheduling of the worker threads of the GUI
+
+Every duplicity run of the GUI is submitted as a job. Pending jobs are
+started by priority and submission order as soon as they do not
+conflict with a running job:
+
+    - a worker thread runs one job at a time
+    - write jobs (backups) run alone on their Target
+    - read jobs (listings, restores, comparisons) share a Target
+
+A waiting write job is not overtaken by later jobs on its Target, so
+background reads can not starve a backup. The GUI thread never waits for a
+worker, finished workers start the next jobs through their signals.
+"""
+import itertools
+
+from PyQt6 import QtCore
+
+
+# Priorities, lower values run first
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+
+
+class ScheduledJob():
+    """A submitted run of a worker thread
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, worker, name, mode, priority, target,
+                 setup=None) -> None:
+        """
+        :param worker: The worker thread
+        :type worker: QtCore.QThread
+        :param name: Name shown in the status
+        :type name: str
+        :param mode: "read" or "write" access of the Target
+        :type mode: str
+        :param priority: INTERACTIVE, NORMAL or BACKGROUND
+        :type priority: int
+        :param target: Target url
+        :type target: str
+        :param setup: Called with the worker right before it starts,
+                      defaults to None
+        :type setup: callable, optional
+        """
+        self.id = next(self._ids)
+        self.worker = worker
+        self.name = name
+        self.mode = mode
+        self.priority = priority
+        self.target = target
+        self.setup = setup
+
+        # "pending", "running", "finished" or "cancelled"
+        self.state = "pending"
+
+    def conflicts(self, other) -> bool:
+        """Can this job not run at the same time as another one
+
+        :param other: A running job
+        :type other: ScheduledJob
+        :rtype: bool
+        """
+        if self.worker is other.worker:
+            return True
+        if self.target != other.target:
+            return False
+        return self.mode == "write" or other.mode == "write"
+
+
+class JobScheduler(QtCore.QObject):
+    """Queue of worker jobs with priorities and conflict rules
+    """
+
+    # Signals with the job
+    jobQueued = QtCore.pyqtSignal(object)
+    jobStarted = QtCore.pyqtSignal(object)
+    jobFinished = QtCore.pyqtSignal(object)
+    jobCancelled = QtCore.pyqtSignal(object)
+
+    # Signal that no job is pending or running
+    idle = QtCore.pyqtSignal()
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+        self.pending = []
+        self.running = []
+
+    def submit(self, worker, name, mode="read", priority=NORMAL,
+               target=None, setup=None) -> ScheduledJob:
+        """Queue a run of a worker
+
+        :param worker: The worker thread
+        :type worker: QtCore.QThread
+        :param name: Name shown in the status
+        :type name: str
+        :param mode: "read" or "write" access of the Target,
+                     defaults to "read"
+        :type mode: str, optional
+        :param priority: INTERACTIVE, NORMAL or BACKGROUND,
+                         defaults to NORMAL
+        :type priority: int, optional
+        :param target: Target url, defaults to None
+        :type target: str, optional
+        :param setup: Called with the worker right before it starts,
+                      set the parameters of the worker here,
+                      defaults to None
+        :type setup: callable, optional
+        :return: The job
+        :rtype: ScheduledJob
+        """
+        job = ScheduledJob(worker, name, mode, priority, target, setup)
+        self.pending.append(job)
+        self.pending.sort(key=lambda i: (i.priority, i.id))
+        self.jobQueued.emit(job)
+
+        self.dispatch()
+        return job
+
+    def dispatch(self) -> None:
+        """Start all pending jobs that can run
+        """
+        # Targets with a waiting write job
+        blocked = set()
+
+        for job in list(self.pending):
+            if job.target in blocked:
+                continue
+
+            if any(job.conflicts(i) for i in self.running):
+                if job.mode == "write":
+                    blocked.add(job.target)
+                continue
+
+            # The thread of an earlier job may still be finishing
+            if job.worker.isRunning():
+                QtCore.QTimer.singleShot(10, self.dispatch)
+                continue
+
+            self.pending.remove(job)
+            self.running.append(job)
+            job.state = "running"
+
+            if job.setup:
+                job.setup(job.worker)
+
+            job.worker.finished.connect(self._finished)
+            self.jobStarted.emit(job)
+            job.worker.start()
+
+        if not self.pending and not self.running:
+            self.idle.emit()
+
+    def _finished(self) -> None:
+        worker = self.sender()
+        worker.finished.disconnect(self._finished)
+
+        for job in list(self.running):
+            if job.worker is worker:
+                self.running.remove(job)
+                if job.state == "running":
+                    job.state = "finished"
+                    self.jobFinished.emit(job)
+                else:
+                    self.jobCancelled.emit(job)
+
+        self.dispatch()
+
+    def cancel(self, job) -> None:
+        """Cancel a job, running workers are asked to stop
+
+        :param job: The job
+        :type job: ScheduledJob
+        """
+        if job in self.pending:
+            self.pending.remove(job)
+            job.state = "cancelled"
+            self.jobCancelled.emit(job)
+            self.dispatch()
+
+        elif job in self.running and job.state == "running":
+            job.state = "cancelled"
+            job.worker.cancel()
+
+    def cancel_worker(self, worker) -> None:
+        """Cancel all jobs of a worker
+
+        :param worker: The worker thread
+        :type worker: QtCore.QThread
+        """
+        for job in self.pending + self.running:
+            if job.worker is worker:
+                self.cancel(job)
+
+    def cancel_all(self) -> None:
+        """Cancel all pending and running jobs
+        """
+        for job in self.pending + self.running:
+            self.cancel(job)
+
+    def is_active(self, worker) -> bool:
+        """Is a job of a worker pending or running
+
+        :param worker: The worker thread
+        :type worker: QtCore.QThread
+        :rtype: bool
+        """
+        return any(job.worker is worker
+                   for job in self.pending + self.running)
+
+    def is_pending(self, worker) -> bool:
+        """Is a job of a worker waiting to start
+
+        :param worker: The worker thread
+        :type worker: QtCore.QThread
+        :rtype: bool
+        """
+        return any(job.worker is worker for job in self.pending)
+
+    def busy(self) -> bool:
+        """Is any job pending or running
+
+        :rtype: bool
+        """
+        return bool(self.pending or self.running)
+
+    def status(self) -> str:
+        """Names of the running and pending jobs
+
+        :rtype: str
+        """
+        parts = [job.name for job in self.running]
+        parts += [job.name + " (queued)" for job in self.pending]
+        return ", ".join(parts)
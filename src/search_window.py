@@ -0,0 +1,88 @@
+"""Window to search paths in all snapshots
+"""
+from PyQt6 import QtWidgets
+
+from duplicity import dup_time
+
+from kyrian.scheduler import BACKGROUND
+from kyrian.workers import IndexWorker
+
+
+class SearchWindow(QtWidgets.QWidget):
+    """Search the paths of all snapshots of the current profile
+    """
+
+    def __init__(self, handler, scheduler, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setWindowTitle("Search")
+
+        self.handler = handler
+        self.scheduler = scheduler
+
+        layout = QtWidgets.QVBoxLayout(self)
+
+        self.lineEdit = QtWidgets.QLineEdit(self)
+        self.lineEdit.setPlaceholderText("Part of a path, e.g. reports/q3")
+        self.lineEdit.returnPressed.connect(self.search)
+        layout.addWidget(self.lineEdit)
+
+        self.label = QtWidgets.QLabel(self)
+        layout.addWidget(self.label)
+
+        self.treeWidget = QtWidgets.QTreeWidget(self)
+        self.treeWidget.setHeaderLabels(["Path", "Snapshots"])
+        self.treeWidget.setColumnWidth(0, 400)
+        layout.addWidget(self.treeWidget)
+
+        self.index_worker = IndexWorker(self.handler)
+        self.index_worker.indexReady.connect(self.post_index)
+        self.index_worker.failed.connect(self.show_failure)
+
+        self.resize(self.screen().availableSize() * 0.5)
+
+    def showEvent(self, a0) -> None:
+        """Bring the index up to date before searching
+        """
+        if not self.scheduler.is_active(self.index_worker):
+            self.lineEdit.setEnabled(False)
+            self.label.setText("Indexing snapshots...")
+            self.scheduler.submit(self.index_worker, "Indexing snapshots",
+                                  priority=BACKGROUND,
+                                  target=self.handler.get_target())
+
+        return super().showEvent(a0)
+
+    def show_failure(self, message: str) -> None:
+        """Show the error of a failed index update, the index of the
+        earlier updates can still be used
+
+        :param message: The error message
+        :type message: str
+        """
+        QtWidgets.QMessageBox.warning(self, "Kyrian", message)
+
+    def post_index(self) -> None:
+        """Enable searching once the index is up to date
+        """
+        self.lineEdit.setEnabled(True)
+        self.lineEdit.setFocus()
+        self.label.setText("")
+
+    def search(self) -> None:
+        """Show the paths that contain the text of the line edit
+        """
+        pattern = self.lineEdit.text()
+        self.treeWidget.clear()
+        if not pattern:
+            return
+
+        results = self.handler.search(pattern)
+        self.label.setText("%d paths found" % len(results))
+
+        for path_s, times in results:
+            item = QtWidgets.QTreeWidgetItem(self.treeWidget,
+                                             [path_s, str(len(times))])
+            item.addChildren([
+                QtWidgets.QTreeWidgetItem(["", dup_time.timetopretty(i)])
+                for i in reversed(times)
+                ])
@@ -0,0 +1,225 @@
+"""Backend sessions kept open between the actions of a job process
+
+Duplicity creates a backend for every action and closes it at the end,
+for sftp, ftp or WebDAV Targets every action pays a new connection and
+authentication. A session process of kyrian.engine runs the actions of
+one Target one after the other and keeps the backends in a
+BackendSessions pool:
+
+    - commandline.ProcessCommandLine gets an idle backend of the URL
+      instead of a new one, see installed
+    - the backend is checked in again after the action, hooks of the
+      action on the backend are removed
+    - a backend that was idle longer than the idle timeout or fails its
+      health check is closed and replaced by a new one
+
+Duplicity keeps its configuration in module globals, snapshot_config and
+restore_config give every action of a session process the configuration
+of a fresh process.
+"""
+import contextlib
+import copy
+import select
+import socket
+import threading
+import time
+import types
+
+from duplicity import backend
+from duplicity import config
+from duplicity import log
+
+
+# Seconds a backend may be idle before it is closed
+IDLE_TIMEOUT = 300
+
+
+def socket_alive(sock) -> bool:
+    """Is a connected socket still open on the other side
+
+    :param sock: The socket
+    :type sock: socket.socket
+    :rtype: bool
+    """
+    try:
+        readable, _w, _x = select.select([sock], [], [], 0)
+        if not readable:
+            return True
+        # Readable while idle means closed or an unexpected response
+        return bool(sock.recv(1, socket.MSG_PEEK))
+    except (OSError, ValueError):
+        return False
+
+
+def healthy(be) -> bool:
+    """Health check of an idle backend
+
+    Knows the connections of the paramiko ssh backends and of the WebDAV
+    backend, other backends are assumed to be healthy. Their errors are
+    still handled by the retries of duplicity.
+
+    :param be: The backend wrapper of duplicity
+    :type be: duplicity.backend.BackendWrapper
+    :rtype: bool
+    """
+    inner = getattr(be, "backend", None)
+
+    # ssh_paramiko_backend
+    client = getattr(inner, "client", None)
+    if client is not None and hasattr(client, "get_transport"):
+        transport = client.get_transport()
+        return transport is not None and transport.is_active()
+
+    # webdavbackend, a closed keep alive connection would only fail
+    # after the retry delay of duplicity
+    conn = getattr(inner, "conn", None)
+    sock = getattr(conn, "sock", None)
+    if sock is not None:
+        return socket_alive(sock)
+
+    return True
+
+
+def snapshot_config() -> dict:
+    """Copy the configuration of duplicity
+
+    :return: Value by name of the config module
+    :rtype: dict
+    """
+    return {name: value for name, value in vars(config).items()
+            if not name.startswith("__")
+            and not isinstance(value, (types.ModuleType, types.FunctionType,
+                                       type))}
+
+
+def restore_config(state) -> None:
+    """Reset the configuration of duplicity
+
+    :param state: Result of snapshot_config
+    :type state: dict
+    """
+    for name, value in state.items():
+        try:
+            value = copy.deepcopy(value)
+        except Exception:
+            pass
+        setattr(config, name, value)
+
+
+class BackendSessions():
+    """Pool of open backends by URL
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT) -> None:
+        """
+        :param idle_timeout: Seconds a backend may be idle,
+                             defaults to IDLE_TIMEOUT
+        :type idle_timeout: float, optional
+        """
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+
+        # get_backend of duplicity, also while installed replaces it
+        self.create_backend = backend.get_backend
+
+        # Idle backends by URL: list of (backend, idle since)
+        self.idle = {}
+
+        # URL by id of the checked out backends
+        self.busy = {}
+
+        # Attribute names of every backend when it was created, later
+        # ones are hooks of an action
+        self.hooks = {}
+
+    def checkout(self, url):
+        """Get an open backend of a URL
+
+        :param url: URL of the Target
+        :type url: str
+        :return: The backend wrapper
+        :rtype: duplicity.backend.BackendWrapper
+        """
+        now = time.time()
+        with self.lock:
+            sessions = self.idle.get(url, [])
+            while sessions:
+                be, since = sessions.pop()
+                if now - since < self.idle_timeout and healthy(be):
+                    self.busy[id(be)] = url
+                    log.Info(_(u"Reusing the connection to %s") % url)
+                    return be
+                self.close_backend(be)
+
+        be = self.create_backend(url)
+        if be is not None:
+            with self.lock:
+                self.busy[id(be)] = url
+                self.hooks[id(be)] = set(vars(be))
+        return be
+
+    def checkin(self, be) -> None:
+        """Return a backend to the pool
+
+        :param be: A checked out backend
+        :type be: duplicity.backend.BackendWrapper
+        """
+        with self.lock:
+            url = self.busy.pop(id(be), None)
+            if url is None:
+                return
+
+            # Drop the hooks the action installed on the backend
+            for name in set(vars(be)) - self.hooks[id(be)]:
+                delattr(be, name)
+
+            self.idle.setdefault(url, []).append((be, time.time()))
+
+    def discard(self, be) -> None:
+        """Close a checked out backend that may be broken
+
+        :param be: A checked out backend
+        :type be: duplicity.backend.BackendWrapper
+        """
+        with self.lock:
+            if self.busy.pop(id(be), None) is not None:
+                self.close_backend(be)
+
+    def close_backend(self, be) -> None:
+        self.hooks.pop(id(be), None)
+        try:
+            be.close()
+        except Exception as e:
+            log.Warn(_(u"Closing a backend failed: %s") % e)
+
+    def expire(self) -> None:
+        """Close the backends that were idle too long
+        """
+        now = time.time()
+        with self.lock:
+            for url, sessions in self.idle.items():
+                for be, since in sessions:
+                    if now - since >= self.idle_timeout:
+                        self.close_backend(be)
+                self.idle[url] = [(be, since) for be, since in sessions
+                                  if now - since < self.idle_timeout]
+
+    def close(self) -> None:
+        """Close all idle backends
+        """
+        with self.lock:
+            for sessions in self.idle.values():
+                for be, since in sessions:
+                    self.close_backend(be)
+            self.idle = {}
+
+    @contextlib.contextmanager
+    def installed(self):
+        """Serve backend.get_backend from the pool while the context is
+        active, used around commandline.ProcessCommandLine
+        """
+        backend.get_backend = self.checkout
+        try:
+            yield self
+        finally:
+            backend.get_backend = self.create_backend
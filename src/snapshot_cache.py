@@ -0,0 +1,148 @@
+"""Memory bounded cache of the trees of visited snapshots
+
+The GUI keeps the path table, the listing and the differences of a
+snapshot so that switching back to it does not read the signatures or
+the Source again. Entries are evicted least recently used first once
+their estimated size exceeds the budget. An evicted snapshot is built
+again by the TreeWorker when it is selected, its listing then comes
+from the local index.
+"""
+import collections
+import itertools
+import sys
+
+
+# Estimated bytes per highlighted row and per differing path without
+# the path string itself
+HIGHLIGHT_ROW_BYTES = 60
+DIFF_ROW_BYTES = 120
+
+# Differing paths sampled for the average path length
+SAMPLE_ROWS = 100
+
+
+def estimate_size(table, files_l, diff_l) -> int:
+    """Estimated memory of a cache entry in bytes
+
+    :param table: Path table, a view of files_l
+    :type table: kyrian.tree_model.PathTable
+    :param files_l: Listing of the snapshot
+    :type files_l: kyrian.listing.CompactListing
+    :param diff_l: Differing paths and their types
+    :type diff_l: dict
+    :rtype: int
+    """
+    size = 0
+
+    if files_l is not None:
+        size += files_l.nbytes()
+
+    if table is not None:
+        size += len(table.highlighted) * HIGHLIGHT_ROW_BYTES
+
+    if diff_l:
+        sample = list(itertools.islice(diff_l, SAMPLE_ROWS))
+        path_bytes = sum(sys.getsizeof(i) for i in sample) // len(sample)
+        size += len(diff_l) * (DIFF_ROW_BYTES + path_bytes)
+
+    return size
+
+
+class SnapshotCache():
+    """LRU cache of the trees of snapshots
+    """
+
+    Entry = collections.namedtuple(
+                "Entry", ["table", "files_l", "diff_l", "diff_mode", "size"])
+
+    def __init__(self, max_bytes) -> None:
+        """
+        :param max_bytes: Budget of all entries
+        :type max_bytes: int
+        """
+        self.max_bytes = max_bytes
+
+        # Entries by key, least recently used first
+        self.entries = collections.OrderedDict()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key):
+        """Get the entry of a snapshot
+
+        :param key: Key of the snapshot
+        :type key: hashable
+        :return: The entry or None
+        :rtype: SnapshotCache.Entry
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, table, files_l, diff_l, diff_mode) -> None:
+        """Add or replace the entry of a snapshot and evict old entries
+
+        :param key: Key of the snapshot
+        :type key: hashable
+        :param table: Path table
+        :type table: kyrian.tree_model.PathTable
+        :param files_l: Listing of the snapshot
+        :type files_l: kyrian.listing.CompactListing
+        :param diff_l: Differing paths, None if not compared
+        :type diff_l: dict
+        :param diff_mode: Comparison of diff_l, "quick", "deep" or False
+        :type diff_mode: str
+        """
+        self.discard(key)
+
+        entry = self.Entry(table, files_l, diff_l, diff_mode,
+                           estimate_size(table, files_l, diff_l))
+        self.entries[key] = entry
+        self.size += entry.size
+
+        # The newest entry stays even if it alone exceeds the budget
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            old_key, old_entry = self.entries.popitem(last=False)
+            self.size -= old_entry.size
+            self.evictions += 1
+
+    def discard(self, key) -> None:
+        """Remove the entry of a snapshot if there is one
+
+        :param key: Key of the snapshot
+        :type key: hashable
+        """
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def clear(self) -> None:
+        """Remove all entries
+        """
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        """Counters of the cache
+
+        :rtype: dict
+        """
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            }
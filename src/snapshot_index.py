@@ -0,0 +1,603 @@
+"""Persistent index of snapshot file listings and of the changes
+recorded in the signature chains
+"""
+import sqlite3
+import threading
+
+
+# Events written in one transaction by add_events
+EVENT_CHUNK = 10000
+
+
+class SnapshotIndex():
+    """Keeps the file listings of snapshots in a local SQLite database
+
+    Snapshots never change once they are written, so the listing of a
+    snapshot only has to be read from the signature chain once. Entries
+    are keyed by target url and backup time.
+
+    For searching all snapshots the entries of every signature file are
+    kept as events: the state of a path from the time of a signature
+    file on, type NULL if it was deleted. A path exists in a snapshot
+    if its latest event in the chain at the snapshot time is not a
+    deletion.
+    """
+
+    # Bump if the tables change, old databases are rebuilt
+    schema_version = 2
+
+    # Tables in the order they can be dropped
+    tables = ["syncs", "scans", "backup_sets", "events", "sigs", "chains",
+              "paths_fts", "paths", "files", "snapshots"]
+
+    def __init__(self, db_path) -> None:
+        """
+        :param db_path: Path of the database file
+        :type db_path: str
+        """
+        self.db_path = db_path
+
+        # The handler is shared between worker threads
+        self.lock = threading.Lock()
+
+        # Job processes write the sync state while the GUI reads
+        self.con = sqlite3.connect(db_path, check_same_thread=False,
+                                   timeout=30)
+        self.con.execute("PRAGMA journal_mode = WAL")
+        self.con.execute("PRAGMA foreign_keys = ON")
+
+        version = self.con.execute("PRAGMA user_version").fetchone()[0]
+
+        with self.con:
+            # The index only caches the signature chain, so outdated
+            # tables are dropped instead of migrated
+            if version != self.schema_version:
+                for table in self.tables:
+                    self.con.execute("DROP TABLE IF EXISTS " + table)
+                self.con.execute("PRAGMA user_version = %d"
+                                 % self.schema_version)
+
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    id INTEGER PRIMARY KEY,
+                    target TEXT NOT NULL,
+                    time INTEGER NOT NULL,
+                    UNIQUE (target, time)
+                )""")
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    snapshot INTEGER NOT NULL
+                        REFERENCES snapshots(id) ON DELETE CASCADE,
+                    path TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    mtime INTEGER,
+                    size INTEGER,
+                    mode INTEGER
+                )""")
+            self.con.execute("""
+                CREATE INDEX IF NOT EXISTS files_snapshot
+                    ON files(snapshot)""")
+
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS paths (
+                    id INTEGER PRIMARY KEY,
+                    target TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    UNIQUE (target, path)
+                )""")
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS chains (
+                    id INTEGER PRIMARY KEY,
+                    target TEXT NOT NULL,
+                    start INTEGER NOT NULL,
+                    UNIQUE (target, start)
+                )""")
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS sigs (
+                    chain INTEGER NOT NULL
+                        REFERENCES chains(id) ON DELETE CASCADE,
+                    time INTEGER NOT NULL,
+                    PRIMARY KEY (chain, time)
+                )""")
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS events (
+                    chain INTEGER NOT NULL
+                        REFERENCES chains(id) ON DELETE CASCADE,
+                    time INTEGER NOT NULL,
+                    path INTEGER NOT NULL REFERENCES paths(id),
+                    type TEXT,
+                    mtime INTEGER,
+                    size INTEGER,
+                    mode INTEGER
+                )""")
+            self.con.execute("""
+                CREATE INDEX IF NOT EXISTS events_path
+                    ON events(path, chain, time)""")
+
+            # Backup sets of the last collection-status per target
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS backup_sets (
+                    target TEXT NOT NULL,
+                    time INTEGER NOT NULL,
+                    type TEXT NOT NULL,
+                    pretty TEXT NOT NULL,
+                    volumes INTEGER NOT NULL,
+                    PRIMARY KEY (target, time)
+                )""")
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS scans (
+                    target TEXT PRIMARY KEY,
+                    time INTEGER NOT NULL
+                )""")
+
+            # Listing of the Target at the last sync of the local archive
+            # and the file names of the archive afterwards
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS syncs (
+                    target TEXT PRIMARY KEY,
+                    time REAL NOT NULL,
+                    remote BLOB NOT NULL,
+                    local TEXT NOT NULL
+                )""")
+
+        # Trigram index of the paths if SQLite supports it
+        try:
+            with self.con:
+                self.con.execute("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS paths_fts
+                        USING fts5(path, tokenize = 'trigram')""")
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False
+
+    def get_snapshot_id(self, target, time):
+        """Get the row id of an indexed snapshot
+
+        :param target: Target url
+        :type target: str
+        :param time: Timestamp of the backup
+        :type time: int
+        :return: Row id or None if the snapshot is not indexed
+        :rtype: int
+        """
+        row = self.con.execute(
+            "SELECT id FROM snapshots WHERE target = ? AND time = ?",
+            (target, time)).fetchone()
+        if row:
+            return row[0]
+        return None
+
+    def has_listing(self, target, time):
+        """Is the listing of a snapshot indexed
+
+        :param target: Target url
+        :type target: str
+        :param time: Timestamp of the backup
+        :type time: int
+        :rtype: bool
+        """
+        with self.lock:
+            return self.get_snapshot_id(target, time) is not None
+
+    def get_listing(self, target, time, into=None):
+        """Get the indexed listing of a snapshot
+
+        :param target: Target url
+        :type target: str
+        :param time: Timestamp of the backup
+        :type time: int
+        :param into: Listing extended with the rows instead of building
+                     a list, defaults to None
+        :type into: kyrian.listing.CompactListing, optional
+        :return: List of (path, type, mtime, size, mode) in archive order
+                 or into, None if the snapshot is not indexed
+        :rtype: list
+        """
+        with self.lock:
+            snap_id = self.get_snapshot_id(target, time)
+            if snap_id is None:
+                return None
+
+            # rowid keeps the order of the signature chain
+            cursor = self.con.execute(
+                """SELECT path, type, mtime, size, mode FROM files
+                   WHERE snapshot = ? ORDER BY rowid""",
+                (snap_id,))
+
+            if into is None:
+                return cursor.fetchall()
+            into.extend(cursor)
+            return into
+
+    def add_listing(self, target, time, files):
+        """Store the listing of a snapshot, replacing an existing one
+
+        :param target: Target url
+        :type target: str
+        :param time: Timestamp of the backup
+        :type time: int
+        :param files: Iterable of (path, type, mtime, size, mode)
+        :type files: iterable
+        """
+        with self.lock, self.con:
+            self.con.execute(
+                "DELETE FROM snapshots WHERE target = ? AND time = ?",
+                (target, time))
+            snap_id = self.con.execute(
+                "INSERT INTO snapshots (target, time) VALUES (?, ?)",
+                (target, time)).lastrowid
+            self.con.executemany(
+                """INSERT INTO files
+                   (snapshot, path, type, mtime, size, mode)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                ((snap_id,) + tuple(f) for f in files))
+
+    def prune(self, target, times):
+        """Drop snapshots of a target that no longer exist
+
+        :param target: Target url
+        :type target: str
+        :param times: Timestamps of the existing backups
+        :type times: iterable
+        """
+        times = set(times)
+        with self.lock, self.con:
+            rows = self.con.execute(
+                "SELECT id, time FROM snapshots WHERE target = ?",
+                (target,)).fetchall()
+            self.con.executemany(
+                "DELETE FROM snapshots WHERE id = ?",
+                ((snap_id,) for snap_id, time in rows if time not in times))
+
+    def set_chains(self, target, chains, scanned):
+        """Store the backup sets of a target, replacing the known ones
+
+        :param target: Target url
+        :type target: str
+        :param chains: (type, pretty time, volumes) by backup time
+        :type chains: dict
+        :param scanned: Time of the scan
+        :type scanned: int
+        """
+        with self.lock, self.con:
+            self.con.execute("DELETE FROM backup_sets WHERE target = ?",
+                             (target,))
+            self.con.executemany(
+                """INSERT INTO backup_sets
+                   (target, time, type, pretty, volumes)
+                   VALUES (?, ?, ?, ?, ?)""",
+                ((target, time) + tuple(s) for time, s in chains.items()))
+            self.con.execute(
+                "INSERT OR REPLACE INTO scans (target, time) VALUES (?, ?)",
+                (target, scanned))
+
+    def get_chains(self, target):
+        """Get the stored backup sets of a target
+
+        :param target: Target url
+        :type target: str
+        :return: (type, pretty time, volumes) by backup time and the
+                 time of the scan, None if the target was never scanned
+        :rtype: tuple
+        """
+        with self.lock:
+            row = self.con.execute(
+                "SELECT time FROM scans WHERE target = ?",
+                (target,)).fetchone()
+            if row is None:
+                return None
+
+            chains = {time: (btype, pretty, volumes)
+                      for time, btype, pretty, volumes in self.con.execute(
+                            """SELECT time, type, pretty, volumes
+                               FROM backup_sets WHERE target = ?""",
+                            (target,))}
+            return chains, row[0]
+
+    def set_sync(self, target, listed, remote, local) -> None:
+        """Store the state after a sync of the local archive
+
+        :param target: Target url
+        :type target: str
+        :param listed: Time the Target was listed
+        :type listed: float
+        :param remote: File names of the Target
+        :type remote: list
+        :param local: Fingerprint of the local archive
+        :type local: str
+        """
+        with self.lock, self.con:
+            self.con.execute(
+                """INSERT OR REPLACE INTO syncs (target, time, remote, local)
+                   VALUES (?, ?, ?, ?)""",
+                (target, listed, b"\0".join(remote), local))
+
+    def get_sync(self, target):
+        """Get the state after the last sync of the local archive
+
+        :param target: Target url
+        :type target: str
+        :return: "time", "remote" and "local" as in set_sync or None
+        :rtype: dict
+        """
+        with self.lock:
+            row = self.con.execute(
+                "SELECT time, remote, local FROM syncs WHERE target = ?",
+                (target,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "time": row[0],
+            "remote": row[1].split(b"\0") if row[1] else [],
+            "local": row[2]
+            }
+
+    def clear_sync(self, target) -> None:
+        """Forget the sync state, e.g. after the Target was written
+
+        :param target: Target url
+        :type target: str
+        """
+        with self.lock, self.con:
+            self.con.execute("DELETE FROM syncs WHERE target = ?", (target,))
+
+    def get_indexed_sigs(self, target):
+        """Get the time of the last indexed signature file per chain
+
+        :param target: Target url
+        :type target: str
+        :return: Last time by start time of the chain
+        :rtype: dict
+        """
+        with self.lock:
+            return dict(self.con.execute(
+                """SELECT chains.start, MAX(sigs.time)
+                   FROM chains JOIN sigs ON sigs.chain = chains.id
+                   WHERE chains.target = ? GROUP BY chains.id""",
+                (target,)).fetchall())
+
+    def add_events(self, target, events):
+        """Store the entries of signature files
+
+        :param target: Target url
+        :type target: str
+        :param events: Iterable of (chain start, time, path, type, mtime,
+                       size, mode) in the order of the signature files.
+                       Every signature file starts with an event that
+                       has path None, deletions have type None.
+        :type events: iterable
+        """
+        # The events usually come from a job reading the Target, the
+        # index is only locked while a chunk is written. A signature
+        # file counts as indexed once all its events are written.
+        chain_ids = {}
+        path_ids = {}
+
+        def chain_id(start):
+            if start not in chain_ids:
+                self.con.execute(
+                    """INSERT OR IGNORE INTO chains (target, start)
+                       VALUES (?, ?)""",
+                    (target, start))
+                chain_ids[start] = self.con.execute(
+                    "SELECT id FROM chains WHERE target = ? AND start = ?",
+                    (target, start)).fetchone()[0]
+            return chain_ids[start]
+
+        def path_id(path_s):
+            if path_s not in path_ids:
+                row = self.con.execute(
+                    "SELECT id FROM paths WHERE target = ? AND path = ?",
+                    (target, path_s)).fetchone()
+                if row:
+                    path_ids[path_s] = row[0]
+                else:
+                    path_ids[path_s] = self.con.execute(
+                        "INSERT INTO paths (target, path) VALUES (?, ?)",
+                        (target, path_s)).lastrowid
+                    if self.fts:
+                        self.con.execute(
+                            """INSERT INTO paths_fts (rowid, path)
+                               VALUES (?, ?)""",
+                            (path_ids[path_s], path_s))
+            return path_ids[path_s]
+
+        def write(chunk, done=None):
+            with self.lock, self.con:
+                self.con.executemany(
+                    """INSERT INTO events
+                       (chain, time, path, type, mtime, size, mode)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    [(chain_id(start), time, path_id(path_s),
+                      ftype, mtime, size, mode)
+                     for start, time, path_s, ftype, mtime, size, mode
+                     in chunk])
+                if done is not None:
+                    self.con.execute(
+                        """INSERT OR REPLACE INTO sigs (chain, time)
+                           VALUES (?, ?)""",
+                        (chain_id(done[0]), done[1]))
+
+        # (chain start, time) of the signature file being read
+        current = None
+        chunk = []
+        try:
+            for event in events:
+                if event[2] is None:
+                    write(chunk, current)
+                    current = event[:2]
+                    chunk = []
+                    continue
+
+                chunk.append(event)
+                if len(chunk) >= EVENT_CHUNK:
+                    write(chunk)
+                    chunk = []
+
+            write(chunk, current)
+
+        except BaseException:
+            # Drop the events of the incomplete signature file, it is
+            # read again next time
+            if current is not None and current[0] in chain_ids:
+                with self.lock, self.con:
+                    self.con.execute(
+                        "DELETE FROM events WHERE chain = ? AND time = ?",
+                        (chain_ids[current[0]], current[1]))
+            raise
+
+    def prune_chains(self, target, starts):
+        """Drop the events of chains that no longer exist
+
+        :param target: Target url
+        :type target: str
+        :param starts: Start times of the existing chains
+        :type starts: iterable
+        """
+        starts = set(starts)
+        with self.lock, self.con:
+            rows = self.con.execute(
+                "SELECT id, start FROM chains WHERE target = ?",
+                (target,)).fetchall()
+            self.con.executemany(
+                "DELETE FROM chains WHERE id = ?",
+                ((chain, ) for chain, start in rows if start not in starts))
+
+            # Forget paths that only existed in the removed chains
+            orphans = self.con.execute(
+                """SELECT id FROM paths WHERE target = ? AND NOT EXISTS
+                   (SELECT 1 FROM events WHERE events.path = paths.id)""",
+                (target,)).fetchall()
+            self.con.executemany("DELETE FROM paths WHERE id = ?", orphans)
+            if self.fts:
+                self.con.executemany(
+                    "DELETE FROM paths_fts WHERE rowid = ?", orphans)
+
+    def find_paths(self, target, pattern, limit):
+        """Get the ids of the paths that contain a pattern
+
+        :param target: Target url
+        :type target: str
+        :param pattern: Part of the path
+        :type pattern: str
+        :param limit: Maximal number of paths
+        :type limit: int
+        :return: List of (id, path)
+        :rtype: list
+        """
+        # The trigram index needs at least three characters
+        if self.fts and len(pattern) >= 3:
+            return self.con.execute(
+                """SELECT id, path FROM paths
+                   WHERE id IN (SELECT rowid FROM paths_fts
+                                WHERE paths_fts MATCH ?)
+                   AND target = ? ORDER BY path LIMIT ?""",
+                ('"' + pattern.replace('"', '""') + '"', target, limit)
+                ).fetchall()
+
+        escaped = (pattern.replace("\\", "\\\\")
+                          .replace("%", "\\%")
+                          .replace("_", "\\_"))
+        return self.con.execute(
+            """SELECT id, path FROM paths
+               WHERE target = ? AND path LIKE ? ESCAPE '\\'
+               ORDER BY path LIMIT ?""",
+            (target, "%" + escaped + "%", limit)).fetchall()
+
+    def search(self, target, pattern, limit=500):
+        """Find paths in all indexed snapshots
+
+        :param target: Target url
+        :type target: str
+        :param pattern: Part of the path, case insensitive
+        :type pattern: str
+        :param limit: Maximal number of paths, defaults to 500
+        :type limit: int, optional
+        :return: List of (path, times of the snapshots containing it)
+        :rtype: list
+        """
+        with self.lock:
+            paths = self.find_paths(target, pattern, limit)
+            sigs = self.get_sigs(target)
+
+            results = []
+            for path_id, path_s in paths:
+                times = [i[0] for i in self.get_versions(path_id, sigs)]
+                if times:
+                    results.append((path_s, times))
+
+            return results
+
+    def history(self, target, path_s):
+        """Get the state of a path in every indexed snapshot
+
+        :param target: Target url
+        :type target: str
+        :param path_s: Path relative to backup root
+        :type path_s: str
+        :return: List of (time, type, mtime, size, mode, changed) of the
+                 snapshots containing the path, changed is True if the
+                 snapshot recorded a new version
+        :rtype: list
+        """
+        with self.lock:
+            row = self.con.execute(
+                "SELECT id FROM paths WHERE target = ? AND path = ?",
+                (target, path_s)).fetchone()
+            if row is None:
+                return []
+
+            return self.get_versions(row[0], self.get_sigs(target))
+
+    def get_sigs(self, target):
+        """Get the times of the indexed signature files
+
+        :param target: Target url
+        :type target: str
+        :return: Sorted times by chain id
+        :rtype: dict
+        """
+        sigs = {}
+        for chain, time in self.con.execute(
+                """SELECT sigs.chain, sigs.time FROM sigs
+                   JOIN chains ON chains.id = sigs.chain
+                   WHERE chains.target = ? ORDER BY sigs.time""",
+                (target,)):
+            sigs.setdefault(chain, []).append(time)
+        return sigs
+
+    def get_versions(self, path_id, sigs):
+        """Replay the events of a path over the snapshots of its chains
+
+        :param path_id: Row id of the path
+        :type path_id: int
+        :param sigs: Result of get_sigs
+        :type sigs: dict
+        :return: As in history
+        :rtype: list
+        """
+        changes = {}
+        for chain, time, ftype, mtime, size, mode in self.con.execute(
+                """SELECT chain, time, type, mtime, size, mode FROM events
+                   WHERE path = ?""",
+                (path_id,)):
+            changes.setdefault(chain, {})[time] = (ftype, mtime, size, mode)
+
+        versions = []
+        for chain, chain_changes in changes.items():
+            state = None
+            for time in sigs.get(chain, []):
+                changed = time in chain_changes
+                if changed:
+                    state = chain_changes[time]
+                if state is not None and state[0] is not None:
+                    versions.append((time,) + state + (changed,))
+
+        versions.sort()
+        return versions
+
+    def close(self):
+        """Close the database
+        """
+        with self.lock:
+            self.con.close()
@@ -0,0 +1,287 @@
+"""Lazy item model of the snapshot contents
+"""
+from PyQt6 import QtCore, QtGui, QtWidgets
+from PyQt6.QtCore import Qt
+
+from duplicity import dup_time
+
+from kyrian.listing import CompactListing
+
+
+class PathTable():
+    """Tree of the paths in a snapshot with highlights
+
+    The table is a view of a CompactListing, a node is identified by
+    its row in the listing, the subtree of node i are the rows i+1 to
+    ends[i]-1.
+    """
+
+    def __init__(self, listing=None) -> None:
+        """
+        :param listing: Listing of the snapshot, defaults to an empty one
+        :type listing: kyrian.listing.CompactListing, optional
+        """
+        if listing is None:
+            listing = CompactListing()
+        self.listing = listing
+
+        # Rows of highlighted nodes
+        self.highlighted = set()
+
+        # Comparison of the highlights, "quick", "deep" or False
+        self.diffs_applied = False
+
+    def __len__(self) -> int:
+        return len(self.listing)
+
+    @property
+    def parents(self):
+        """Row of the parent node, -1 for top level nodes
+        """
+        return self.listing.parents
+
+    @property
+    def ends(self):
+        """Row after the last node of the subtree
+        """
+        return self.listing.ends
+
+    def name(self, row) -> str:
+        return self.listing.name(row)
+
+    def type(self, row) -> str:
+        return self.listing.type(row)
+
+    def mtime(self, row) -> int:
+        return self.listing.mtime(row)
+
+    def children(self, row):
+        """Iterate the direct children of a node
+
+        :param row: Row of the node, -1 for the root
+        :type row: int
+        :return: Rows of the children
+        :rtype: generator
+        """
+        if row < 0:
+            child, end = 0, len(self)
+        else:
+            child, end = row + 1, self.ends[row]
+
+        while child < end:
+            yield child
+            child = self.ends[child]
+
+    def has_children(self, row) -> bool:
+        """Does a node have children
+
+        :param row: Row of the node, -1 for the root
+        :type row: int
+        :rtype: bool
+        """
+        if row < 0:
+            return len(self) > 0
+        return self.ends[row] > row + 1
+
+    def path(self, row) -> str:
+        """Path of a node relative to the backup root
+
+        :param row: Row of the node
+        :type row: int
+        :rtype: str
+        """
+        return self.listing.path(row)
+
+    def find(self, path_s):
+        """Find the row of a path
+
+        :param path_s: Path relative to backup root
+        :type path_s: str
+        :return: Row or None if the path is not in the table
+        :rtype: int
+        """
+        return self.listing.find(path_s)
+
+    def highlight_paths(self, paths) -> None:
+        """Highlight the paths and all of their ancestors
+
+        Paths that are not in the table highlight their deepest
+        existing ancestor. Every ancestor is visited only once.
+
+        :param paths: Paths relative to backup root
+        :type paths: iterable
+        """
+        highlighted = set(self.highlighted)
+
+        for path_s in paths:
+            row = self.find(path_s)
+            while row is None and "/" in path_s:
+                path_s = path_s.rsplit("/", 1)[0]
+                row = self.find(path_s)
+
+            while row is not None and row >= 0 and row not in highlighted:
+                highlighted.add(row)
+                row = self.parents[row]
+
+        self.highlighted = highlighted
+
+    def clear_highlights(self) -> None:
+        """Remove all highlights
+        """
+        self.highlighted = set()
+        self.diffs_applied = False
+
+
+class SnapshotTreeModel(QtCore.QAbstractItemModel):
+    """Item model that materialises the children of a directory only
+    when the view expands it
+    """
+
+    # Number of children added per fetchMore call
+    fetch_batch = 1000
+
+    def __init__(self, table=None, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+        if table is None:
+            table = PathTable()
+        self.table = table
+
+        # Fetched children of expanded nodes
+        self.fetched = {}
+
+        # Row of the next child to fetch, None if all are fetched
+        self.cursor = {}
+
+        # Position of a fetched node below its parent
+        self.positions = {}
+
+        # Views may ask for more rows while rows are inserted
+        self.fetching = False
+
+        icon_p = QtWidgets.QFileIconProvider()
+        self.folder_icon = icon_p.icon(
+                                QtWidgets.QFileIconProvider.IconType.Folder
+                                )
+        self.file_icon = icon_p.icon(
+                                QtWidgets.QFileIconProvider.IconType.File
+                                )
+        self.highlight_brush = QtGui.QBrush(QtGui.QColor(255, 0, 0))
+
+    def node(self, index: QtCore.QModelIndex) -> int:
+        """Row in the path table of a model index, -1 for the root
+
+        :param index: The model index
+        :type index: QtCore.QModelIndex
+        :rtype: int
+        """
+        if not index.isValid():
+            return -1
+        return index.internalId()
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        children = self.fetched.get(self.node(parent), [])
+        if row < 0 or row >= len(children) or column not in (0, 1):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+
+        parent_row = self.table.parents[index.internalId()]
+        if parent_row < 0:
+            return QtCore.QModelIndex()
+        return self.createIndex(self.positions[parent_row], 0, parent_row)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self.fetched.get(self.node(parent), []))
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 2
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return False
+        return self.table.has_children(self.node(parent))
+
+    def canFetchMore(self, parent):
+        if self.fetching:
+            return False
+
+        node = self.node(parent)
+        if node not in self.fetched:
+            return self.table.has_children(node)
+        return self.cursor[node] is not None
+
+    def fetchMore(self, parent):
+        node = self.node(parent)
+        children = self.fetched.setdefault(node, [])
+
+        if node not in self.cursor:
+            self.cursor[node] = next(iter(self.table.children(node)), None)
+
+        new_children = []
+        child = self.cursor[node]
+        end = self.table.ends[node] if node >= 0 else len(self.table)
+        while child is not None and len(new_children) < self.fetch_batch:
+            new_children.append(child)
+            child = self.table.ends[child]
+            if child >= end:
+                child = None
+
+        if not new_children:
+            self.cursor[node] = None
+            return
+
+        first = len(children)
+        self.cursor[node] = child
+
+        self.fetching = True
+        self.beginInsertRows(parent, first, first + len(new_children) - 1)
+        for i, child_row in enumerate(new_children):
+            self.positions[child_row] = first + i
+        children.extend(new_children)
+        self.endInsertRows()
+        self.fetching = False
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+
+        row = index.internalId()
+        column = index.column()
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return self.table.name(row)
+            return dup_time.timetopretty(self.table.mtime(row))
+
+        if role == Qt.ItemDataRole.DecorationRole and column == 0:
+            ftype = self.table.type(row)
+            if ftype == "dir":
+                return self.folder_icon
+            if ftype == "reg":
+                return self.file_icon
+            return None
+
+        if role == Qt.ItemDataRole.ForegroundRole:
+            if row in self.table.highlighted:
+                return self.highlight_brush
+            return None
+
+        if role == Qt.ItemDataRole.UserRole:
+            if column == 0:
+                return self.table.path(row)
+            return self.table.type(row)
+
+        return None
+
+    def headerData(self, section, orientation,
+                   role=Qt.ItemDataRole.DisplayRole):
+        if (orientation == Qt.Orientation.Horizontal
+                and role == Qt.ItemDataRole.DisplayRole):
+            return ["Name", "Date"][section]
+        return None
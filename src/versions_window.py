@@ -0,0 +1,109 @@
+"""Window listing the versions of a path in all snapshots
+"""
+from PyQt6 import QtCore, QtWidgets
+from PyQt6.QtCore import Qt
+
+from duplicity import dup_time
+
+from kyrian.scheduler import BACKGROUND
+from kyrian.workers import IndexWorker
+
+
+class VersionsWindow(QtWidgets.QWidget):
+    """Lists every snapshot containing a path and restores a chosen one
+    """
+
+    def __init__(self, handler, scheduler, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setWindowTitle("Versions")
+
+        self.handler = handler
+        self.scheduler = scheduler
+
+        # Shown path and its type
+        self.path_s = None
+        self.ftype = None
+
+        layout = QtWidgets.QVBoxLayout(self)
+
+        self.label = QtWidgets.QLabel(self)
+        layout.addWidget(self.label)
+
+        self.treeWidget = QtWidgets.QTreeWidget(self)
+        self.treeWidget.setHeaderLabels(["Snapshot", "Modified", "Changed"])
+        self.treeWidget.setRootIsDecorated(False)
+        self.treeWidget.setColumnWidth(0, 250)
+        self.treeWidget.setColumnWidth(1, 250)
+        self.treeWidget.itemDoubleClicked.connect(self.restore_version)
+        layout.addWidget(self.treeWidget)
+
+        self.restoreButton = QtWidgets.QPushButton("Restore", self)
+        self.restoreButton.pressed.connect(self.restore_version)
+        layout.addWidget(self.restoreButton)
+
+        self.index_worker = IndexWorker(self.handler)
+        self.index_worker.indexReady.connect(self.post_index)
+        self.index_worker.failed.connect(self.show_failure)
+
+        self.resize(self.screen().availableSize() * 0.4)
+
+    # Signal to restore path, type and snapshot time
+    restoreRequested = QtCore.pyqtSignal(str, str, int)
+
+    def show_path(self, path_s, ftype) -> None:
+        """Show the versions of a path, the index is updated first
+
+        :param path_s: Path relative to backup root
+        :type path_s: str
+        :param ftype: File type
+        :type ftype: str
+        """
+        self.path_s = path_s
+        self.ftype = ftype
+
+        self.treeWidget.clear()
+        self.restoreButton.setEnabled(False)
+        self.label.setText("Indexing snapshots...")
+        self.show()
+
+        if not self.scheduler.is_active(self.index_worker):
+            self.scheduler.submit(self.index_worker, "Indexing snapshots",
+                                  priority=BACKGROUND,
+                                  target=self.handler.get_target())
+
+    def show_failure(self, message: str) -> None:
+        """Show the error of a failed index update, the index of the
+        earlier updates can still be used
+
+        :param message: The error message
+        :type message: str
+        """
+        QtWidgets.QMessageBox.warning(self, "Kyrian", message)
+
+    def post_index(self) -> None:
+        """List the versions once the index is up to date
+        """
+        versions = self.handler.get_versions(self.path_s)
+        self.label.setText("%s: %d snapshots" % (self.path_s, len(versions)))
+
+        self.treeWidget.clear()
+        for time, ftype, mtime, size, mode, changed in reversed(versions):
+            item = QtWidgets.QTreeWidgetItem(self.treeWidget, [
+                                dup_time.timetopretty(time),
+                                dup_time.timetopretty(mtime),
+                                "yes" if changed else ""
+                                ])
+            item.setData(0, Qt.ItemDataRole.UserRole, time)
+
+        self.restoreButton.setEnabled(len(versions) > 0)
+
+    def restore_version(self) -> None:
+        """Request restoring the selected version
+        """
+        item = self.treeWidget.currentItem()
+        if item is None:
+            return
+
+        self.restoreRequested.emit(self.path_s,
+                                   self.ftype,
+                                   item.data(0, Qt.ItemDataRole.UserRole))
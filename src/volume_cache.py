@@ -0,0 +1,208 @@
+"""Local cache of the volumes downloaded from a Target
+
+Volumes are kept as they come from the backend, encrypted if the
+profile encrypts, below a directory per Target. Restoring a path of a
+snapshot whose volumes were read shortly before needs no download.
+
+The cache is shared by the job processes, so its state lives in the
+file system only: a hit updates the modification time of the volume and
+the least recently used volumes are deleted when the cache grows over
+its budget.
+
+A cache that can not be read or written only costs the download, the
+errors are logged and the volume is fetched from the backend.
+"""
+import contextlib
+import hashlib
+import os
+import shutil
+
+from duplicity import log
+from duplicity import util
+
+
+def parse_size(value) -> int:
+    """Number of bytes of a size like 500M or 2G
+
+    :param value: Bytes or a number with one of the suffixes K, M, G, T
+    :type value: int or str
+    :rtype: int
+    """
+    if isinstance(value, int):
+        return value
+
+    value = str(value).strip().upper().rstrip("B")
+    factor = 1
+    for i, unit in enumerate("KMGT"):
+        if value.endswith(unit):
+            factor = 1024 ** (i + 1)
+            value = value[:-1]
+            break
+    return int(float(value) * factor)
+
+
+class VolumeCache():
+    """Size bounded LRU cache of volumes by Target and volume name
+    """
+
+    def __init__(self, directory, target, max_bytes) -> None:
+        """
+        :param directory: Root directory of the cache
+        :type directory: str
+        :param target: URL of the Target
+        :type target: str
+        :param max_bytes: Budget of all volumes in directory
+        :type max_bytes: int
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        # Volume names repeat between Targets
+        self.target_dir = os.path.join(
+                            directory,
+                            hashlib.sha1(target.encode()).hexdigest()[:16])
+
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, filename) -> str:
+        """Path of a cached volume
+
+        :param filename: Remote file name of the volume
+        :type filename: bytes
+        :rtype: str
+        """
+        return os.path.join(self.target_dir, os.fsdecode(filename))
+
+    def contains(self, filename) -> bool:
+        """Is a volume cached
+
+        :param filename: Remote file name of the volume
+        :type filename: bytes
+        :rtype: bool
+        """
+        return os.path.exists(self.path(filename))
+
+    def fetch(self, filename, local_name) -> bool:
+        """Copy a cached volume to local_name
+
+        :param filename: Remote file name of the volume
+        :type filename: bytes
+        :param local_name: Destination
+        :type local_name: bytes
+        :return: False if the volume is not cached
+        :rtype: bool
+        """
+        cached = self.path(filename)
+        try:
+            _copy(cached, local_name)
+            os.utime(cached)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        except OSError as e:
+            log.Warn(_(u"Error reading %s from the volume cache: %s")
+                     % (os.fsdecode(filename), util.uexc(e)))
+            self.misses += 1
+            return False
+
+        self.hits += 1
+        return True
+
+    def store(self, local_name, filename) -> None:
+        """Add a downloaded volume and evict old ones
+
+        :param local_name: The downloaded volume
+        :type local_name: bytes
+        :param filename: Remote file name of the volume
+        :type filename: bytes
+        """
+        if os.path.getsize(local_name) > self.max_bytes:
+            return
+
+        os.makedirs(self.target_dir, mode=0o700, exist_ok=True)
+
+        # Other jobs never see a partial volume
+        cached = self.path(filename)
+        tmp = cached + ".part-%d" % os.getpid()
+        try:
+            _copy(local_name, tmp)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, cached)
+        except OSError:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete the least recently used volumes of all Targets until
+        the cache fits max_bytes
+        """
+        entries = []
+        total = 0
+        for target_entry in os.scandir(self.directory):
+            if not target_entry.is_dir():
+                continue
+            for entry in os.scandir(target_entry.path):
+                if ".part-" in entry.name:
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+        entries.sort()
+        for mtime, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(name)
+            total -= size
+
+    @contextlib.contextmanager
+    def installed(self, be):
+        """Serve the downloads of a backend from the cache while the
+        context is active
+
+        :param be: The backend wrapper of duplicity
+        :type be: duplicity.backend.BackendWrapper
+        """
+        get = be.get
+
+        def cached_get(remote_filename, local_path):
+            if self.fetch(remote_filename, local_path.name):
+                local_path.setdata()
+                return
+            get(remote_filename, local_path)
+            local_path.setdata()
+            if local_path.exists():
+                try:
+                    self.store(local_path.name, remote_filename)
+                except OSError as e:
+                    log.Warn(_(u"Error adding %s to the volume cache: %s")
+                             % (os.fsdecode(remote_filename),
+                                util.uexc(e)))
+
+        be.get = cached_get
+        try:
+            yield self
+        finally:
+            be.get = get
+
+
+def _copy(src, dst) -> None:
+    """Hard link src to dst or copy it if they are on different devices
+    """
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        os.unlink(dst)
+        os.link(src, dst)
+    except OSError as e:
+        if isinstance(e, FileNotFoundError):
+            raise
+        shutil.copyfile(src, dst)
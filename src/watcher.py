@@ -0,0 +1,261 @@
+"""Watch the Source of a profile with inotify
+
+Every directory of the Source gets an inotify watch, the changed paths
+are written to the change journal every HEARTBEAT seconds. Linux only,
+inotify is called through ctypes.
+
+The number of watches is limited by fs.inotify.max_user_watches, a
+Source with more directories can not be watched.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from kyrian.journal import HEARTBEAT
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM
+              | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+              | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+
+# struct inotify_event without the name
+EVENT = struct.Struct("iIII")
+
+
+class WatchError(Exception):
+    """The Source can not be watched
+    """
+
+
+class Inotify():
+    """Minimal inotify binding
+    """
+
+    def __init__(self) -> None:
+        if not sys.platform.startswith("linux"):
+            raise WatchError("inotify is only available on Linux")
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"),
+                                use_errno=True)
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int,
+                                                ctypes.c_char_p,
+                                                ctypes.c_uint32]
+
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def add_watch(self, path_b, mask) -> int:
+        """Watch a directory
+
+        :param path_b: Path of the directory
+        :type path_b: bytes
+        :param mask: Events to watch
+        :type mask: int
+        :return: Watch descriptor, the same for the same inode
+        :rtype: int
+        """
+        wd = self.libc.inotify_add_watch(self.fd, path_b, mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), os.fsdecode(path_b))
+        return wd
+
+    def rm_watch(self, wd) -> None:
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self) -> list:
+        """Read the queued events without blocking
+
+        :return: (wd, mask, cookie, name) of every event
+        :rtype: list
+        """
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+
+            offset = 0
+            while offset < len(buf):
+                wd, mask, cookie, length = EVENT.unpack_from(buf, offset)
+                offset += EVENT.size
+                name = buf[offset:offset + length].rstrip(b"\0")
+                offset += length
+                events.append((wd, mask, cookie, name))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class Watcher():
+    """Journals the changes in the Source of a profile
+    """
+
+    def __init__(self, source, journal, profile) -> None:
+        """
+        :param source: The Source
+        :type source: str
+        :param journal: The journal
+        :type journal: kyrian.journal.ChangeJournal
+        :param profile: Name of the profile
+        :type profile: str
+        """
+        self.source = source
+        self.source_b = os.fsencode(os.path.abspath(source))
+        self.journal = journal
+        self.profile = profile
+
+        self.inotify = None
+
+        # Relative path by watch descriptor and the other way round
+        self.paths = {}
+        self.wds = {}
+
+        # Changes that are not journaled yet
+        self.pending = {}
+
+    def join(self, rel, name) -> bytes:
+        return rel + b"/" + name if rel else name
+
+    def record(self, rel, subtree=False) -> None:
+        self.pending[rel] = self.pending.get(rel, False) or subtree
+
+    def watch_tree(self, rel) -> None:
+        """Watch a directory and all directories below it
+
+        :param rel: Path relative to the Source
+        :type rel: bytes
+        """
+        stack = [rel]
+        while stack:
+            rel = stack.pop()
+            try:
+                wd = self.inotify.add_watch(os.path.join(self.source_b, rel),
+                                            WATCH_MASK)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    raise WatchError("Too many directories, raise "
+                                     "fs.inotify.max_user_watches") from e
+                # Gone or not a directory anymore
+                continue
+
+            old = self.paths.get(wd)
+            if old is not None and old != rel:
+                self.wds.pop(old, None)
+            self.paths[wd] = rel
+            self.wds[rel] = wd
+
+            try:
+                with os.scandir(os.path.join(self.source_b, rel)) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(self.join(rel, entry.name))
+            except OSError:
+                continue
+
+    def unwatch_tree(self, rel) -> None:
+        """Forget the watches of a directory that was moved away
+
+        :param rel: Path relative to the Source
+        :type rel: bytes
+        """
+        prefix = rel + b"/"
+        for path_b in [i for i in self.wds
+                       if i == rel or i.startswith(prefix)]:
+            wd = self.wds.pop(path_b)
+            self.paths.pop(wd, None)
+            self.inotify.rm_watch(wd)
+
+    def handle(self, wd, mask, name) -> None:
+        """Record the paths changed by an event
+        """
+        if mask & IN_Q_OVERFLOW:
+            # Events were lost, the journal is complete again from now on
+            self.journal.restart_watch(self.profile, time.time())
+            return
+
+        rel = self.paths.get(wd)
+        if rel is None:
+            return
+
+        if mask & IN_IGNORED:
+            del self.paths[wd]
+            if self.wds.get(rel) == wd:
+                del self.wds[rel]
+            return
+
+        # Event of the watched directory itself
+        if not name:
+            self.record(rel, bool(mask & (IN_DELETE_SELF | IN_MOVE_SELF)))
+            return
+
+        child = self.join(rel, name)
+
+        # New and removed entries change the mtime of the directory
+        if mask & (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO):
+            self.record(rel)
+
+        if not mask & IN_ISDIR:
+            self.record(child)
+        elif mask & (IN_CREATE | IN_MOVED_TO):
+            self.watch_tree(child)
+            self.record(child, True)
+        elif mask & IN_MOVED_FROM:
+            self.unwatch_tree(child)
+            self.record(child, True)
+        elif mask & IN_DELETE:
+            self.record(child, True)
+        else:
+            self.record(child)
+
+    def run(self, stop=None) -> None:
+        """Watch until stop returns True or the process is interrupted
+
+        :param stop: Called after every heartbeat, defaults to None
+        :type stop: callable, optional
+        """
+        self.inotify = Inotify()
+        try:
+            self.watch_tree(b"")
+            self.journal.start_watch(self.profile, self.source, time.time())
+
+            while not (stop and stop()):
+                select.select([self.inotify], [], [], HEARTBEAT)
+
+                heartbeat = time.time()
+                for wd, mask, cookie, name in self.inotify.read_events():
+                    self.handle(wd, mask, name)
+
+                self.journal.add_changes(self.profile, self.pending,
+                                         heartbeat)
+                self.pending.clear()
+        finally:
+            self.journal.stop_watch(self.profile)
+            self.inotify.close()
@@ -1,15 +1,17 @@
 """Worker Threads to call duplicity
 """
-from PyQt6 import QtCore, QtGui, QtWidgets
-from PyQt6.QtCore import Qt
+import threading
+
+from PyQt6 import QtCore
 
-from duplicity import dup_time
 from duplicity import path
-from duplicity import config
 
+from kyrian.engine import JobCancelled, JobError
+from kyrian.tree_model import PathTable
 
-class BackupWorker(QtCore.QThread):
-    """Make Backups in seperate thread
+
+class Worker(QtCore.QThread):
+    """Thread running actionHandler calls, see kyrian.scheduler
     """
 
     def __init__(self, handler, *args, **kwargs) -> None:
@@ -17,27 +19,93 @@ class BackupWorker(QtCore.QThread):
 
         self.handler = handler
 
-        self.safe = True
+        # Identifier of the running thread
+        self.ident = None
 
-    backupReady = QtCore.pyqtSignal()
+    # Signal with the message of a failed run
+    failed = QtCore.pyqtSignal(str)
 
     def run(self) -> None:
-        self.safe = False
+        """Call work, errors are reported through failed and done is
+        always called so the ready signal of the worker is emitted
+        """
+        self.ident = threading.get_ident()
+        try:
+            self.work()
+        except JobCancelled:
+            pass
+        except Exception as e:
+            self.failed.emit(str(e) or type(e).__name__)
+        finally:
+            self.done()
+
+    def work(self) -> None:
+        """The calls of the worker
+        """
+        raise NotImplementedError
+
+    def done(self) -> None:
+        """Clean up and emit the ready signal
+        """
+        raise NotImplementedError
+
+    def cancel(self) -> None:
+        """Stop the worker and kill its running duplicity jobs
+        """
+        self.requestInterruption()
+        if self.ident is not None:
+            self.handler.cancel_jobs(self.ident)
+
+
+class BackupWorker(Worker):
+    """Make Backups in seperate thread
+    """
+
+    backupReady = QtCore.pyqtSignal()
+
+    # Progress records, see kyrian.progress
+    progress = QtCore.pyqtSignal(dict)
+
+    def work(self) -> None:
+        self.handler.set_progress_callback(self.progress.emit)
         self.handler.make_backup()
-        self.safe = True
+
+    def done(self) -> None:
+        self.handler.set_progress_callback(None)
         self.backupReady.emit()
 
 
-class RecoveryWorker(QtCore.QThread):
-    """Make Recovery in seperate thread
+class ChainsWorker(Worker):
+    """Scan the Target for backup chains in seperate thread
     """
 
     def __init__(self, handler, *args, **kwargs) -> None:
-        super().__init__(*args, **kwargs)
+        super().__init__(handler, *args, **kwargs)
 
-        self.handler = handler
+        # Profile of the scan
+        self.profile = None
+
+        # The chains, None if the scan failed
+        self.result = None
+
+    # Signal that the scan is done
+    chainsReady = QtCore.pyqtSignal()
 
-        self.safe = True
+    def work(self) -> None:
+        self.profile = self.handler.current_profile
+        self.result = None
+        self.result = self.handler.get_chains(refresh=True)
+
+    def done(self) -> None:
+        self.chainsReady.emit()
+
+
+class RecoveryWorker(Worker):
+    """Make Recovery in seperate thread
+    """
+
+    def __init__(self, handler, *args, **kwargs) -> None:
+        super().__init__(handler, *args, **kwargs)
 
         self.time = None
 
@@ -45,41 +113,82 @@ class RecoveryWorker(QtCore.QThread):
 
         self.file = None
 
+        # Several paths restored into the directory dest
+        self.files = None
+
+        # Overwrite existing files
+        self.force = False
+
     recoveryReady = QtCore.pyqtSignal()
 
-    def run(self) -> None:
+    # Progress records, see kyrian.progress
+    progress = QtCore.pyqtSignal(dict)
 
+    def work(self) -> None:
         local_path = path.Path(path.Path(self.dest).get_canonical())
         if ((local_path.exists() and not local_path.isemptydir())
-            and not config.force):
+            and not self.force and not self.files):
 
-            print("File already exists")
-            return
+            raise JobError("File already exists: %s" % self.dest)
+
+        self.handler.set_progress_callback(self.progress.emit)
+        if self.files:
+            self.handler.recover_many(self.dest,
+                                      self.files,
+                                      time=self.time,
+                                      force=self.force)
         else:
-            self.safe = False
             self.handler.recover_files(self.dest,
                                        file=self.file,
-                                       time=self.time)
-            self.safe = True
+                                       time=self.time,
+                                       force=self.force)
+
+    def done(self) -> None:
+        self.handler.set_progress_callback(None)
+        self.time = None
+        self.dest = None
+        self.file = None
+        self.files = None
+        self.recoveryReady.emit()
 
-            self.time = None
-            self.dest = None
-            self.file = None
-            self.recoveryReady.emit()
-            
 
-class TreeWorker(QtCore.QThread):
-    """Build the tree in a seperate thread
+class PlanWorker(Worker):
+    """Estimate the download of a recovery in seperate thread
     """
 
-    file_icon_p = QtWidgets.QFileIconProvider()
-
     def __init__(self, handler, *args, **kwargs) -> None:
-        super().__init__(*args, **kwargs)
+        super().__init__(handler, *args, **kwargs)
 
-        self.handler = handler
+        # Parameters of the planned recovery
+        self.time = None
+        self.dest = None
+        self.file = None
+        self.files = None
+
+        # The plan, None if planning failed
+        self.result = None
+
+    # Signal that the plan is ready
+    planReady = QtCore.pyqtSignal()
 
-        # List of files and direcories
+    def work(self) -> None:
+        self.result = None
+        self.result = self.handler.plan_recovery(file=self.file,
+                                                 time=self.time,
+                                                 files=self.files)
+
+    def done(self) -> None:
+        self.planReady.emit()
+
+
+class TreeWorker(Worker):
+    """Build the path table of the tree in a seperate thread
+    """
+
+    def __init__(self, handler, *args, **kwargs) -> None:
+        super().__init__(handler, *args, **kwargs)
+
+        # Listing of files and direcories, see kyrian.listing
         self.files_l = None
 
         # List of differing files and direcories
@@ -88,182 +197,82 @@ class TreeWorker(QtCore.QThread):
         self.time = None
         self.highlight_diffs = False
 
-        # False if duplicity is busy
-        self.safe = True
+        # Compare file contents for the highlights
+        self.deep = False
 
-        # Root of the tree
-        self.root = None
+        # Resulting path table
+        self.table = None
 
     # Signal that the tree is ready
     treeReady = QtCore.pyqtSignal()
 
-    def make_tree_item(self, dat, parent=None):
-        """Add tree elements and add them to their parent
-
-        :param dat: data to add a new node
-        :type dat: tuple
-        :param parent: The parent tree node, defaults to None
-        :type parent: QTreeWidgetItem, optional
-        :raises IndexError: 
-        :raises IndexError: 
-        :return: Tree Root Node if parent is not set
-        :rtype: QTreeWidgetItem
+    def work(self) -> None:
+        """Build the path table, it stays None if the run fails or is
+        interrupted
         """
-        # Timestamp of the node
-        time = dat[0]
-
-        # Type of the node
-        ftype = str(dat[2])
-
-        # Path relative to backup root
-        path_s = dat[1].decode("utf-8")
-
-        # Elements of the path string
-        path_elements = path_s.split("/")
-
-        # New tree item without parent
-        if not parent:
-            if len(path_elements) == 1:
-                tmp = QtWidgets.QTreeWidgetItem([
-                                                path_elements[0], 
-                                                dup_time.timetopretty(time)
-                                                ])
-                tmp.setIcon(0,
-                            self.file_icon_p.icon(
-                                QtWidgets.QFileIconProvider.IconType.Folder
-                                )
-                            )
-                return tmp
-            else:
-                raise IndexError("Path too long to build root")
-
-        # Iterate path
-        for i in path_elements:
-
-            # Search existing folders
-            found = False
-            #for j in range(parent.childCount()):
-            #    if parent.child(j).data(0, 0) == i:
-            #        parent = parent.child(j)
-            #        found = True
-            #        break
-
-            # Assuming the generator sorts files correctly
-            # Only check the last child element
-            cc = parent.childCount()
-            if cc > 0 and parent.child(cc-1).data(0, 0) == i:
-                parent = parent.child(cc-1)
-                found = True
-
-            if not found:
-                if path_elements[-1] != i:
-                    raise IndexError("Path broken " + i + " " + path_elements[-1] + " " + path_s)
-
-                tmp = QtWidgets.QTreeWidgetItem([i, dup_time.timetopretty(time)])
-                tmp.setData(0, Qt.ItemDataRole.UserRole, path_s)
-                tmp.setData(1, Qt.ItemDataRole.UserRole, ftype)
-
-                if ftype == "dir":
-                    tmp.setIcon(0,
-                                self.file_icon_p.icon(
-                                    QtWidgets.QFileIconProvider.IconType.Folder
-                                    )
-                                )
-                elif ftype == "reg":
-                    tmp.setIcon(0,
-                                self.file_icon_p.icon(
-                                    QtWidgets.QFileIconProvider.IconType.File
-                                    )
-                                )
-
-                parent.addChild(tmp)
-                break
-
-    def setItemColor(self,
-                     item: QtWidgets.QTreeWidgetItem,
-                     color: QtGui.QColor) -> None:
-        """Set the color of a tree item
-
-        :param item: The item
-        :type item: QtWidgets.QTreeWidgetItem
-        :param color: The color
-        :type color: QtGui.QColor
-        """
-        item.setForeground(0, QtGui.QBrush(color))
-        item.setData(0,
-                    Qt.ItemDataRole.ForegroundRole,
-                    QtGui.QBrush(color)
-                    )
+        self.table = None
+
+        if not self.files_l:
+            self.files_l = self.handler.get_listing(time=self.time)
 
-    def highlight_leaf(self, path_s, ftype) -> None:
-        """Highlight every element of a relative path in the tree
+        if not self.files_l or self.isInterruptionRequested():
+            return
 
-        :param path_s: path
-        :param ftype: File type
-        """
-        # Elements of the path string
-        path_elements = path_s.split("/")
+        table = PathTable(self.files_l)
+
+        if self.highlight_diffs and self.diff_l == None:
+            self.diff_l = self.handler.get_diff(time=self.time,
+                                                deep=self.deep,
+                                                listing=self.files_l)
 
-        parent = self.root
+        if self.isInterruptionRequested():
+            return
 
-        # Iterate path
-        for i in path_elements:
-            for j in range(parent.childCount()):
-                if parent.child(j).data(0, 0) == i:
-                    parent = parent.child(j)
-                    self.setItemColor(parent, QtGui.QColor(255, 0, 0))
-                    break
+        if self.highlight_diffs:
+            table.highlight_paths(self.diff_l)
+            table.diffs_applied = "deep" if self.deep else "quick"
 
-    def cleanup(self) -> None:
-        """Clean up afterwards
-        """
-        self.root = None
+        self.table = table
 
+    def done(self) -> None:
         self.treeReady.emit()
 
-    def run(self) -> None:
-        """Build the data-tree 
-        """
-        if not self.time:
-            self.treeReady.emit()
 
-        self.safe = False
-        if not self.files_l:
-            self.files_l = self.handler.get_files(time=self.time)
+class SnapshotDiffWorker(Worker):
+    """Compare two snapshots in a seperate thread
+    """
 
-            # Skip "."
-            next(self.files_l)
+    def __init__(self, handler, *args, **kwargs) -> None:
+        super().__init__(handler, *args, **kwargs)
 
-        self.safe = True
+        # Timestamps of the compared backups
+        self.time_a = None
+        self.time_b = None
 
-        if not self.files_l:
-            self.cleanup()
-            return
+        # Lists of added, removed and changed paths
+        self.result = None
 
-        for i in self.files_l:
-            if i.difftype != u"deleted":
-                self.make_tree_item(
-                    (
-                        i.getmtime(),
-                        i.get_relative_path(),
-                        i.type),
-                    self.root)
-
-            if self.isInterruptionRequested():
-                self.cleanup()
-                return
-        
-        if self.highlight_diffs and self.diff_l == None:
-            self.safe = False
-            self.diff_l = self.handler.get_diff(time=self.time)
-            self.safe = True
+    # Signal that the comparison is ready
+    diffReady = QtCore.pyqtSignal()
 
-        if self.highlight_diffs and not self.isInterruptionRequested():
-            for i in self.diff_l:
-                self.highlight_leaf(i, self.diff_l[i])
+    def work(self) -> None:
+        self.result = None
+        self.result = self.handler.get_snapshot_diff(self.time_a,
+                                                     self.time_b)
+
+    def done(self) -> None:
+        self.diffReady.emit()
+
+
+class IndexWorker(Worker):
+    """Update the search index in a seperate thread
+    """
 
-                if self.isInterruptionRequested():
-                    self.cleanup()
-                    return
+    # Signal that the index is up to date
+    indexReady = QtCore.pyqtSignal()
 
+    def work(self) -> None:
+        self.handler.update_search_index()
 
+    def done(self) -> None:
+        self.indexReady.emit()
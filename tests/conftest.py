@@ -0,0 +1,88 @@
+"""Fixtures of the tests
+
+Most tests run duplicity against a file:// Target in a temporary
+directory, kyrian and duplicity have to be installed (pip install -e .).
+"""
+import os
+
+import pytest
+import yaml
+
+
+PROFILE = "Test"
+
+
+@pytest.fixture(autouse=True, scope="session")
+def duplicity_log():
+    """Set up the logging of duplicity once"""
+    try:
+        from duplicity import log
+    except ImportError:
+        return
+    log.setup()
+
+
+@pytest.fixture
+def source(tmp_path):
+    """A small Source tree
+
+    :return: Path of the Source
+    :rtype: str
+    """
+    root = tmp_path / "source"
+    (root / "sub").mkdir(parents=True)
+    (root / "f1.txt").write_text("one\n")
+    (root / "f2.txt").write_text("two\n")
+    (root / "sub" / "d.txt").write_text("nested\n")
+    os.symlink("f1.txt", root / "link")
+    return str(root)
+
+
+@pytest.fixture
+def cfg_dir(tmp_path, source, monkeypatch):
+    """Config directory with a profile that backs up the Source to a
+    file:// Target
+
+    :return: Path of the config directory
+    :rtype: str
+    """
+    # The archive dir of duplicity, the job processes inherit it
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+    target = tmp_path / "target"
+    target.mkdir()
+
+    directory = tmp_path / "config"
+    directory.mkdir()
+    with open(directory / "config.yaml", "w") as f:
+        yaml.dump({
+            "Profile": PROFILE,
+            "Profiles": {
+                PROFILE: {
+                    "Source": source,
+                    "Target": "file://" + str(target),
+                    "encrypt": False,
+                    },
+                },
+            }, f, default_flow_style=False)
+    return str(directory)
+
+
+@pytest.fixture
+def handler(cfg_dir):
+    """actionHandler running duplicity in child processes
+    """
+    from kyrian.actionHandler import actionHandler
+
+    handler = actionHandler(cfg_dir)
+    yield handler
+    handler.cancel_jobs()
+    handler.close_sessions()
+
+
+def profile_cfg(handler) -> dict:
+    """Configuration of the test profile of a handler
+
+    :rtype: dict
+    """
+    return handler.config["Profiles"][PROFILE]
@@ -0,0 +1,112 @@
+"""Round trip of duplicity actions through the job processes"""
+import pytest
+
+pytest.importorskip("duplicity")
+
+from kyrian.engine import Job, JobError, Session
+
+from conftest import PROFILE, profile_cfg
+
+
+@pytest.mark.parametrize("session_timeout", [0, 60])
+def test_backup_and_listing(handler, session_timeout):
+    profile_cfg(handler)["session-timeout"] = session_timeout
+
+    assert handler.make_backup()
+
+    chains = handler.get_chains(refresh=True)
+    assert len(chains) == 1
+
+    paths = {i[0] for i in handler.get_files(time=max(chains))}
+    assert {"f1.txt", "f2.txt", "sub", "sub/d.txt", "link"} <= paths
+
+
+def test_session_is_reused(handler):
+    profile_cfg(handler)["session-timeout"] = 60
+    handler.make_backup()
+
+    handler.get_chains(refresh=True)
+    (session,) = [s for sessions in handler.session_pool.idle.values()
+                  for s in sessions]
+
+    handler.get_chains(refresh=True)
+    assert [s for sessions in handler.session_pool.idle.values()
+            for s in sessions] == [session]
+
+
+def test_streamed_records(handler):
+    handler.make_backup()
+    chains = handler.get_chains(refresh=True)
+
+    records = list(handler.stream_job("run_list_current", max(chains)))
+    assert sorted(records) == sorted(handler.get_files(time=max(chains)))
+
+
+def test_failed_job(cfg_dir, handler):
+    job = Job(cfg_dir, handler.config, PROFILE, "no_such_method")
+    job.start()
+    with pytest.raises(JobError):
+        job.result()
+
+
+def test_failed_job_ends_session(cfg_dir, handler):
+    session = Session(("test",), cfg_dir, 60)
+    job = Job(cfg_dir, handler.config, PROFILE, "no_such_method",
+              session=session)
+    job.start()
+    with pytest.raises(JobError):
+        job.result()
+
+    # The backends of the failed job are closed and the process exits
+    session.process.join(timeout=30)
+    assert session.process.exitcode == 0
+
+
+def test_produced_streams_while_running():
+    from kyrian.engine import BATCH_SIZE, produced
+
+    seen = []
+
+    def func(emit):
+        for i in range(2 * BATCH_SIZE):
+            emit(i)
+        # Only a few chunks are buffered, the first ones were consumed
+        # before the function ended
+        seen.append(len(consumed))
+
+    consumed = []
+    for record in produced(func):
+        consumed.append(record)
+
+    assert consumed == list(range(2 * BATCH_SIZE))
+    assert seen[0] > 0
+
+
+def test_produced_raises_errors():
+    from kyrian.engine import produced
+
+    def func(emit):
+        emit(1)
+        raise ValueError("broken")
+
+    with pytest.raises(ValueError):
+        list(produced(func))
+
+
+def test_produced_stops_when_closed():
+    from kyrian.engine import StreamClosed, produced
+
+    stopped = []
+
+    def func(emit):
+        try:
+            while True:
+                emit(0)
+        except StreamClosed:
+            stopped.append(True)
+            raise
+
+    records = produced(func)
+    next(records)
+    records.close()
+    assert stopped == [True]
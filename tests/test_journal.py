@@ -0,0 +1,82 @@
+"""When the change journal can be trusted"""
+import time
+
+import pytest
+
+from kyrian import journal as journal_module
+from kyrian.journal import ChangeJournal
+
+
+PROFILE = "Test"
+SOURCE = "/source"
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    # Give up waiting for the watcher quickly
+    monkeypatch.setattr(journal_module, "HEARTBEAT", 0.1)
+
+    journal = ChangeJournal(str(tmp_path / "journal.sqlite"))
+    yield journal
+    journal.close()
+
+
+@pytest.fixture
+def watched(journal):
+    """Journal after a backup at 100 with the watcher running since 50
+    and a change journaled since"""
+    journal.backup_done(PROFILE, SOURCE, 100, 5)
+    journal.start_watch(PROFILE, SOURCE, 50)
+    journal.add_changes(PROFILE, {b"a": False, b"d": True}, time.time())
+    return journal
+
+
+def test_changes(watched):
+    started = time.time() - 1
+    assert watched.get_changes(PROFILE, SOURCE, started) == (
+        {b"a": False, b"d": True}, 5)
+
+
+def test_no_backup(journal):
+    journal.start_watch(PROFILE, SOURCE, 50)
+    assert journal.get_changes(PROFILE, SOURCE, time.time()) is None
+
+
+def test_watcher_started_after_backup(journal):
+    journal.backup_done(PROFILE, SOURCE, 100, 5)
+    journal.start_watch(PROFILE, SOURCE, 150)
+    assert journal.get_changes(PROFILE, SOURCE, time.time()) is None
+
+
+def test_missed_heartbeat(watched):
+    # The watcher did not read the events up to the start of the backup
+    assert watched.get_changes(PROFILE, SOURCE, time.time() + 60) is None
+
+
+def test_other_source(watched):
+    assert watched.get_changes(PROFILE, "/other", time.time() - 1) is None
+
+    # The watcher watches another Source than the last backup read
+    watched.start_watch(PROFILE, "/other", 50)
+    watched.backup_done(PROFILE, SOURCE, 100, 5)
+    assert watched.get_changes(PROFILE, SOURCE, time.time() - 1) is None
+
+
+def test_restarted_watcher(watched):
+    # Events were lost, e.g. by a queue overflow
+    watched.restart_watch(PROFILE, 200)
+    assert watched.get_changes(PROFILE, SOURCE, time.time() - 1) is None
+
+
+def test_stopped_watcher(watched):
+    watched.stop_watch(PROFILE)
+    assert watched.get_changes(PROFILE, SOURCE, time.time() - 1) is None
+
+
+def test_backup_done_drops_seen_changes(watched):
+    started = time.time() + 1
+    watched.add_changes(PROFILE, {b"late": False}, started + 1)
+    watched.backup_done(PROFILE, SOURCE, started, 6)
+
+    assert watched.get_changes(PROFILE, SOURCE, started) == (
+        {b"late": False}, 6)
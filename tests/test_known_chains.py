@@ -0,0 +1,71 @@
+"""Snapshot list of the last scan of the Target"""
+import os
+import time
+
+import pytest
+
+pytest.importorskip("duplicity")
+
+from kyrian.snapshot_index import SnapshotIndex
+
+
+TARGET = "file:///target"
+
+
+def test_stored_chains(tmp_path):
+    index = SnapshotIndex(str(tmp_path / "index.sqlite"))
+    try:
+        assert index.get_chains(TARGET) is None
+
+        chains = {100: ("full", "Thu", 1), 200: ("inc", "Fri", 2)}
+        index.set_chains(TARGET, chains, 300)
+        assert index.get_chains(TARGET) == (chains, 300)
+
+        # A scan replaces the known backup sets
+        index.set_chains(TARGET, {200: ("full", "Fri", 1)}, 400)
+        assert index.get_chains(TARGET) == ({200: ("full", "Fri", 1)}, 400)
+        assert index.get_chains("file:///other") is None
+    finally:
+        index.close()
+
+
+def test_stale_after_restart(cfg_dir, handler):
+    from kyrian.actionHandler import actionHandler
+
+    assert handler.get_known_chains() is None
+
+    handler.make_backup()
+    chains = handler.get_chains(refresh=True)
+    known = handler.get_known_chains()
+    assert known["chains"] == chains
+    assert not known["stale"]
+
+    # The next session starts with the chains of the last scan
+    later = actionHandler(cfg_dir)
+    try:
+        known = later.get_known_chains()
+        assert known["chains"] == chains
+        assert known["stale"]
+        assert known["scanned"] > 0
+
+        # A scan of the session makes them current
+        later.get_chains(refresh=True)
+        assert not later.get_known_chains()["stale"]
+    finally:
+        later.close_sessions()
+
+
+def test_backup_updates_known_chains(handler, source):
+    handler.make_backup()
+    first = handler.get_chains(refresh=True)
+
+    # Backups of the same second are not possible
+    time.sleep(1)
+    with open(os.path.join(source, "f3.txt"), "w") as f:
+        f.write("three\n")
+    handler.make_backup()
+
+    known = handler.get_known_chains()
+    assert not known["stale"]
+    assert set(first) < set(known["chains"])
+    assert len(known["chains"]) == 2
@@ -0,0 +1,86 @@
+"""Array backed listing of a snapshot"""
+from kyrian.listing import CompactListing
+
+
+RECORDS = [
+    ("a", "dir", 10, None, 0o755),
+    ("a/b", "dir", 11, None, 0o755),
+    ("a/b/f.txt", "reg", 12, 100, 0o644),
+    ("a/g.txt", "reg", 13, 0, 0o600),
+    ("c.txt", "reg", 14, 5, 0o644),
+    ("d", "sym", 15, None, None),
+    ]
+
+
+def test_round_trip():
+    listing = CompactListing.from_records(RECORDS)
+    assert len(listing) == len(RECORDS)
+    assert list(listing) == RECORDS
+
+
+def test_rows():
+    listing = CompactListing.from_records(RECORDS)
+    for row, (path_s, ftype, mtime, size, mode) in enumerate(RECORDS):
+        assert listing.path(row) == path_s
+        assert listing.name(row) == path_s.split("/")[-1]
+        assert listing.type(row) == ftype
+        assert listing.mtime(row) == mtime
+        assert listing.size(row) == size
+        assert listing.mode(row) == mode
+
+
+def test_subtrees():
+    listing = CompactListing.from_records(RECORDS)
+    assert list(listing.parents) == [-1, 0, 1, 0, -1, -1]
+    # Every directory is followed by its subtree
+    assert list(listing.ends) == [4, 3, 3, 4, 5, 6]
+
+
+def test_find():
+    listing = CompactListing.from_records(RECORDS)
+    for row, record in enumerate(RECORDS):
+        assert listing.find(record[0]) == row
+    assert listing.find("a/b/missing") is None
+    assert listing.find("b") is None
+
+    # The table is rebuilt after adding
+    listing.add("e.txt", "reg", 16, 1, 0o644)
+    listing.finish()
+    assert listing.find("e.txt") == len(RECORDS)
+    assert listing.find("a/g.txt") == 3
+
+
+def test_empty():
+    listing = CompactListing.from_records([])
+    assert len(listing) == 0
+    assert list(listing) == []
+    assert listing.find("a") is None
+
+
+def test_same_names_are_interned():
+    listing = CompactListing.from_records(
+        [("x", "dir", 1, None, None), ("x/x", "dir", 1, None, None),
+         ("x/x/x", "reg", 1, 1, None)])
+    assert listing.names == ["x"]
+    assert listing.path(2) == "x/x/x"
+    assert listing.find("x/x") == 1
+
+
+def test_missing_parent_directory():
+    # a/b and y are not listed
+    records = [
+        ("a", "dir", 1, None, None),
+        ("a/b/c.txt", "reg", 2, 1, None),
+        ("a/d", "reg", 3, 1, None),
+        ("ab", "reg", 4, 1, None),
+        ("x/y/z", "reg", 5, 1, None),
+        ]
+    listing = CompactListing.from_records(records)
+
+    assert list(listing) == records
+    assert list(listing.parents) == [-1, 0, 0, -1, -1]
+    assert list(listing.ends) == [3, 2, 3, 4, 5]
+    assert listing.name(1) == "b/c.txt"
+    assert listing.path(1) == "a/b/c.txt"
+    assert listing.find("a/b/c.txt") == 1
+    assert listing.find("a/d") == 2
@@ -0,0 +1,135 @@
+"""Incremental backups that only scan the journaled paths"""
+import filecmp
+import io
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("duplicity")
+
+from duplicity import path
+from duplicity import selection
+
+from kyrian.journal import ChangeJournal, HEARTBEAT
+from kyrian.narrowing import narrowed_paths
+from kyrian.watcher import Watcher
+
+from conftest import PROFILE
+
+
+def make_tree(root, files):
+    """Create directories, files ending in / are directories"""
+    for name in files:
+        p = os.path.join(root, name)
+        if name.endswith("/"):
+            os.makedirs(p)
+        else:
+            with open(p, "w") as f:
+                f.write(name)
+    return root
+
+
+def selected(root):
+    select = selection.Select(path.Path(root))
+    select.ParseArgs([], [])
+    return select
+
+
+def test_narrowed_paths(tmp_path):
+    # The last backup saw old, the Source is now new
+    old = make_tree(str(tmp_path / "old"),
+                    ["a/", "a/keep", "a/x", "b/", "b/y", "c"])
+    new = make_tree(str(tmp_path / "new"),
+                    ["a/", "a/keep", "a/x", "a/z", "c", "d/", "d/y"])
+
+    # a/x modified, a/z created, b moved to d
+    changes = {b"a": False, b"a/x": False, b"a/z": False,
+               b"b": True, b"d": True}
+
+    sigs = {p.index: p for p in selected(old).set_iter()}
+    sigs[(b"a", b"x")].setfileobj(io.BytesIO(b"signature"))
+
+    paths = list(narrowed_paths(selected(new), iter(sigs.values()),
+                                changes))
+
+    assert [p.index for p in paths] == [
+        p.index for p in selected(new).set_iter()]
+
+    # Unchanged entries are the ones of the signature chain, also
+    # below a changed parent directory
+    by_index = {p.index: p for p in paths}
+    assert by_index[(b"c",)] is sigs[(b"c",)]
+    assert by_index[(b"a", b"keep")] is sigs[(b"a", b"keep")]
+    assert by_index[(b"a",)] is not sigs[(b"a",)]
+    assert by_index[(b"a", b"x")].base == os.fsencode(new)
+
+    # The signature of a changed file is still readable for duplicity
+    assert sigs[(b"a", b"x")].fileobj.read() == b"signature"
+
+
+@pytest.fixture
+def watcher(cfg_dir, source):
+    """Watcher of the Source running in a thread"""
+    journal = ChangeJournal(os.path.join(cfg_dir, "journal.sqlite"))
+    stopped = threading.Event()
+    thread = threading.Thread(
+        target=Watcher(source, journal, PROFILE).run,
+        args=(stopped.is_set,), daemon=True)
+    thread.start()
+
+    deadline = time.time() + 10
+    while journal.get_watcher(PROFILE) is None:
+        assert time.time() < deadline
+        time.sleep(0.1)
+
+    yield journal
+    stopped.set()
+    thread.join(timeout=3 * HEARTBEAT)
+    journal.close()
+
+
+def same_tree(a, b):
+    """Do two directories have the same paths, contents and links"""
+    cmp = filecmp.dircmp(a, b)
+    if cmp.left_only or cmp.right_only or cmp.funny_files:
+        return False
+    _match, mismatch, errors = filecmp.cmpfiles(a, b, cmp.common_files,
+                                                shallow=False)
+    if mismatch or errors:
+        return False
+    for name in cmp.common:
+        pa, pb = os.path.join(a, name), os.path.join(b, name)
+        if os.path.islink(pa) != os.path.islink(pb):
+            return False
+        if os.path.islink(pa) and os.readlink(pa) != os.readlink(pb):
+            return False
+    return all(same_tree(os.path.join(a, i), os.path.join(b, i))
+               for i in cmp.common_dirs)
+
+
+def test_narrowed_backup(handler, watcher, source, tmp_path):
+    assert handler.make_backup()
+
+    # Duplicity compares the mtimes in seconds
+    f1 = os.path.join(source, "f1.txt")
+    with open(f1, "a") as f:
+        f.write("changed\n")
+    os.utime(f1, (time.time() + 10, time.time() + 10))
+    os.remove(os.path.join(source, "f2.txt"))
+    os.rename(os.path.join(source, "sub"), os.path.join(source, "moved"))
+    os.mkdir(os.path.join(source, "new"))
+    with open(os.path.join(source, "new", "n.txt"), "w") as f:
+        f.write("new\n")
+
+    changes = handler.journal.get_changes(PROFILE, source, time.time())
+    assert changes is not None and changes[0]
+
+    assert handler.make_backup(skip_unchanged=True)
+    # Nothing changed since, the next backup is skipped
+    assert not handler.make_backup(skip_unchanged=True)
+
+    dest = str(tmp_path / "restore")
+    handler.recover_files(dest, time=max(handler.get_chains(refresh=True)))
+    assert same_tree(source, dest)
@@ -0,0 +1,103 @@
+"""Volumes and bytes of a planned restore"""
+import pytest
+
+pytest.importorskip("duplicity")
+
+from duplicity import config
+from duplicity import manifest
+
+from conftest import profile_cfg
+
+
+class BackupSet():
+    """Backup set with a manifest of two volumes"""
+
+    def __init__(self, name):
+        self.mf = manifest.Manifest()
+        # Volume 1 holds a to m, volume 2 n to z, m/big spans both
+        for vol_num, start, end in [(1, (b"a",), (b"m", b"big")),
+                                    (2, (b"m", b"big"), (b"z",))]:
+            vi = manifest.VolumeInfo()
+            vi.set_info(vol_num, start, None, end, None)
+            self.mf.add_volume_info(vi)
+        self.volume_name_dict = {1: name + b".vol1", 2: name + b".vol2"}
+
+    def get_manifest(self):
+        return self.mf
+
+
+class Chain():
+    def __init__(self, sets):
+        self.sets = sets
+
+    def get_sets_at_time(self, time):
+        return self.sets
+
+
+class CollectionStatus():
+    def __init__(self, sets):
+        self.chain = Chain(sets)
+        self.all_backup_chains = [self.chain]
+
+    def get_backup_chain_at_time(self, time):
+        return self.chain
+
+
+class Backend():
+    """Knows the size of every volume except vol2 of the full set"""
+
+    def query_info(self, names):
+        return {i: {u"size": None if i == b"full.vol2" else 1000}
+                for i in names}
+
+
+@pytest.fixture
+def local(cfg_dir, monkeypatch):
+    from kyrian.actionHandler import actionHandler
+
+    local = actionHandler(cfg_dir, isolate=False)
+    profile_cfg(local)["volume-cache-size"] = 0
+    monkeypatch.setattr(config, "backend", Backend())
+    monkeypatch.setattr(config, "restore_time", 100)
+    monkeypatch.setattr(config, "restore_dir", None)
+    return local
+
+
+@pytest.mark.parametrize("paths, volumes, size, unknown", [
+    (["b.txt"], 2, 2000, 0),
+    (["o.txt"], 2, 1000, 1),
+    (["m"], 4, 3000, 1),
+    (["b.txt", "c/d.txt"], 2, 2000, 0),
+    (None, 4, 3000, 1),
+    ])
+def test_plan_restore(local, paths, volumes, size, unknown):
+    col_stats = CollectionStatus([BackupSet(b"full"), BackupSet(b"inc")])
+    local.restore_paths = paths
+    local.plan_restore(col_stats)
+
+    assert local.plan == {"volumes": volumes, "cached": 0,
+                          "bytes": size, "unknown": unknown}
+
+
+def test_plan_recovery(handler):
+    handler.make_backup()
+    time = max(handler.get_chains(refresh=True))
+
+    plan = handler.plan_recovery(file="sub/d.txt", time=time)
+    assert plan["volumes"] == 1
+    assert plan["bytes"] > 0
+    assert plan["cached"] == plan["unknown"] == 0
+
+
+def test_cached_volumes_are_not_downloaded(local, tmp_path):
+    profile_cfg(local)["volume-cache-size"] = "1M"
+    volume = tmp_path / "volume"
+    volume.write_bytes(b"v" * 10)
+    local.get_volume_cache().store(str(volume), b"inc.vol1")
+
+    col_stats = CollectionStatus([BackupSet(b"full"), BackupSet(b"inc")])
+    local.restore_paths = ["b.txt"]
+    local.plan_restore(col_stats)
+
+    assert local.plan == {"volumes": 2, "cached": 1,
+                          "bytes": 1000, "unknown": 0}
@@ -0,0 +1,125 @@
+"""Parallel download of the volumes of a restore"""
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("duplicity")
+
+from duplicity import path
+
+from kyrian.prefetch import VolumePrefetcher
+
+
+URL = "sftp://host/backup"
+
+
+class Backend():
+    """Backend that serves volumes from a dict"""
+
+    def __init__(self, volumes, downloads):
+        self.volumes = volumes
+        self.downloads = downloads
+
+    def get(self, remote_filename, local_path):
+        self.downloads.append(remote_filename)
+        if remote_filename not in self.volumes:
+            raise IOError("no such volume")
+        with open(local_path.name, "wb") as f:
+            f.write(self.volumes[remote_filename])
+
+
+class Sessions():
+    """Pool handing out one backend per download thread"""
+
+    def __init__(self, volumes):
+        self.volumes = volumes
+        self.downloads = []
+        self.lock = threading.Lock()
+        self.out = []
+        self.back = []
+
+    def checkout(self, url):
+        be = Backend(self.volumes, self.downloads)
+        with self.lock:
+            self.out.append(be)
+        return be
+
+    def checkin(self, be):
+        self.back.append(be)
+
+
+VOLUMES = {b"a1": b"A1", b"a2": b"A2", b"a3": b"A3",
+           b"b1": b"B1", b"b2": b"B2"}
+
+
+@pytest.fixture
+def sessions():
+    return Sessions(VOLUMES)
+
+
+def fetch(prefetcher, name, tmp_path):
+    local_path = path.Path(str(tmp_path / name.decode()))
+    assert prefetcher.get(name, local_path)
+    return local_path
+
+
+def test_window_per_backup_set(sessions, tmp_path):
+    prefetcher = VolumePrefetcher(URL, [[b"a1", b"a2", b"a3"],
+                                        [b"b1", b"b2"]],
+                                  concurrency=2, ahead=1,
+                                  sessions=sessions)
+    try:
+        # Every set gets its own window
+        assert set(prefetcher.futures) == {b"a1", b"b1"}
+
+        local_path = fetch(prefetcher, b"a1", tmp_path)
+        assert local_path.get_data() == b"A1"
+        assert set(prefetcher.futures) == {b"a2", b"b1"}
+
+        for name in [b"a2", b"b1", b"a3", b"b2"]:
+            assert fetch(prefetcher, name, tmp_path).get_data() \
+                == VOLUMES[name]
+    finally:
+        prefetcher.close()
+
+    assert sorted(sessions.downloads) == sorted(VOLUMES)
+    # The backends of the threads go back to the pool
+    assert sessions.back == sessions.out
+    assert 1 <= len(sessions.out) <= 2
+
+
+def test_unplanned_volume_falls_back(sessions, tmp_path):
+    fallback = Backend({b"x": b"X"}, [])
+    prefetcher = VolumePrefetcher(URL, [[b"a1"]], sessions=sessions)
+    try:
+        with prefetcher.installed(fallback):
+            local_path = path.Path(str(tmp_path / "x"))
+            fallback.get(b"x", local_path)
+        assert fallback.downloads == [b"x"]
+        assert b"x" in prefetcher.skipped
+    finally:
+        prefetcher.close()
+
+
+def test_failed_download(sessions, tmp_path):
+    prefetcher = VolumePrefetcher(URL, [[b"missing"]], sessions=sessions)
+    try:
+        tmp = prefetcher.futures[b"missing"][1]
+        with pytest.raises(IOError):
+            prefetcher.get(b"missing", path.Path(str(tmp_path / "m")))
+        assert not os.path.exists(tmp)
+    finally:
+        prefetcher.close()
+
+
+def test_close_deletes_unused_volumes(sessions):
+    prefetcher = VolumePrefetcher(URL, [[b"a1", b"a2"]], concurrency=2,
+                                  sessions=sessions)
+    tmps = [tmp for future, tmp, queue in prefetcher.futures.values()]
+    for future, tmp, queue in prefetcher.futures.values():
+        future.result()
+    prefetcher.close()
+
+    assert tmps and not any(os.path.exists(tmp) for tmp in tmps)
+    assert prefetcher.futures == {}
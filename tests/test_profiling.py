@@ -0,0 +1,88 @@
+"""Opt-in profiling of the phases of an action"""
+import glob
+import json
+import os
+import time
+
+import pytest
+
+from kyrian.profiling import PhaseProfiler, get_mode
+
+
+@pytest.mark.parametrize("env, option, mode", [
+    (None, None, None),
+    (None, "off", None),
+    (None, True, "phases"),
+    (None, "cprofile", "cprofile"),
+    ("phases", "cprofile", "phases"),
+    ("cProfile", None, "cprofile"),
+    ])
+def test_get_mode(monkeypatch, env, option, mode):
+    if env is None:
+        monkeypatch.delenv("KYRIAN_PROFILE", raising=False)
+    else:
+        monkeypatch.setenv("KYRIAN_PROFILE", env)
+    profile_cfg = {} if option is None else {"profiling": option}
+    assert get_mode(profile_cfg) == mode
+
+
+def test_nested_phases(tmp_path):
+    profiler = PhaseProfiler("phases", action="inc", profile="Test")
+    with profiler.phase("collection-status"):
+        with profiler.phase("sync_archive"):
+            time.sleep(0.01)
+    with profiler.phase("inc"):
+        pass
+
+    assert [(p["name"], p["depth"]) for p in profiler.phases] == [
+        ("collection-status", 0), ("sync_archive", 1), ("inc", 0)]
+    outer, inner = profiler.phases[:2]
+    assert outer["wall"] >= inner["wall"] >= 0.01
+
+    filename = profiler.write(str(tmp_path / "profiling"))
+    assert os.path.basename(filename).endswith("-Test-inc-%d.json"
+                                               % os.getpid())
+    with open(filename) as f:
+        report = json.load(f)
+    assert report["action"] == "inc"
+    assert [p["name"] for p in report["phases"]] == [
+        "collection-status", "sync_archive", "inc"]
+    assert report["cprofile"] == []
+
+
+def test_disabled(tmp_path):
+    profiler = PhaseProfiler(None, action="inc", profile="Test")
+    with profiler.phase("inc"), profiler.profiled():
+        pass
+    assert profiler.phases == []
+    assert profiler.write(str(tmp_path)) is None
+    assert os.listdir(tmp_path) == []
+
+
+def busy():
+    return sum(i * i for i in range(10000))
+
+
+def test_cprofile():
+    profiler = PhaseProfiler("cprofile", action="inc", profile="Test")
+    with profiler.profiled():
+        busy()
+
+    functions = [rec["function"] for rec in profiler.report()["cprofile"]]
+    assert any(i.endswith("(busy)") for i in functions)
+
+
+def test_backup_writes_profile(handler, cfg_dir):
+    pytest.importorskip("duplicity")
+    from conftest import profile_cfg
+
+    profile_cfg(handler)["profiling"] = "phases"
+    handler.make_backup()
+
+    (filename,) = glob.glob(os.path.join(cfg_dir, "profiling", "*.json"))
+    with open(filename) as f:
+        report = json.load(f)
+    names = [p["name"] for p in report["phases"]]
+    assert "collection-status" in names
+    # The incremental backup becomes a full one inside the action
+    assert "inc" in names
@@ -0,0 +1,115 @@
+"""Progress records of duplicity runs"""
+import pytest
+
+pytest.importorskip("duplicity")
+
+from duplicity import diffdir
+from duplicity import gpg
+from duplicity import path
+
+from kyrian.progress import ProgressMonitor, format_bytes, format_record
+
+
+class Block():
+    def __init__(self, data):
+        self.data = data
+
+
+class Backend():
+    """Backend that copies files within a dict"""
+
+    def __init__(self):
+        self.files = {}
+
+    def put(self, source_path, remote_filename=None):
+        with open(source_path.name, "rb") as f:
+            self.files[remote_filename] = f.read()
+
+    def get(self, remote_filename, local_path):
+        with open(local_path.name, "wb") as f:
+            f.write(self.files[remote_filename])
+
+
+@pytest.fixture
+def records():
+    return []
+
+
+@pytest.fixture
+def monitor(records, monkeypatch):
+    # No files were scanned yet
+    monkeypatch.setattr(diffdir, "stats", None)
+    return ProgressMonitor(records.append, action="inc")
+
+
+def test_phases(monitor, records):
+    with monitor.phase("collection-status"):
+        with monitor.phase("sync_archive"):
+            assert monitor.current == "sync_archive"
+        assert monitor.current == "collection-status"
+    assert monitor.current is None
+
+    assert [(r["phase"], r["state"]) for r in records] == [
+        ("collection-status", "start"), ("sync_archive", "start"),
+        ("sync_archive", "end"), ("collection-status", "end")]
+    assert set(records[-1]["phases"]) == {"collection-status",
+                                          "sync_archive"}
+    assert all(r["action"] == "inc" for r in records)
+
+
+def test_volume_writer(monitor, records):
+    def writer(block_iter, filename):
+        return sum(len(block.data) for block in block_iter)
+
+    timed = monitor.wrap_writer(writer)
+    assert timed(iter([Block(b"x" * 10), Block(b"y" * 5)]), "vol1") == 15
+
+    summary = monitor.record("summary")
+    assert summary["bytes_read"] == 15
+    assert summary["volumes"] == 1
+    assert {"scan", "volume write"} <= set(summary["phases"])
+    # Every volume forces a progress record
+    assert records[-1]["kind"] == "progress"
+
+
+def test_backend_transfers(monitor, tmp_path):
+    backend = Backend()
+    monitor.wrap_backend(backend)
+
+    source = tmp_path / "vol1"
+    source.write_bytes(b"z" * 100)
+    backend.put(path.Path(str(source)), "vol1")
+    backend.get("vol1", path.Path(str(tmp_path / "copy")))
+
+    rec = monitor.record("progress")
+    assert rec["bytes_uploaded"] == 100
+    assert rec["bytes_downloaded"] == 100
+    assert {"upload", "download"} <= set(rec["phases"])
+
+
+def test_reports_are_throttled(monitor, records):
+    monitor.interval = 3600
+    for i in range(5):
+        monitor.report()
+    monitor.report(force=True)
+    assert [r["kind"] for r in records] == ["progress", "progress"]
+
+
+def test_install_restores_writers(monitor, records):
+    saved = [getattr(gpg, name) for name in monitor.writers]
+    with monitor.installed():
+        assert [getattr(gpg, name) for name in monitor.writers] != saved
+    assert [getattr(gpg, name) for name in monitor.writers] == saved
+    assert records[-1]["kind"] == "summary"
+
+
+def test_format(monitor):
+    monitor.add("bytes_uploaded", 3 * 1024 * 1024)
+    monitor.add_time("upload", 2.0)
+    line = format_record(monitor.record("summary"))
+    assert line.startswith("inc: -, 0 files")
+    assert "3.0 MB up (1.5 MB/s)" in line
+    assert line.split("\n")[1] == "upload 2.0s"
+
+    assert format_bytes(512) == "512.0 B"
+    assert format_bytes(2048) == "2.0 KB"
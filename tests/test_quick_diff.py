@@ -0,0 +1,94 @@
+"""Metadata comparison of snapshots with the Source"""
+import os
+
+import pytest
+
+pytest.importorskip("duplicity")
+
+from kyrian.quick_diff import compare_listings, quick_diff, walk_source
+
+
+def listing_of(root):
+    return [(path_s, ftype, mtime, 0, mode)
+            for path_s, ftype, mtime, mode in walk_source(root)]
+
+
+def retarget(root, name, target):
+    link = os.path.join(root, name)
+    mtime = os.lstat(link).st_mtime
+    os.remove(link)
+    os.symlink(target, link)
+    os.utime(link, (mtime + 10, mtime + 10), follow_symlinks=False)
+
+
+def test_unchanged(source):
+    assert quick_diff(listing_of(source), source) == {}
+
+
+def test_changed_added_removed(source):
+    listing = listing_of(source)
+
+    os.utime(os.path.join(source, "f1.txt"), (1, 1))
+    os.remove(os.path.join(source, "f2.txt"))
+    open(os.path.join(source, "sub", "new.txt"), "w").close()
+
+    assert quick_diff(listing, source) == {
+        "f1.txt": "reg",
+        "f2.txt": "reg",
+        "sub/new.txt": "reg",
+        }
+
+
+def test_retargeted_link(source):
+    listing = listing_of(source)
+    retarget(source, "link", "f2.txt")
+
+    assert quick_diff(listing, source) == {"link": "sym"}
+
+    added, removed, changed = compare_listings(listing, listing_of(source))
+    assert (added, removed, changed) == ([], [], ["link"])
+
+
+def test_get_diff_finds_retargeted_link(handler, source):
+    handler.make_backup()
+    chains = handler.get_chains(refresh=True)
+    assert handler.get_diff(time=max(chains)) == {}
+
+    retarget(source, "link", "f2.txt")
+    assert handler.get_diff(time=max(chains)) == {"link": "sym"}
+
+
+def test_compare_listings():
+    old = [
+        ("a", "dir", 10, None, 0o755),
+        ("a/same.txt", "reg", 10, 100, 0o644),
+        ("a/touched.txt", "reg", 10, 100, 0o644),
+        ("a/grown.txt", "reg", 10, 100, 0o644),
+        ("a/chmod.txt", "reg", 10, 100, 0o644),
+        ("gone.txt", "reg", 10, 100, 0o644),
+        ("kind", "reg", 10, 100, 0o644),
+        ("neg.txt", "reg", -5, 100, 0o644),
+        ]
+    new = [
+        ("a", "dir", 10, None, 0o755),
+        ("a/same.txt", "reg", 10, 100, 0o644),
+        ("a/touched.txt", "reg", 20, 100, 0o644),
+        ("a/grown.txt", "reg", 10, 120, 0o644),
+        ("a/chmod.txt", "reg", 10, 100, 0o600),
+        ("a/new.txt", "reg", 20, 1, 0o644),
+        ("kind", "dir", 10, None, 0o644),
+        ("neg.txt", "reg", 0, 100, 0o644),
+        ]
+
+    added, removed, changed = compare_listings(old, new)
+    assert added == ["a/new.txt"]
+    assert removed == ["gone.txt"]
+    assert changed == ["a/touched.txt", "a/grown.txt", "a/chmod.txt",
+                       "kind"]
+
+
+def test_compare_listings_ignores_size_of_directories():
+    old = [("d", "dir", 10, 4096, 0o755)]
+    new = [("d", "dir", 10, 8192, 0o755)]
+    assert compare_listings(old, new) == ([], [], [])
+    assert compare_listings(old, []) == ([], ["d"], [])
@@ -0,0 +1,54 @@
+"""Restores of single and several paths"""
+import os
+
+import pytest
+
+pytest.importorskip("duplicity")
+
+
+def read(*parts):
+    with open(os.path.join(*parts)) as f:
+        return f.read()
+
+
+@pytest.fixture
+def snapshot(handler):
+    handler.make_backup()
+    return max(handler.get_chains(refresh=True))
+
+
+def test_recover_file(handler, snapshot, tmp_path):
+    dest = str(tmp_path / "restored.txt")
+    handler.recover_files(dest, file="sub/d.txt", time=snapshot)
+
+    assert read(dest) == "nested\n"
+
+
+def test_recover_many(handler, snapshot, tmp_path):
+    dest = tmp_path / "restore"
+    handler.recover_many(str(dest), ["f1.txt", "sub/d.txt"], time=snapshot)
+
+    assert read(dest, "f1.txt") == "one\n"
+    assert read(dest, "sub", "d.txt") == "nested\n"
+    assert not (dest / "f2.txt").exists()
+
+
+def test_recover_many_directory(handler, snapshot, tmp_path):
+    dest = tmp_path / "restore"
+    handler.recover_many(str(dest), ["sub", "link"], time=snapshot)
+
+    assert read(dest, "sub", "d.txt") == "nested\n"
+    assert os.readlink(dest / "link") == "f1.txt"
+
+
+def test_recover_many_keeps_existing(handler, snapshot, tmp_path):
+    dest = tmp_path / "restore"
+    dest.mkdir()
+    (dest / "f1.txt").write_text("local\n")
+
+    handler.recover_many(str(dest), ["f1.txt", "f2.txt"], time=snapshot)
+    assert read(dest, "f1.txt") == "local\n"
+    assert read(dest, "f2.txt") == "two\n"
+
+    handler.recover_many(str(dest), ["f1.txt"], time=snapshot, force=True)
+    assert read(dest, "f1.txt") == "one\n"
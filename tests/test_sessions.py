@@ -0,0 +1,71 @@
+"""Pool of the backends of a session process"""
+import pytest
+
+pytest.importorskip("duplicity")
+
+from kyrian.sessions import BackendSessions
+
+
+URL = "sftp://host/backup"
+
+
+class Backend():
+    """Backend that counts its close calls"""
+
+    def __init__(self, url):
+        self.url = url
+        self.closed = 0
+
+    def close(self):
+        self.closed += 1
+
+
+@pytest.fixture
+def sessions():
+    sessions = BackendSessions(idle_timeout=60)
+    sessions.create_backend = Backend
+    yield sessions
+    sessions.close()
+
+
+def test_checkin_reuses_backend(sessions):
+    be = sessions.checkout(URL)
+    be.hook = "installed by the action"
+    sessions.checkin(be)
+
+    assert sessions.checkout(URL) is be
+    assert not hasattr(be, "hook")
+    assert be.closed == 0
+
+
+def test_discard_closes_backend(sessions):
+    be = sessions.checkout(URL)
+    sessions.discard(be)
+
+    assert be.closed == 1
+    assert sessions.busy == {}
+    assert sessions.checkout(URL) is not be
+
+    # Checking in a discarded backend does not pool it
+    sessions.checkin(be)
+    sessions.discard(be)
+    assert be.closed == 1
+
+
+def test_handler_discards_failed_backend(cfg_dir, monkeypatch):
+    from duplicity import backend, config
+    from kyrian.actionHandler import actionHandler
+
+    # The pool creates its backends with get_backend of duplicity
+    monkeypatch.setattr(backend, "get_backend", Backend)
+
+    local = actionHandler(cfg_dir, isolate=False)
+    local.backend_sessions = BackendSessions()
+
+    with local.reusing_backend():
+        be = backend.get_backend(URL)
+    monkeypatch.setattr(config, "backend", be)
+
+    local.discard_backend()
+    assert be.closed == 1
+    assert local.backend_sessions.idle == {}
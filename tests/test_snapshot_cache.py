@@ -0,0 +1,35 @@
+"""Memory bounded cache of snapshot trees"""
+from kyrian.listing import CompactListing
+from kyrian.snapshot_cache import SnapshotCache
+
+
+def listing(n):
+    return CompactListing.from_records(
+        ("f%d" % i, "reg", 1, 1, 0o644) for i in range(n))
+
+
+def test_counters_and_eviction():
+    one = listing(10)
+    cache = SnapshotCache(2 * one.nbytes() + 1)
+
+    assert cache.get(1) is None
+    cache.put(1, None, one, None, False)
+    cache.put(2, None, listing(10), None, False)
+    assert cache.get(1).files_l is one
+
+    # 2 is the least recently used entry
+    cache.put(3, None, listing(10), None, False)
+    assert cache.get(2) is None
+    assert sorted(cache.entries) == [1, 3]
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["bytes"] == cache.size <= cache.max_bytes
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 2, 1)
+
+
+def test_newest_entry_stays():
+    cache = SnapshotCache(1)
+    cache.put(1, None, listing(10), None, False)
+    cache.put(2, None, listing(10), None, False)
+    assert list(cache.entries) == [2]
@@ -0,0 +1,159 @@
+"""Listings and search events of the local SQLite index"""
+import os
+import sys
+import threading
+
+import pytest
+
+from kyrian.snapshot_index import SnapshotIndex
+
+
+TARGET = "file:///target"
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SnapshotIndex(str(tmp_path / "index.sqlite"))
+    yield index
+    index.close()
+
+
+def sig_events():
+    # Full backup at 100, incremental at 200
+    yield (100, 100, None, None, None, None, None)
+    yield (100, 100, "a.txt", "reg", 10, 1, 0o644)
+    yield (100, 100, "b.txt", "reg", 10, 1, 0o644)
+    yield (100, 200, None, None, None, None, None)
+    yield (100, 200, "a.txt", "reg", 150, 2, 0o644)
+    yield (100, 200, "b.txt", None, None, None, None)
+
+
+def test_listing(index):
+    files = [("a.txt", "reg", 10, 1, 0o644), ("d", "dir", 10, 0, 0o755)]
+    assert index.get_listing(TARGET, 100) is None
+
+    index.add_listing(TARGET, 100, files)
+    assert sorted(index.get_listing(TARGET, 100)) == sorted(files)
+
+
+def test_search_and_history(index):
+    index.add_events(TARGET, sig_events())
+
+    assert index.get_indexed_sigs(TARGET) == {100: 200}
+    assert index.search(TARGET, "a.txt") == [("a.txt", [100, 200])]
+    assert index.search(TARGET, "b.t") == [("b.txt", [100])]
+
+    assert index.history(TARGET, "a.txt") == [
+        (100, "reg", 10, 1, 0o644, True),
+        (200, "reg", 150, 2, 0o644, True),
+        ]
+
+
+def test_interrupted_events(index):
+    def broken():
+        for event in list(sig_events())[:5]:
+            yield event
+        raise RuntimeError("connection lost")
+
+    with pytest.raises(RuntimeError):
+        index.add_events(TARGET, broken())
+
+    # The second signature file is read again
+    assert index.get_indexed_sigs(TARGET) == {100: 100}
+    assert index.history(TARGET, "a.txt") == [
+        (100, "reg", 10, 1, 0o644, True)]
+
+    index.add_events(TARGET, (i for i in sig_events() if i[1] == 200))
+    assert index.search(TARGET, "a.txt") == [("a.txt", [100, 200])]
+
+
+def test_readers_during_add_events(index):
+    read = []
+
+    def events():
+        for event in sig_events():
+            # The index stays readable while the events are read
+            thread = threading.Thread(
+                        target=lambda: read.append(
+                                    index.get_indexed_sigs(TARGET)))
+            thread.start()
+            thread.join(timeout=5)
+            assert not thread.is_alive()
+            yield event
+
+    index.add_events(TARGET, events())
+    assert len(read) == 6
+
+
+def test_search_index_in_process(cfg_dir, handler, monkeypatch):
+    pytest.importorskip("duplicity")
+
+    handler.make_backup()
+
+    # gpg gets the standard input of the process
+    with open(os.devnull) as devnull:
+        monkeypatch.setattr(sys, "stdin", devnull)
+        search_in_process(cfg_dir)
+
+
+def search_in_process(cfg_dir):
+    from kyrian.actionHandler import actionHandler
+
+    local = actionHandler(cfg_dir, isolate=False)
+    thread = threading.Thread(target=local.update_search_index, daemon=True)
+    thread.start()
+    thread.join(timeout=120)
+    assert not thread.is_alive()
+
+    target = local.get_target()
+    assert [i[0] for i in local.index.search(target, "d.txt")] == [
+        "sub/d.txt"]
+
+
+def test_sync(index):
+    assert index.get_sync(TARGET) is None
+
+    index.set_sync(TARGET, 10.0, [b"a.sigtar.gz", b"b.manifest"], "local")
+    assert index.get_sync(TARGET) == {
+        "time": 10.0,
+        "remote": [b"a.sigtar.gz", b"b.manifest"],
+        "local": "local"
+        }
+
+    index.clear_sync(TARGET)
+    assert index.get_sync(TARGET) is None
+
+
+def test_sync_from_another_process(index):
+    # Job processes open their own connection
+    other = SnapshotIndex(index.db_path)
+    try:
+        # A reader does not block the writer
+        with index.lock:
+            index.con.execute("BEGIN")
+            index.con.execute("SELECT * FROM syncs").fetchall()
+            other.set_sync(TARGET, 10.0, [], "local")
+            index.con.execute("COMMIT")
+    finally:
+        other.close()
+
+    assert index.get_sync(TARGET)["time"] == 10.0
+
+
+def test_actions_without_sync_state(cfg_dir, monkeypatch):
+    pytest.importorskip("duplicity")
+    import sqlite3
+    from kyrian.actionHandler import actionHandler
+
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    local = actionHandler(cfg_dir, isolate=False)
+    for name in ["get_sync", "set_sync", "clear_sync"]:
+        monkeypatch.setattr(local.index, name, locked)
+
+    with open(os.devnull) as devnull:
+        monkeypatch.setattr(sys, "stdin", devnull)
+        assert local.make_backup()
+        time = max(local.get_chains(refresh=True))
+        assert "sub/d.txt" in {i[0] for i in local.get_files(time=time)}
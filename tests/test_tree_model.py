@@ -0,0 +1,135 @@
+"""Path table and lazy item model of the snapshot tree"""
+import os
+
+import pytest
+
+pytest.importorskip("PyQt6")
+pytest.importorskip("duplicity")
+
+from PyQt6 import QtCore, QtWidgets
+from PyQt6.QtCore import Qt
+
+from kyrian.listing import CompactListing
+from kyrian.tree_model import PathTable, SnapshotTreeModel
+
+
+RECORDS = [
+    ("a", "dir", 10, None, 0o755),
+    ("a/b", "dir", 11, None, 0o755),
+    ("a/b/f.txt", "reg", 12, 100, 0o644),
+    ("a/g.txt", "reg", 13, 0, 0o600),
+    ("c.txt", "reg", 14, 5, 0o644),
+    ("d", "dir", 15, None, 0o755),
+    ("e.txt", "reg", 16, 5, 0o644),
+    ]
+
+
+@pytest.fixture(scope="module")
+def app():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+@pytest.fixture
+def table():
+    return PathTable(CompactListing.from_records(RECORDS))
+
+
+def test_children(table):
+    assert list(table.children(-1)) == [0, 4, 5, 6]
+    assert list(table.children(0)) == [1, 3]
+    assert list(table.children(1)) == [2]
+
+    assert table.has_children(-1)
+    assert table.has_children(0)
+    assert not table.has_children(5)
+    assert not table.has_children(4)
+
+
+def test_find(table):
+    assert table.find("a/b/f.txt") == 2
+    assert table.path(table.find("d")) == "d"
+    assert table.find("a/missing") is None
+
+
+def fetch_all(model, parent=QtCore.QModelIndex()):
+    while model.canFetchMore(parent):
+        model.fetchMore(parent)
+
+
+def names(model, parent=QtCore.QModelIndex()):
+    return [model.data(model.index(i, 0, parent))
+            for i in range(model.rowCount(parent))]
+
+
+def test_model_fetches_lazily(app, table):
+    model = SnapshotTreeModel(table)
+    model.fetch_batch = 3
+
+    # Nothing is created before the view asks for it
+    assert model.rowCount() == 0
+    assert model.canFetchMore(QtCore.QModelIndex())
+
+    model.fetchMore(QtCore.QModelIndex())
+    assert names(model) == ["a", "c.txt", "d"]
+    model.fetchMore(QtCore.QModelIndex())
+    assert names(model) == ["a", "c.txt", "d", "e.txt"]
+    assert not model.canFetchMore(QtCore.QModelIndex())
+
+    # Children of a directory only after it was expanded
+    a = model.index(0, 0)
+    assert model.hasChildren(a)
+    assert model.rowCount(a) == 0
+    fetch_all(model, a)
+    assert names(model, a) == ["b", "g.txt"]
+    assert model.fetched.keys() == {-1, 0}
+
+    # Empty directories have no children to fetch
+    d = model.index(2, 0)
+    assert not model.hasChildren(d)
+    assert not model.canFetchMore(d)
+
+
+def test_model_parent_and_data(app, table):
+    model = SnapshotTreeModel(table)
+    fetch_all(model)
+    a = model.index(0, 0)
+    fetch_all(model, a)
+    b = model.index(0, 0, a)
+    fetch_all(model, b)
+    f = model.index(0, 0, b)
+
+    assert model.parent(f) == b
+    assert model.parent(b) == a
+    assert not model.parent(a).isValid()
+
+    assert model.data(f, Qt.ItemDataRole.UserRole) == "a/b/f.txt"
+    assert model.data(model.index(0, 1, b),
+                      Qt.ItemDataRole.UserRole) == "reg"
+    assert model.data(f, Qt.ItemDataRole.DecorationRole) is not None
+
+
+def test_highlight_paths(table):
+    table.highlight_paths(["a/b/f.txt", "e.txt"])
+    assert table.highlighted == {0, 1, 2, 6}
+
+    # Paths missing from the snapshot highlight their deepest ancestor
+    table.highlight_paths(["a/b/new/deeper.txt", "gone/x"])
+    assert table.highlighted == {0, 1, 2, 6}
+
+    table.highlight_paths(["d/new.txt"])
+    assert table.highlighted == {0, 1, 2, 5, 6}
+
+    table.clear_highlights()
+    assert table.highlighted == set()
+    assert table.diffs_applied is False
+
+
+def test_highlight_in_model(app, table):
+    table.highlight_paths(["a/g.txt"])
+    model = SnapshotTreeModel(table)
+    fetch_all(model)
+
+    role = Qt.ItemDataRole.ForegroundRole
+    assert model.data(model.index(0, 0), role) is not None
+    assert model.data(model.index(1, 0), role) is None
@@ -0,0 +1,38 @@
+"""Deep verify with serial and parallel reads of the Source"""
+import os
+
+import pytest
+
+pytest.importorskip("duplicity")
+
+from conftest import profile_cfg
+
+
+def change_content(source):
+    # Same size and mtime, only the contents differ
+    f1 = os.path.join(source, "f1.txt")
+    stat = os.stat(f1)
+    with open(f1, "w") as f:
+        f.write("ONE\n")
+    os.utime(f1, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def change_metadata(source):
+    os.chmod(os.path.join(source, "f2.txt"), 0o600)
+
+
+@pytest.mark.parametrize("change, expected", [
+    (change_content, {"f1.txt": "reg"}),
+    (change_metadata, {"f2.txt": "reg"}),
+    ])
+def test_serial_and_parallel_verify(handler, source, change, expected):
+    handler.make_backup()
+    snapshot = max(handler.get_chains(refresh=True))
+    change(source)
+
+    results = []
+    for workers in [1, 4]:
+        profile_cfg(handler)["verify-workers"] = workers
+        results.append(handler.get_diff(time=snapshot, deep=True))
+
+    assert results[0] == results[1] == expected
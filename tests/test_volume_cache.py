@@ -0,0 +1,92 @@
+"""LRU cache of downloaded volumes"""
+import os
+
+import pytest
+
+pytest.importorskip("duplicity")
+
+from duplicity import path
+
+from kyrian.volume_cache import VolumeCache, parse_size
+
+
+TARGET = "sftp://host/backup"
+
+
+class Backend():
+    """Backend that serves volumes from a dict"""
+
+    def __init__(self, volumes):
+        self.volumes = volumes
+        self.downloads = []
+
+    def get(self, remote_filename, local_path):
+        self.downloads.append(remote_filename)
+        with open(local_path.name, "wb") as f:
+            f.write(self.volumes[remote_filename])
+
+
+@pytest.fixture
+def backend():
+    return Backend({b"vol1": b"a" * 100, b"vol2": b"b" * 100,
+                    b"vol3": b"c" * 100})
+
+
+def download(be, tmp_path, filename):
+    local_path = path.Path(os.fsencode(tmp_path / "download"))
+    be.get(filename, local_path)
+    with open(local_path.name, "rb") as f:
+        return f.read()
+
+
+def test_parse_size():
+    assert parse_size(1000) == 1000
+    assert parse_size("2K") == 2048
+    assert parse_size("1.5M") == 1536 * 1024
+    assert parse_size("1GB") == 1024 ** 3
+
+
+def test_hit(backend, tmp_path):
+    cache = VolumeCache(str(tmp_path / "cache"), TARGET, 1000)
+    with cache.installed(backend):
+        assert download(backend, tmp_path, b"vol1") == b"a" * 100
+        assert download(backend, tmp_path, b"vol1") == b"a" * 100
+
+    assert backend.downloads == [b"vol1"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used(backend, tmp_path):
+    cache = VolumeCache(str(tmp_path / "cache"), TARGET, 250)
+    with cache.installed(backend):
+        download(backend, tmp_path, b"vol1")
+        download(backend, tmp_path, b"vol2")
+        os.utime(cache.path(b"vol1"), (1, 1))
+        os.utime(cache.path(b"vol2"), (2, 2))
+
+        download(backend, tmp_path, b"vol3")
+
+    assert not cache.contains(b"vol1")
+    assert cache.contains(b"vol2")
+    assert cache.contains(b"vol3")
+
+
+def test_unwritable_cache(backend, tmp_path):
+    # The cache directory can not be created
+    (tmp_path / "cache").write_text("")
+    cache = VolumeCache(str(tmp_path / "cache"), TARGET, 1000)
+
+    with cache.installed(backend):
+        assert download(backend, tmp_path, b"vol1") == b"a" * 100
+
+    assert not cache.contains(b"vol1")
+
+
+def test_unreadable_cache(backend, tmp_path):
+    cache = VolumeCache(str(tmp_path / "cache"), TARGET, 1000)
+    os.makedirs(cache.path(b"vol1"))
+
+    with cache.installed(backend):
+        assert download(backend, tmp_path, b"vol1") == b"a" * 100
+
+    assert backend.downloads == [b"vol1"]
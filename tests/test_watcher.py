@@ -0,0 +1,82 @@
+"""Paths the inotify watcher records"""
+import os
+import sys
+import time
+
+import pytest
+
+if not sys.platform.startswith("linux"):
+    pytest.skip("inotify is only available on Linux",
+                allow_module_level=True)
+
+from kyrian.watcher import IN_Q_OVERFLOW, Inotify, Watcher
+
+
+class Journal():
+    """Records the calls of the watcher"""
+
+    def __init__(self):
+        self.restarts = []
+
+    def restart_watch(self, profile, since):
+        self.restarts.append(since)
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    source = tmp_path / "source"
+    (source / "dir" / "inner").mkdir(parents=True)
+    (source / "old.txt").write_text("old\n")
+
+    watcher = Watcher(str(source), Journal(), "Test")
+    watcher.inotify = Inotify()
+    watcher.watch_tree(b"")
+    yield watcher
+    watcher.inotify.close()
+
+
+def handle_events(watcher):
+    # Events are queued right after the system calls
+    time.sleep(0.1)
+    for wd, mask, cookie, name in watcher.inotify.read_events():
+        watcher.handle(wd, mask, name)
+    return watcher.pending
+
+
+def test_create_and_delete(watcher):
+    source = watcher.source
+    with open(os.path.join(source, "new.txt"), "w") as f:
+        f.write("new\n")
+    os.remove(os.path.join(source, "old.txt"))
+
+    assert handle_events(watcher) == {
+        b"": False, b"new.txt": False, b"old.txt": False}
+
+
+def test_directory_move(watcher):
+    source = watcher.source
+    os.rename(os.path.join(source, "dir"), os.path.join(source, "moved"))
+
+    assert handle_events(watcher) == {
+        b"": False, b"dir": True, b"moved": True}
+
+    # The moved tree is watched under its new path
+    watcher.pending.clear()
+    with open(os.path.join(source, "moved", "inner", "f.txt"), "w") as f:
+        f.write("f\n")
+    assert handle_events(watcher) == {
+        b"moved/inner": False, b"moved/inner/f.txt": False}
+    assert b"dir" not in watcher.wds
+
+
+def test_new_directory(watcher):
+    source = watcher.source
+    os.mkdir(os.path.join(source, "new"))
+    assert handle_events(watcher) == {b"": False, b"new": True}
+    assert b"new" in watcher.wds
+
+
+def test_overflow_restarts_journal(watcher):
+    before = time.time()
+    watcher.handle(-1, IN_Q_OVERFLOW, b"")
+    assert watcher.journal.restarts and watcher.journal.restarts[0] >= before
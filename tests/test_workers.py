@@ -0,0 +1,53 @@
+"""Errors of the worker threads"""
+import pytest
+
+pytest.importorskip("PyQt6")
+pytest.importorskip("duplicity")
+
+from kyrian.engine import JobCancelled
+from kyrian.workers import ChainsWorker, TreeWorker
+
+
+class Handler():
+    """Handler whose calls raise an exception"""
+
+    current_profile = "Test"
+
+    def __init__(self, error):
+        self.error = error
+
+    def get_chains(self, refresh=False):
+        raise self.error
+
+    def get_listing(self, time=None):
+        raise self.error
+
+
+def run(worker, ready):
+    """Run a worker in this thread, return its failures and the number
+    of ready signals"""
+    failures = []
+    readies = []
+    worker.failed.connect(failures.append)
+    ready(worker).connect(lambda: readies.append(True))
+    worker.run()
+    return failures, len(readies)
+
+
+@pytest.mark.parametrize("error", [RuntimeError("broken"),
+                                   KeyError("missing")])
+def test_failure_is_reported(error):
+    worker = ChainsWorker(Handler(error))
+    failures, readies = run(worker, lambda w: w.chainsReady)
+    assert failures == [str(error)]
+    assert readies == 1
+    assert worker.result is None
+
+
+def test_cancelled_is_silent():
+    worker = TreeWorker(Handler(JobCancelled("cancelled")))
+    worker.time = 1
+    failures, readies = run(worker, lambda w: w.treeReady)
+    assert failures == []
+    assert readies == 1
+    assert worker.table is None